@@ -0,0 +1,217 @@
+"""Replay a message corpus through check_automod and report its throughput.
+
+Run from the repository root:
+
+    python benchmarks/bench_automod.py [--messages 100000] [--words 2000]
+    python benchmarks/bench_automod.py --corpus recorded.jsonl
+
+A recorded corpus is either plain text with one message per line or JSONL
+with a "content" field (and optionally "author_id" and "channel_id").
+Messages run against stub guild, channel and author objects, and
+delete_message_and_punish is replaced with a counter, so only the rule
+evaluation is timed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+GUILD_ID = 1
+
+CHAT = (
+    "hey hello gg lol this is just a normal chat message about the game tonight "
+    "who wants to play later ok sure nice LMAO what did you do yesterday anyone "
+    "here watched the new episode it was honestly pretty good i think"
+).split()
+SPAM = [
+    "FREE NITRO discord.gg/{n} claim now!!!",
+    "check out https://scam-{n}.example.com/login?ref={n} for free stuff",
+    "<:pepe:1234> <:pepe:1234> <:pepe:1234> <:pepe:1234> <:pepe:1234> <:pepe:1234> "
+    "<:pepe:1234> <:pepe:1234> <:pepe:1234> <:pepe:1234> <:pepe:1234> <:pepe:1234>",
+    "join my server for free nitro giveaway click now fast {n}",
+    "\U0001F602" * 15,
+]
+
+
+class StubGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f"Guild {guild_id}"
+
+
+class StubChannel:
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.guild = guild
+        self.mention = f"<#{channel_id}>"
+
+
+class StubAuthor:
+    def __init__(self, author_id):
+        self.id = author_id
+        self.bot = False
+
+
+class StubMessage:
+    def __init__(self, content, guild, channel, author):
+        self.content = content
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.mentions = []
+        self.role_mentions = []
+
+
+def synthetic_contents(count, filter_words, seed=42):
+    rng = random.Random(seed)
+    for n in range(count):
+        roll = rng.random()
+        if roll < 0.05:
+            yield rng.choice(SPAM).format(n=n)
+        elif roll < 0.07 and filter_words:
+            words = [rng.choice(CHAT) for _ in range(rng.randint(3, 15))]
+            words.insert(rng.randrange(len(words) + 1), rng.choice(filter_words))
+            yield ' '.join(words)
+        else:
+            yield ' '.join(rng.choice(CHAT) for _ in range(rng.randint(1, 30)))
+
+
+def load_corpus(path):
+    """Read (content, author_id, channel_id) rows from a recorded corpus"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            if line.startswith('{'):
+                record = json.loads(line)
+                yield record['content'], record.get('author_id'), record.get('channel_id')
+            else:
+                yield line, None, None
+
+
+def build_messages(args, filter_words):
+    rng = random.Random(7)
+    guild = StubGuild(GUILD_ID)
+    channels = {}
+    authors = {}
+
+    if args.corpus:
+        rows = load_corpus(args.corpus)
+    else:
+        rows = ((content, None, None) for content in synthetic_contents(args.messages, filter_words))
+
+    messages = []
+    for content, author_id, channel_id in rows:
+        author_id = author_id or rng.randint(1, args.authors)
+        channel_id = channel_id or rng.randint(1, args.channels)
+        if channel_id not in channels:
+            channels[channel_id] = StubChannel(channel_id, guild)
+        if author_id not in authors:
+            authors[author_id] = StubAuthor(author_id)
+        messages.append(StubMessage(content, guild, channels[channel_id], authors[author_id]))
+    return messages
+
+
+def configure_guild(args, filter_words):
+    config = carlbot.load_automod_config(GUILD_ID)
+    config['enabled'] = True
+    config['filter_words'] = list(filter_words)
+    config['filter_links'] = True
+    config['filter_invites'] = True
+    config['max_emojis'] = 10
+    config['anti_spam'] = not args.no_spam
+    config['anti_duplicates'] = not args.no_duplicates
+    return carlbot.rebuild_automod_plan(GUILD_ID)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+async def replay(messages):
+    """Time check_automod end to end for every message"""
+    flagged = 0
+
+    async def count_violation(message, violations, punishment):
+        nonlocal flagged
+        flagged += 1
+
+    original = carlbot.delete_message_and_punish
+    carlbot.delete_message_and_punish = count_violation
+    latencies = []
+    try:
+        start = time.perf_counter()
+        for message in messages:
+            before = time.perf_counter_ns()
+            await carlbot.check_automod(message)
+            latencies.append(time.perf_counter_ns() - before)
+        elapsed = time.perf_counter() - start
+    finally:
+        carlbot.delete_message_and_punish = original
+    return elapsed, latencies, flagged
+
+
+def rule_costs(messages, plan):
+    """Total time spent in the scan and in each compiled check"""
+    costs = {'scan': 0}
+    costs.update((name, 0) for name, _ in plan.checks)
+    for message in messages:
+        scan = None
+        if plan.needs_scan:
+            before = time.perf_counter_ns()
+            scan = carlbot.scan_message(message.content)
+            costs['scan'] += time.perf_counter_ns() - before
+        violations = []
+        for name, check in plan.checks:
+            before = time.perf_counter_ns()
+            check(message, scan, violations)
+            costs[name] += time.perf_counter_ns() - before
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', help="recorded corpus (text or JSONL); synthetic if omitted")
+    parser.add_argument('--messages', type=int, default=100000, help="synthetic corpus size")
+    parser.add_argument('--words', type=int, default=2000, help="filtered words in the guild")
+    parser.add_argument('--authors', type=int, default=5000)
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--no-spam', action='store_true', help="disable the message rate rule")
+    parser.add_argument('--no-duplicates', action='store_true', help="disable the near-duplicate rule")
+    args = parser.parse_args()
+
+    rng = random.Random(99)
+    filter_words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 10)))
+                    for _ in range(args.words)]
+    messages = build_messages(args, filter_words)
+    plan = configure_guild(args, filter_words)
+
+    elapsed, latencies, flagged = asyncio.run(replay(messages))
+    latencies.sort()
+    print(f"messages:   {len(messages):,} ({flagged:,} flagged)")
+    print(f"rules:      {', '.join(name for name, _ in plan.checks)}")
+    print(f"throughput: {len(messages) / elapsed:,.0f} msg/s")
+    print(f"latency:    p50 {percentile(latencies, 0.50) / 1000:.1f} us, "
+          f"p99 {percentile(latencies, 0.99) / 1000:.1f} us, "
+          f"max {latencies[-1] / 1000:.1f} us")
+
+    # Rule state (spam rings, duplicate history) carries over from the replay,
+    # which is fine for measuring cost
+    costs = rule_costs(messages, plan)
+    total = sum(costs.values()) or 1
+    print("\nper-rule cost:")
+    for name, cost in sorted(costs.items(), key=lambda item: item[1], reverse=True):
+        print(f"  {name:<12} {cost / len(messages) / 1000:>8.2f} us/msg  {cost / total:>6.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Compare the memory held by the old dict state shapes and the slotted records.
+
+Run from the repository root:
+
+    python benchmarks/bench_records.py [--records 1000000]
+
+Each shape is built --records times with tracemalloc running, and the
+result is reported as MiB per million records. The values mirror what the
+bot stores: small ints for XP, snowflake ids, a short reason string per
+warning and timestamps (ISO strings before, epoch ints after).
+"""
+import argparse
+import datetime
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+GUILD_ID = 1046520000000000000
+MODERATOR_ID = 1046520000000000001
+REASON = "No reason provided"
+
+
+def legacy_guild_config(n):
+    return {
+        'prefix': '!',
+        'log_channel': GUILD_ID + n,
+        'mute_role': None,
+        'welcome_channel': None,
+        'welcome_message': None,
+        'leave_channel': None,
+        'leave_message': None,
+        'autoroles': []
+    }
+
+
+def record_guild_config(n):
+    config = carlbot.GuildConfig()
+    config.log_channel = GUILD_ID + n
+    return config
+
+
+def legacy_warning(n):
+    return {
+        'guild_id': GUILD_ID,
+        'reason': REASON,
+        'moderator': MODERATOR_ID,
+        'timestamp': datetime.datetime.fromtimestamp(1700000000 + n).isoformat()
+    }
+
+
+def record_warning(n):
+    return carlbot.WarningRecord(REASON, MODERATOR_ID, 1700000000 + n)
+
+
+def legacy_xp(n):
+    return {'xp': n % 500, 'level': n % 50 + 1}
+
+
+def record_xp(n):
+    return carlbot.XPRecord(n % 500, n % 50 + 1)
+
+
+def legacy_economy(n):
+    return {
+        'coins': 100 + n,
+        'bank': n,
+        'last_daily': datetime.datetime.fromtimestamp(1700000000 + n).isoformat(),
+        'last_work': None
+    }
+
+
+def record_economy(n):
+    return carlbot.EconomyRecord(100 + n, n, 1700000000 + n)
+
+
+SHAPES = [
+    ("guild config", legacy_guild_config, record_guild_config),
+    ("warning", legacy_warning, record_warning),
+    ("xp", legacy_xp, record_xp),
+    ("economy", legacy_economy, record_economy),
+]
+
+
+def measure(factory, count):
+    """Bytes still allocated after building count entries"""
+    gc.collect()
+    tracemalloc.start()
+    entries = [factory(n) for n in range(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del entries
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000000)
+    args = parser.parse_args()
+
+    scale = 1000000 / args.records / (1024 * 1024)
+    print(f"{'shape':<14} {'dict':>12} {'record':>12} {'saved':>8}   (MiB per million)")
+    for label, legacy, record in SHAPES:
+        start = time.perf_counter()
+        before = measure(legacy, args.records) * scale
+        after = measure(record, args.records) * scale
+        print(f"{label:<14} {before:>12.1f} {after:>12.1f} {1 - after / before:>8.0%}   "
+              f"{time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Compare the single-pass message scanner against the old per-rule regexes.
+
+Run from the repository root:
+
+    python benchmarks/bench_scanner.py [--messages 50000] [--words 20] [--repeat 5]
+
+Both approaches are timed over the same corpus, with no filtered words and
+with --words of them, and the best of --repeat runs is shown. A separate,
+instrumented replay counts the scans each approach starts on the automod
+patterns per message; string methods (lower, count, in) and the filtered
+word checks are not counted for either side.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+LEGACY_INVITE_PATTERN = re.compile(r'discord\.gg/\w+|discordapp\.com/invite/\w+', re.IGNORECASE)
+LEGACY_URL_PATTERN = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+LEGACY_EMOJI_PATTERN = re.compile(r'<:\w*:\d*>')
+
+WORDS = (
+    "hey hello gg lol this is just a normal chat message about the game "
+    "tonight who wants to play later ok sure nice LMAO what did you do"
+).split()
+EXTRAS = [
+    "https://example.com/page?id=1", "discord.gg/freenitro", "<:pog:123456789>",
+    "\U0001F602", "\n", "HTTPS://Discord.gg/Raid", "<a:dance:987654321>",
+    "\U0001F44D\U0001F3FD", "\U0001F1FA\U0001F1F8",
+]
+
+
+class CountingPattern:
+    """Stands in for a compiled pattern and counts the scans started on it"""
+
+    def __init__(self, pattern, counter):
+        self.pattern = pattern
+        self.counter = counter
+
+    def _scan(self, method):
+        def scan(*args):
+            self.counter[0] += 1
+            return getattr(self.pattern, method)(*args)
+        return scan
+
+    def __getattr__(self, method):
+        return self._scan(method)
+
+
+def build_corpus(count, seed=1234):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 30))]
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(EXTRAS))
+        corpus.append(' '.join(words))
+    return corpus
+
+
+def legacy_scan(content, patterns, filter_words):
+    """The checks check_automod ran before the scanner"""
+    invite, url, emoji = patterns
+    for word in filter_words:
+        _ = word in content.lower()
+    invite.search(content)
+    url.search(content)
+    len(emoji.findall(content))
+
+
+def single_pass_scan(content, patterns, word_filter):
+    scan = carlbot.scan_message(content)
+    if word_filter is not None:
+        word_filter.find_all(scan.lowered)
+
+
+def time_approach(func, corpus, patterns, arg, repeat):
+    """Best of repeat runs, in microseconds per message"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for content in corpus:
+            func(content, patterns, arg)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / len(corpus)
+
+
+def count_scans(func, corpus, patterns, arg, scanner_patterns):
+    """Replay the corpus with every pattern either approach uses instrumented"""
+    counter = [0]
+    originals = {name: getattr(carlbot, name) for name in scanner_patterns}
+    for name, pattern in originals.items():
+        setattr(carlbot, name, CountingPattern(pattern, counter))
+    try:
+        for content in corpus:
+            func(content, [CountingPattern(pattern, counter) for pattern in patterns], arg)
+    finally:
+        for name, pattern in originals.items():
+            setattr(carlbot, name, pattern)
+    return counter[0] / len(corpus)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--words', type=int, default=20, help="filtered words for the second run")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per approach, best is shown")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.messages)
+    legacy_patterns = (LEGACY_INVITE_PATTERN, LEGACY_URL_PATTERN, LEGACY_EMOJI_PATTERN)
+    scanner_patterns = ('MESSAGE_TOKEN_PATTERN', 'UNICODE_EMOJI_PATTERN', 'INVITE_PATTERN')
+
+    print(f"{args.messages:,} messages")
+    print(f"{'filtered words':<16}{'approach':<14}{'regex scans/msg':>16}{'us/msg':>10}")
+    for word_count in (0, args.words):
+        filter_words = [f"badword{i}" for i in range(word_count)]
+        word_filter = carlbot.WordFilter(filter_words) if filter_words else None
+        runs = (
+            ("legacy", legacy_scan, filter_words),
+            ("single-pass", single_pass_scan, word_filter),
+        )
+        for label, func, arg in runs:
+            scans = count_scans(func, corpus, legacy_patterns, arg, scanner_patterns)
+            micros = time_approach(func, corpus, legacy_patterns, arg, args.repeat)
+            print(f"{word_count:<16}{label:<14}{scans:>16.2f}{micros:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Time a restart: loading the SQLite snapshot and replaying the journal tail.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py [--records 1000000] [--journal 10000]
+
+A temporary snapshot is filled with --records entries split evenly between
+XP, economy and warnings across 1000 guilds, plus one config row per
+thousand entries. The journal holds --journal XP changes made after the
+snapshot's checkpoint. Configs and member data are read lazily, so the
+restart only replays the journal; the first use of one guild, which reads
+that guild's member data, is timed separately.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+GUILD_ID = 1046520000000000000
+USER_ID = 1046520000000001000
+
+
+def build_snapshot(path, records):
+    backend = carlbot.SQLiteBackend(path)
+    per_kind = records // 3
+    xp = carlbot.encode_state_value(carlbot.XPRecord(1234, 5).to_dict())
+    economy = carlbot.encode_state_value(carlbot.EconomyRecord(250, 1000, 1700000000, None).to_dict())
+    warning = carlbot.encode_state_value(carlbot.WarningRecord("No reason provided", USER_ID, 1700000000).to_dict())
+    config = carlbot.encode_state_value(carlbot.GuildConfig().to_dict())
+    upserts = []
+    for i in range(per_kind):
+        guild_id, user_id = GUILD_ID + i % 1000, USER_ID + i
+        upserts.append(('user_xp', f'{guild_id}:{user_id}', xp))
+        upserts.append(('user_economy', f'{guild_id}:{user_id}', economy))
+        upserts.append(('warnings', f'{guild_id}:{user_id}:{i + 1}', warning))
+    for i in range(records // 1000):
+        upserts.append(('guild_configs', str(GUILD_ID + i), config))
+    backend.write(upserts, [], {carlbot.CHECKPOINT_META: 1, carlbot.WARNING_ID_META: per_kind + 1}, [])
+    backend.close()
+    return len(upserts)
+
+
+def build_journal(journal_dir, changes):
+    xp = carlbot.encode_state_value(carlbot.XPRecord(1300, 5).to_dict())
+    with open(os.path.join(journal_dir, f'{2:020d}-0.log'), 'wb') as f:
+        for i in range(changes):
+            f.write(carlbot.encode_journal_record(i + 2, 'user_xp', (GUILD_ID, USER_ID + i), xp))
+
+
+def reset_state():
+    for state, _ in carlbot.STORED_STATE.values():
+        if isinstance(state, dict):
+            state.clear()
+    carlbot.warning_store.ids.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--journal', type=int, default=10000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='carlbot-bench-')
+    try:
+        path = os.path.join(workdir, 'snapshot.db')
+        journal_dir = os.path.join(workdir, 'journal')
+        os.mkdir(journal_dir)
+        rows = build_snapshot(path, args.records)
+        build_journal(journal_dir, args.journal)
+
+        reset_state()
+        backend = carlbot.SQLiteBackend(path)
+        storage = carlbot.Storage(backend, journal_dir)
+        start = time.perf_counter()
+        loaded, replayed = storage.load()
+        restart = time.perf_counter() - start
+
+        start = time.perf_counter()
+        asyncio.run(storage.load_guild_async(GUILD_ID))
+        first_use = time.perf_counter() - start
+        members = len(carlbot.user_xp.get(GUILD_ID, {}))
+        backend.close()
+    finally:
+        shutil.rmtree(workdir)
+
+    print(f"{rows:,} snapshot rows, {args.journal:,} journal records")
+    print(f"restart: loaded {loaded:,} rows and replayed {replayed:,} records in {restart:.2f} s")
+    print(f"first use of a guild: read {members:,} members' data in {first_use * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
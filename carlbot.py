@@ -1,105 +1,735 @@
 import discord
 from discord.ext import commands, tasks
 import json
+import gzip
+import functools
+import heapq
+import multiprocessing
+import bisect
+import tempfile
 import asyncio
 import re
+import signal
 import datetime
+import os
+import socket
+import sqlite3
+import struct
+import threading
+import queue
+import operator
+import time
+import urllib.parse
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 from typing import Optional, Union
 import aiohttp
 import random
 
+class CarlBot(commands.Bot):
+    """Bot whose command contexts send their replies through the REST scheduler"""
+
+    async def get_context(self, origin, /, *, cls=None):
+        return await super().get_context(origin, cls=cls or ScheduledContext)
+
 # Bot configuration
 intents = discord.Intents.all()
-bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
+# Rate limits longer than this raise discord.RateLimited, which the REST
+# scheduler turns into a parked route instead of a sleeping call
+bot = CarlBot(command_prefix='!', intents=intents, help_command=None, max_ratelimit_timeout=30.0)
+
+# OUTBOUND REST SCHEDULER
+# Every REST call is submitted to one scheduler in a priority lane, so a burst
+# of fun commands and level-ups cannot delay kicks, bans and automod deletions.
+# Calls are grouped by route, Discord's rate-limit bucket (a channel's sends,
+# its single deletes and its bulk deletes are separate buckets, a guild's
+# members, ...). A route runs one call at a time and a route that is rate
+# limited is parked until it resets, so it never holds up other routes.
+# Ready routes are dispatched in lane order under a global rate limit.
+LANE_MODERATION, LANE_AUTOMOD, LANE_LOG, LANE_USER = range(4)
+LANE_NAMES = ('moderation', 'automod', 'log', 'user')
+REST_GLOBAL_RATE = 45  # calls per second, under Discord's global limit of 50
+
+class RestRoute:
+    __slots__ = ('jobs', 'busy', 'parked_until')
+
+    def __init__(self):
+        self.jobs = []  # heap of (lane, seq, func, future)
+        self.busy = False
+        self.parked_until = 0
+
+class RestScheduler:
+    """Runs REST calls by lane priority with per-route serialization and parking"""
+
+    def __init__(self):
+        self.routes = {}  # route -> RestRoute, only while it has work
+        # (lane, seq, route) of routes whose next call may run; an entry is
+        # stale once the route has started that call or been parked
+        self._ready = []
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._tokens = REST_GLOBAL_RATE
+        self._refilled = time.monotonic()
+        self._task = None
+        self._calls = set()  # in-flight call tasks, referenced until they finish
+        self.queued = [0] * len(LANE_NAMES)
+        self.completed = [0] * len(LANE_NAMES)
+        self.rate_limited = 0
+
+    async def call(self, lane, route, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on a route in a lane and return its result"""
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        state = self.routes.get(route)
+        if state is None:
+            state = self.routes[route] = RestRoute()
+        heapq.heappush(state.jobs, (lane, self._seq, functools.partial(func, *args, **kwargs), future))
+        self.queued[lane] += 1
+        self._offer(route, state)
+        return await future
+
+    def _offer(self, route, state):
+        if not state.busy and state.jobs and state.parked_until <= time.monotonic():
+            lane, seq = state.jobs[0][:2]
+            heapq.heappush(self._ready, (lane, seq, route))
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = bot.loop.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        while True:
+            while not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            # Take the token first so the pick sees everything queued meanwhile
+            await self._take_token()
+            route = self._next_route()
+            if route is None:
+                self._tokens += 1
+                continue
+            state = self.routes[route]
+            lane, seq, func, future = heapq.heappop(state.jobs)
+            self.queued[lane] -= 1
+            if future.done():
+                self._finish(route, state)
+                continue  # The caller gave up
+            state.busy = True
+            task = bot.loop.create_task(self._run(route, state, lane, seq, func, future))
+            self._calls.add(task)
+            task.add_done_callback(self._calls.discard)
+
+    def _next_route(self):
+        """Pop ready entries until one whose route can run its head call now"""
+        now = time.monotonic()
+        while self._ready:
+            lane, seq, route = heapq.heappop(self._ready)
+            state = self.routes.get(route)
+            if state is None or state.busy or not state.jobs or state.jobs[0][1] != seq:
+                continue
+            if state.parked_until <= now:
+                return route
+        return None
+
+    async def _take_token(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(REST_GLOBAL_RATE, self._tokens + (now - self._refilled) * REST_GLOBAL_RATE)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / REST_GLOBAL_RATE)
+
+    async def _run(self, route, state, lane, seq, func, future):
+        try:
+            result = await func()
+        except discord.RateLimited as e:
+            # Park the route and retry the call once it resets
+            self.rate_limited += 1
+            heapq.heappush(state.jobs, (lane, seq, func, future))
+            self.queued[lane] += 1
+            state.parked_until = time.monotonic() + e.retry_after
+            bot.loop.call_later(e.retry_after, self._unpark, route, state)
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+            self.completed[lane] += 1
+        else:
+            if not future.done():
+                future.set_result(result)
+            self.completed[lane] += 1
+        finally:
+            self._finish(route, state)
+
+    def _unpark(self, route, state):
+        if self.routes.get(route) is state:
+            self._offer(route, state)
+
+    def _finish(self, route, state):
+        state.busy = False
+        if state.jobs:
+            self._offer(route, state)
+        elif self.routes.get(route) is state:
+            del self.routes[route]
+
+rest = RestScheduler()
+
+# Replies to these commands go out in the moderation lane, the rest as user-facing
+MODERATION_COMMANDS = {'kick', 'ban', 'unban', 'mute', 'unmute', 'warn', 'warnings', 'delwarn', 'clearwarns', 'clear'}
+
+class ScheduledContext(commands.Context):
+    """Command context whose replies go through the REST scheduler"""
+
+    async def send(self, *args, **kwargs):
+        command = self.command.root_parent or self.command if self.command else None
+        lane = LANE_MODERATION if command and command.name in MODERATION_COMMANDS else LANE_USER
+        return await rest.call(lane, ('send', self.channel.id), super().send, *args, **kwargs)
+
+# STATE RECORDS
+# Fixed-shape state is held in __slots__ classes instead of dicts, which cuts
+# the per-entry overhead at millions of entries. Timestamps are epoch seconds.
+class Record:
+    """Base for slotted state records, stored as JSON objects"""
+    __slots__ = ()
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls()
+        for name in cls.__slots__:
+            if name in data:
+                setattr(record, name, data[name])
+        return record
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+class GuildConfig(Record):
+    __slots__ = ('prefix', 'log_channel', 'mute_role', 'welcome_channel', 'welcome_message',
+                 'leave_channel', 'leave_message', 'autoroles', 'levelup_mode', 'levelup_channel',
+                 'levelup_window')
+
+    def __init__(self):
+        self.prefix = '!'
+        self.log_channel = None
+        self.mute_role = None
+        self.welcome_channel = None
+        self.welcome_message = None
+        self.leave_channel = None
+        self.leave_message = None
+        self.autoroles = []
+        self.levelup_mode = 'here'  # off, here, dm, channel or digest
+        self.levelup_channel = None  # target of channel mode, and of digests if set
+        self.levelup_window = 60  # seconds of level-ups a digest collects
+
+class WarningRecord(Record):
+    __slots__ = ('reason', 'moderator', 'timestamp')
+
+    def __init__(self, reason='', moderator=0, timestamp=0):
+        self.reason = reason
+        self.moderator = moderator
+        self.timestamp = timestamp
+
+class XPRecord(Record):
+    __slots__ = ('xp', 'level')
+
+    def __init__(self, xp=0, level=1):
+        self.xp = xp
+        self.level = level
+
+class EconomyRecord(Record):
+    __slots__ = ('coins', 'bank', 'last_daily', 'last_work')
+
+    def __init__(self, coins=100, bank=0, last_daily=None, last_work=None):
+        self.coins = coins  # Starting coins
+        self.bank = bank
+        self.last_daily = last_daily
+        self.last_work = last_work
+
+class ReminderRecord(Record):
+    __slots__ = ('user_id', 'channel_id', 'message', 'due_at', 'interval', 'guild_id')
+
+    def __init__(self, user_id=0, channel_id=0, message='', due_at=0, interval=None, guild_id=0):
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.message = message
+        self.due_at = due_at
+        self.interval = interval  # seconds between repeats, None for a one-off
+        self.guild_id = guild_id  # 0 for a DM
+
+class MuteRecord(Record):
+    __slots__ = ('role_id', 'expires_at')
+
+    def __init__(self, role_id=0, expires_at=None):
+        self.role_id = role_id
+        self.expires_at = expires_at  # None for a permanent mute
 
 # Data storage (in production, use a proper database)
-guild_configs = {}
-automod_configs = {}
 reaction_roles = {}
-user_warnings = {}
-muted_users = {}
-automod_violations = {}
+automod_violations = OrderedDict()  # (guild_id, user_id) -> (score, updated, half-life), least recently updated first
+automod_plans = {}
+
+GUILD_CACHE_SIZE = int(os.environ.get('CARLBOT_GUILD_CACHE', 5000))  # resident guilds per config type
+
+class GuildStateCache:
+    """LRU of per-guild config dicts, loaded from storage on first access"""
+
+    def __init__(self, namespace, defaults, max_guilds=GUILD_CACHE_SIZE, on_evict=None):
+        self.namespace = namespace
+        self.defaults = defaults
+        self.max_guilds = max_guilds
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._versions = {}  # guild_id -> backend version the entry was loaded at
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, guild_id):
+        return guild_id in self._entries
+
+    def get(self, guild_id, default=None):
+        """Resident entry without loading it or touching its recency"""
+        return self._entries.get(guild_id, default)
+
+    def resident(self):
+        return list(self._entries)
+
+    def version(self, guild_id):
+        return self._versions.get(guild_id)
+
+    def set_version(self, guild_id, version):
+        if guild_id in self._entries:
+            self._versions[guild_id] = version
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def load(self, guild_id):
+        """Resident entry, reading it from the backend on a miss; async code should await load_async first"""
+        entry = self._entries.get(guild_id)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(guild_id)
+            return entry
+
+        self.misses += 1
+        data, version = storage.fetch(self.namespace, (guild_id,)) if storage is not None else (None, None)
+        return self._insert(guild_id, data, version)
+
+    async def load_async(self, guild_id):
+        """Like load, but a miss reads the backend in a worker thread"""
+        entry = self._entries.get(guild_id)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(guild_id)
+            return entry
+
+        self.misses += 1
+        data, version = await storage.fetch_async(self.namespace, (guild_id,)) if storage is not None else (None, None)
+        entry = self._entries.get(guild_id)
+        if entry is not None:
+            return entry  # Loaded by someone else while we waited
+        return self._insert(guild_id, data, version)
+
+    async def peek_many_async(self, guild_ids):
+        """Entries for many guilds without making them resident; misses are read in one backend call"""
+        entries = {guild_id: self._entries[guild_id] for guild_id in guild_ids if guild_id in self._entries}
+        missing = [guild_id for guild_id in guild_ids if guild_id not in entries]
+        if storage is not None and missing:
+            rows = await storage.fetch_many_async(self.namespace, [(guild_id,) for guild_id in missing])
+        else:
+            rows = [(None, None)] * len(missing)
+        for guild_id, (data, _) in zip(missing, rows):
+            entries[guild_id] = self.defaults() if data is None else decode_state_value(self.namespace, data)
+        return entries
+
+    def _insert(self, guild_id, data, version):
+        entry = self.defaults() if data is None else decode_state_value(self.namespace, data)
+        self._entries[guild_id] = entry
+        self._versions[guild_id] = version
+        while len(self._entries) > self.max_guilds:
+            self._evict()
+        return entry
+
+    def store(self, guild_id, entry):
+        """Make a changed entry resident again, in case it was evicted while its caller held it"""
+        if self._entries.get(guild_id) is not entry:
+            self._entries[guild_id] = entry
+            while len(self._entries) > self.max_guilds:
+                self._evict()
+        self._entries.move_to_end(guild_id)
+
+    def invalidate(self, guild_id):
+        """Drop a clean entry so the next access reloads it"""
+        if self._entries.pop(guild_id, None) is None:
+            return False
+        self._versions.pop(guild_id, None)
+        if self.on_evict:
+            self.on_evict(guild_id)
+        return True
+
+    def _evict(self):
+        guild_id, entry = self._entries.popitem(last=False)
+        self._versions.pop(guild_id, None)
+        self.evictions += 1
+        if storage is not None:
+            # Clean entries are simply dropped; dirty ones are handed back to be written
+            storage.write_back(self.namespace, (guild_id,), entry)
+        if self.on_evict:
+            self.on_evict(guild_id)
+
+def default_automod_config():
+    return {
+        'enabled': False,
+        'anti_spam': False,
+        'spam_messages': 5,
+        'spam_seconds': 5,
+        'anti_raid': False,
+        'raid_joins': 10,
+        'raid_seconds': 10,
+        'raid_action': 'kick',  # kick or queue accounts younger than raid_account_age
+        'raid_account_age': 7,
+        'anti_duplicates': False,
+        'duplicate_messages': 3,
+        'duplicate_seconds': 30,
+        'regex_rules': [],  # {'name', 'pattern', 'enabled', 'timeouts'}
+        'filter_words': [],
+        'filter_links': False,
+        'filter_invites': False,
+        'max_mentions': 5,
+        'max_emojis': None,  # off unless set with !automod maxemojis
+        'punishment': 'warn',  # warn, mute, kick, ban
+        'escalate_mute': None,  # violation score that escalates to a mute, None to disable
+        'escalate_kick': None,
+        'violation_half_life': 3600,  # seconds for a violation score to halve
+        'automod_mute_duration': 3600  # seconds an automod mute lasts, None for permanent
+    }
+
+guild_configs = GuildStateCache('guild_configs', GuildConfig)
+# The compiled plan holds the word automaton, so it goes with the config
+automod_configs = GuildStateCache(
+    'automod_configs', default_automod_config,
+    on_evict=lambda guild_id: automod_plans.pop(guild_id, None)
+)
 
 def load_guild_config(guild_id):
     """Load or create guild configuration"""
-    if guild_id not in guild_configs:
-        guild_configs[guild_id] = {
-            'prefix': '!',
-            'log_channel': None,
-            'mute_role': None,
-            'welcome_channel': None,
-            'welcome_message': None,
-            'leave_channel': None,
-            'leave_message': None,
-            'autoroles': []
-        }
-    return guild_configs[guild_id]
+    return guild_configs.load(guild_id)
+
+def save_guild_config(guild_id, config):
+    """Persist a guild's config after a change"""
+    guild_configs.store(guild_id, config)
+    mark_dirty('guild_configs', guild_id)
+
+async def load_guild_state(guild_id):
+    """Make a guild's configs and member data resident without blocking the event loop on the backend"""
+    await guild_configs.load_async(guild_id)
+    await automod_configs.load_async(guild_id)
+    if storage is not None:
+        await storage.load_guild_async(guild_id)
 
 def load_automod_config(guild_id):
     """Load or create automod configuration"""
-    if guild_id not in automod_configs:
-        automod_configs[guild_id] = {
-            'enabled': False,
-            'anti_spam': False,
-            'anti_raid': False,
-            'filter_words': [],
-            'filter_links': False,
-            'filter_invites': False,
-            'max_mentions': 5,
-            'max_emojis': 10,
-            'punishment': 'warn'  # warn, mute, kick, ban
-        }
-    return automod_configs[guild_id]
+    return automod_configs.load(guild_id)
+
+class WarningStore:
+    """Warnings indexed by (guild, user), each stored under its own id"""
+
+    def __init__(self):
+        # guild_id -> user_id -> {warning_id: WarningRecord}, oldest first
+        self.warnings = {}
+        # (guild_id, user_id) -> sorted warning ids, for cursor paging
+        self.ids = {}
+        self.next_id = 1
+
+    def finish_loading(self, guild_id):
+        """Order a guild's loaded warnings by id and index them for paging"""
+        members = self.warnings.get(guild_id, {})
+        for user_id, member in list(members.items()):
+            if member:
+                members[user_id] = dict(sorted(member.items()))
+                self.ids[(guild_id, user_id)] = list(members[user_id])
+            else:
+                del members[user_id]  # Every warning was deleted by the journal tail
+                self.ids.pop((guild_id, user_id), None)
+        if not members:
+            self.warnings.pop(guild_id, None)
+
+    def forget_guild(self, guild_id):
+        """Drop a guild's warnings from memory, leaving them stored"""
+        for user_id in self.warnings.pop(guild_id, {}):
+            self.ids.pop((guild_id, user_id), None)
+
+    def count(self, guild_id, user_id):
+        return len(self.warnings.get(guild_id, {}).get(user_id, ()))
+
+    def add(self, guild_id, user_id, warning):
+        warning_id = self.next_id
+        self.next_id += 1
+        self.warnings.setdefault(guild_id, {}).setdefault(user_id, {})[warning_id] = warning
+        self.ids.setdefault((guild_id, user_id), []).append(warning_id)
+        mark_dirty('warnings', guild_id, user_id, warning_id)
+        return warning_id
+
+    def put(self, guild_id, user_id, warning_id, warning):
+        """Store a warning under a known id, as when importing"""
+        member = self.warnings.setdefault(guild_id, {}).setdefault(user_id, {})
+        in_order = not member or warning_id > next(reversed(member))
+        if warning_id not in member:
+            bisect.insort(self.ids.setdefault((guild_id, user_id), []), warning_id)
+        member[warning_id] = warning
+        if not in_order:
+            self.warnings[guild_id][user_id] = dict(sorted(member.items()))
+        self.next_id = max(self.next_id, warning_id + 1)
+        mark_dirty('warnings', guild_id, user_id, warning_id)
+
+    def page(self, guild_id, user_id, before=None, limit=10):
+        """Up to limit (id, warning) pairs older than the before cursor, newest first"""
+        member = self.warnings.get(guild_id, {}).get(user_id, {})
+        ids = self.ids.get((guild_id, user_id), [])
+        end = len(ids) if before is None else bisect.bisect_left(ids, before)
+        return [(warning_id, member[warning_id]) for warning_id in reversed(ids[max(0, end - limit):end])]
+
+    def oldest(self, guild_id, user_id):
+        """The id of a member's oldest warning, or None"""
+        ids = self.ids.get((guild_id, user_id))
+        return ids[0] if ids else None
+
+    def remove(self, guild_id, user_id, warning_id):
+        members = self.warnings.get(guild_id, {})
+        if members.get(user_id, {}).pop(warning_id, None) is None:
+            return False
+        ids = self.ids[(guild_id, user_id)]
+        del ids[bisect.bisect_left(ids, warning_id)]
+        mark_dirty('warnings', guild_id, user_id, warning_id)
+        self._prune(guild_id, user_id)
+        return True
+
+    def clear(self, guild_id, user_id):
+        member = self.warnings.get(guild_id, {}).pop(user_id, {})
+        self.ids.pop((guild_id, user_id), None)
+        for warning_id in member:
+            mark_dirty('warnings', guild_id, user_id, warning_id)
+        self._prune(guild_id, user_id)
+        return len(member)
+
+    def _prune(self, guild_id, user_id):
+        members = self.warnings.get(guild_id)
+        if members is not None:
+            if not members.get(user_id, True):
+                del members[user_id]
+                self.ids.pop((guild_id, user_id), None)
+            if not members:
+                del self.warnings[guild_id]
+
+warning_store = WarningStore()
 
 @bot.event
 async def on_ready():
     print(f'{bot.user} has logged in!')
     print(f'Bot is in {len(bot.guilds)} guilds')
-    automod_check.start()
-
-@bot.event
-async def on_guild_join(guild):
-    """Initialize configuration when bot joins a server"""
-    load_guild_config(guild.id)
-    load_automod_config(guild.id)
 
 @bot.event
 async def on_member_join(member):
     """Handle member join events"""
+    await load_guild_state(member.guild.id)
     config = load_guild_config(member.guild.id)
     
-    # Auto roles
-    for role_id in config['autoroles']:
-        try:
-            role = member.guild.get_role(role_id)
-            if role:
-                await member.add_roles(role)
-        except:
-            pass
+    # Anti-raid: skip autoroles and welcomes while the guild is flooded
+    automod_config = load_automod_config(member.guild.id)
+    if automod_config['enabled'] and automod_config['anti_raid']:
+        in_raid, started = raid_detector.record_join(
+            member.guild.id, automod_config['raid_joins'], automod_config['raid_seconds']
+        )
+        if started:
+            start_raid_watch(member.guild)
+        if in_raid:
+            await handle_raid_join(member, automod_config)
+            return
     
-    # Welcome message
-    if config['welcome_channel'] and config['welcome_message']:
-        channel = bot.get_channel(config['welcome_channel'])
-        if channel:
-            message = config['welcome_message']
-            message = message.replace('{user}', member.mention)
-            message = message.replace('{server}', member.guild.name)
-            message = message.replace('{membercount}', str(member.guild.member_count))
-            await channel.send(message)
+    if config.autoroles or (config.welcome_channel and config.welcome_message):
+        join_pipeline.put(member)
+
+# JOIN PIPELINE
+# Joins go through a bounded queue worked by a fixed pool. on_member_join never
+# waits on it: when the queue is full a join is deferred in a per-guild
+# overflow that the workers move back into the queue one guild at a time, and
+# past JOIN_OVERFLOW_MAX deferred joins further joins are dropped and counted.
+# All of a member's autoroles are applied with one member edit. A guild's
+# first join is welcomed at once; joins in the next WELCOME_BATCH_WINDOW
+# seconds share one welcome message that mentions them all.
+JOIN_QUEUE_MAX = 1000
+JOIN_OVERFLOW_MAX = 5000
+JOIN_WORKERS = 4
+WELCOME_BATCH_WINDOW = 5  # seconds
+WELCOME_BATCH_MENTIONS = 50  # members mentioned per welcome message
+WELCOME_MESSAGE_CHARS = 2000
+
+class JoinPipeline:
+    """Applies autoroles and sends welcomes for joined members"""
+
+    def __init__(self):
+        self.queue = None
+        self.welcomes = {}  # guild_id -> members waiting for the next welcome
+        self.last_welcome = {}  # guild_id -> monotonic time of the last welcome
+        self.overflow = {}  # guild_id -> deque of joins waiting for queue room
+        self.deferred = 0
+        self.processed = 0
+        self.dropped = 0
+        self.guild_drops = {}  # guild_id -> joins dropped there
+        self._workers = []
+        self._flushes = set()  # welcome flushes waiting out their window
+
+    def start(self):
+        if not self._workers:
+            self.queue = asyncio.Queue(JOIN_QUEUE_MAX)
+            self._workers = [bot.loop.create_task(self._work()) for _ in range(JOIN_WORKERS)]
+
+    def put(self, member):
+        # Deferred joins go first, so nothing jumps ahead of them
+        if not self.overflow:
+            try:
+                self.queue.put_nowait(member)
+                return
+            except asyncio.QueueFull:
+                pass
+        if self.deferred >= JOIN_OVERFLOW_MAX:
+            self._drop(member)
+            return
+        self.overflow.setdefault(member.guild.id, deque()).append(member)
+        self.deferred += 1
+
+    def _drop(self, member):
+        guild = member.guild
+        self.dropped += 1
+        count = self.guild_drops[guild.id] = self.guild_drops.get(guild.id, 0) + 1
+        print(f"Join queue overflow, dropped join of {member.id} in {guild.id} ({count} there so far)")
+        # The guild's config is resident, on_member_join loaded it
+        if guild_configs.load(guild.id).log_channel:
+            log_sink.push(guild, f"**Join queue full:** Skipped autoroles and welcome for **{member}** "
+                                 f"({count} joins skipped so far)")
+
+    def _refill(self):
+        # Rotate through guilds so one raided guild cannot starve the others
+        while self.overflow and not self.queue.full():
+            guild_id = next(iter(self.overflow))
+            members = self.overflow.pop(guild_id)
+            self.queue.put_nowait(members.popleft())
+            self.deferred -= 1
+            if members:
+                self.overflow[guild_id] = members
+
+    async def _work(self):
+        while True:
+            member = await self.queue.get()
+            try:
+                await self._process(member)
+            except Exception as e:
+                print(f"Failed to process join of {member.id} in {member.guild.id}: {e}")
+            finally:
+                self.processed += 1
+                self.queue.task_done()
+                self._refill()
+
+    async def _process(self, member):
+        config = await guild_configs.load_async(member.guild.id)
+        roles = [role for role in map(member.guild.get_role, config.autoroles) if role]
+        if roles:
+            try:
+                # Non-atomic adds are a single PATCH of the member's role list
+                await rest.call(LANE_USER, ('members', member.guild.id), member.add_roles,
+                                *roles, reason="Autorole", atomic=False)
+            except discord.HTTPException:
+                pass  # Missing permissions, or the member already left
+        
+        if config.welcome_channel and config.welcome_message:
+            self._welcome(member)
+
+    def _welcome(self, member):
+        guild_id = member.guild.id
+        batch = self.welcomes.get(guild_id)
+        if batch is None:
+            now = time.monotonic()
+            delay = max(0, self.last_welcome.get(guild_id, 0) + WELCOME_BATCH_WINDOW - now)
+            batch = self.welcomes[guild_id] = []
+            task = bot.loop.create_task(self._flush_welcomes(member.guild, delay))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        batch.append(member)
+
+    def _render_welcomes(self, template, guild, members):
+        """Welcome messages mentioning every member, each within Discord's length limit"""
+        parts = [part.replace('{server}', guild.name).replace('{membercount}', str(guild.member_count))
+                 for part in template.split('{user}')]
+        fixed = sum(map(len, parts))
+        slots = len(parts) - 1  # times the mention list appears
+        batches = [[]]
+        length = fixed
+        for member in members:
+            batch = batches[-1]
+            added = slots * (len(member.mention) + (2 if batch else 0))
+            if batch and (len(batch) == WELCOME_BATCH_MENTIONS or length + added > WELCOME_MESSAGE_CHARS):
+                batch = []
+                batches.append(batch)
+                length = fixed
+                added = slots * len(member.mention)
+            batch.append(member)
+            length += added
+        # A template too long for even one mention is cut short
+        return [', '.join(member.mention for member in batch).join(parts)[:WELCOME_MESSAGE_CHARS] for batch in batches]
+
+    async def _flush_welcomes(self, guild, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        members = self.welcomes.pop(guild.id)
+        now = time.monotonic()
+        self.last_welcome[guild.id] = now
+        if len(self.last_welcome) > 10000:
+            self.last_welcome = {
+                guild_id: sent for guild_id, sent in self.last_welcome.items()
+                if sent + WELCOME_BATCH_WINDOW > now
+            }
+        
+        config = await guild_configs.load_async(guild.id)
+        channel = bot.get_channel(config.welcome_channel) if config.welcome_channel else None
+        if not channel or not config.welcome_message:
+            return
+        for message in self._render_welcomes(config.welcome_message, guild, members):
+            try:
+                await rest.call(LANE_USER, ('send', channel.id), channel.send, message)
+            except discord.HTTPException:
+                pass
+
+join_pipeline = JoinPipeline()
 
 @bot.event
 async def on_member_remove(member):
     """Handle member leave events"""
-    config = load_guild_config(member.guild.id)
+    config = await guild_configs.load_async(member.guild.id)
     
-    if config['leave_channel'] and config['leave_message']:
-        channel = bot.get_channel(config['leave_channel'])
+    if config.leave_channel and config.leave_message:
+        channel = bot.get_channel(config.leave_channel)
         if channel:
-            message = config['leave_message']
+            message = config.leave_message
             message = message.replace('{user}', str(member))
             message = message.replace('{server}', member.guild.name)
             message = message.replace('{membercount}', str(member.guild.member_count))
-            await channel.send(message)
+            await rest.call(LANE_USER, ('send', channel.id), channel.send, message)
 
 # MODERATION COMMANDS
 @bot.command(name='kick')
@@ -107,7 +737,7 @@ async def on_member_remove(member):
 async def kick_member(ctx, member: discord.Member, *, reason="No reason provided"):
     """Kick a member from the server"""
     try:
-        await member.kick(reason=reason)
+        await rest.call(LANE_MODERATION, ('members', ctx.guild.id), member.kick, reason=reason)
         embed = discord.Embed(
             title="Member Kicked",
             description=f"{member.mention} has been kicked.\nReason: {reason}",
@@ -123,7 +753,7 @@ async def kick_member(ctx, member: discord.Member, *, reason="No reason provided
 async def ban_member(ctx, member: Union[discord.Member, discord.User], *, reason="No reason provided"):
     """Ban a member from the server"""
     try:
-        await ctx.guild.ban(member, reason=reason)
+        await rest.call(LANE_MODERATION, ('bans', ctx.guild.id), ctx.guild.ban, member, reason=reason)
         embed = discord.Embed(
             title="Member Banned",
             description=f"{member.mention} has been banned.\nReason: {reason}",
@@ -139,8 +769,8 @@ async def ban_member(ctx, member: Union[discord.Member, discord.User], *, reason
 async def unban_member(ctx, user_id: int, *, reason="No reason provided"):
     """Unban a user from the server"""
     try:
-        user = await bot.fetch_user(user_id)
-        await ctx.guild.unban(user, reason=reason)
+        user = await rest.call(LANE_MODERATION, ('users', user_id), bot.fetch_user, user_id)
+        await rest.call(LANE_MODERATION, ('bans', ctx.guild.id), ctx.guild.unban, user, reason=reason)
         embed = discord.Embed(
             title="Member Unbanned",
             description=f"{user} has been unbanned.\nReason: {reason}",
@@ -159,30 +789,40 @@ async def mute_member(ctx, member: discord.Member, duration: Optional[str] = Non
     
     # Create mute role if it doesn't exist
     mute_role = None
-    if config['mute_role']:
-        mute_role = ctx.guild.get_role(config['mute_role'])
+    if config.mute_role:
+        mute_role = ctx.guild.get_role(config.mute_role)
     
     if not mute_role:
-        mute_role = await create_mute_role(ctx.guild)
-        config['mute_role'] = mute_role.id
+        mute_role = await create_mute_role(ctx.guild, ctx.channel)
+        if mute_role is None:
+            await ctx.send("Failed to create a mute role. Check that I have the Manage Roles permission.")
+            return
+        config.mute_role = mute_role.id
+        save_guild_config(ctx.guild.id, config)
+    elif ctx.guild.id in mute_provisioner.failed:
+        # Retry the channels an earlier setup could not reach
+        mute_provisioner.start(ctx.guild, mute_role, ctx.channel)
+    
+    # While the role is still being set up, make sure it works here and in
+    # every category before anyone wears it
+    setup_note = ""
+    if mute_provisioner.in_progress(ctx.guild.id):
+        if await mute_provisioner.prepare(ctx.guild, mute_role, ctx.channel):
+            setup_note = "\nThe mute role is still being set up in other channels."
+        else:
+            setup_note = "\nThe mute role could not be set up in this channel or its categories yet."
     
     try:
-        await member.add_roles(mute_role, reason=reason)
+        await rest.call(LANE_MODERATION, ('members', ctx.guild.id), member.add_roles, mute_role, reason=reason)
         
         # Parse duration
-        unmute_time = None
-        if duration:
-            unmute_time = parse_duration(duration)
-            if unmute_time:
-                muted_users[member.id] = {
-                    'guild_id': ctx.guild.id,
-                    'unmute_time': unmute_time,
-                    'role_id': mute_role.id
-                }
+        unmute_time = parse_duration(duration) if duration else None
+        expires_at = int(unmute_time.timestamp()) if unmute_time else None
+        mute_scheduler.schedule(ctx.guild.id, member.id, mute_role.id, expires_at)
         
         embed = discord.Embed(
             title="Member Muted",
-            description=f"{member.mention} has been muted.\nDuration: {duration or 'Permanent'}\nReason: {reason}",
+            description=f"{member.mention} has been muted.\nDuration: {duration or 'Permanent'}\nReason: {reason}{setup_note}",
             color=0xffff00
         )
         await ctx.send(embed=embed)
@@ -196,13 +836,12 @@ async def unmute_member(ctx, member: discord.Member, *, reason="No reason provid
     """Unmute a member"""
     config = load_guild_config(ctx.guild.id)
     
-    if config['mute_role']:
-        mute_role = ctx.guild.get_role(config['mute_role'])
+    if config.mute_role:
+        mute_role = ctx.guild.get_role(config.mute_role)
         if mute_role and mute_role in member.roles:
             try:
-                await member.remove_roles(mute_role, reason=reason)
-                if member.id in muted_users:
-                    del muted_users[member.id]
+                await rest.call(LANE_MODERATION, ('members', ctx.guild.id), member.remove_roles, mute_role, reason=reason)
+                mute_scheduler.cancel(ctx.guild.id, member.id)
                 
                 embed = discord.Embed(
                     title="Member Unmuted",
@@ -214,62 +853,93 @@ async def unmute_member(ctx, member: discord.Member, *, reason="No reason provid
             except Exception as e:
                 await ctx.send(f"Failed to unmute member: {e}")
         else:
+            mute_scheduler.cancel(ctx.guild.id, member.id)
             await ctx.send("Member is not muted.")
 
 @bot.command(name='warn')
 @commands.has_permissions(manage_messages=True)
 async def warn_member(ctx, member: discord.Member, *, reason="No reason provided"):
     """Warn a member"""
-    if member.id not in user_warnings:
-        user_warnings[member.id] = []
-    
-    warning = {
-        'guild_id': ctx.guild.id,
-        'reason': reason,
-        'moderator': ctx.author.id,
-        'timestamp': datetime.datetime.now().isoformat()
-    }
-    
-    user_warnings[member.id].append(warning)
+    warning = WarningRecord(reason, ctx.author.id, int(time.time()))
+    warning_id = warning_store.add(ctx.guild.id, member.id, warning)
     
     embed = discord.Embed(
         title="Member Warned",
-        description=f"{member.mention} has been warned.\nReason: {reason}\nTotal warnings: {len(user_warnings[member.id])}",
+        description=f"{member.mention} has been warned.\nReason: {reason}\nWarning ID: {warning_id}\nTotal warnings: {warning_store.count(ctx.guild.id, member.id)}",
         color=0xffa500
     )
     await ctx.send(embed=embed)
     await log_action(ctx.guild, f"**{member}** was warned by **{ctx.author}**\nReason: {reason}")
 
+WARNINGS_PAGE_SIZE = 10
+
 @bot.command(name='warnings')
-async def show_warnings(ctx, member: Optional[discord.Member] = None):
-    """Show warnings for a member"""
+async def show_warnings(ctx, member: Optional[discord.Member] = None, before: Optional[int] = None):
+    """Show warnings for a member, newest first, paging back from a warning ID"""
     if not member:
         member = ctx.author
     
-    if member.id not in user_warnings:
-        await ctx.send(f"{member.mention} has no warnings.")
+    total = warning_store.count(ctx.guild.id, member.id)
+    if not total:
+        await ctx.send(f"{member.mention} has no warnings in this server.")
         return
     
-    warnings = [w for w in user_warnings[member.id] if w['guild_id'] == ctx.guild.id]
-    
-    if not warnings:
-        await ctx.send(f"{member.mention} has no warnings in this server.")
+    page = warning_store.page(ctx.guild.id, member.id, before, WARNINGS_PAGE_SIZE)
+    if not page:
+        await ctx.send(f"{member.mention} has no older warnings.")
         return
     
     embed = discord.Embed(
         title=f"Warnings for {member}",
+        description=f"Total warnings: {total}",
         color=0xffa500
     )
     
-    for i, warning in enumerate(warnings[-10:], 1):  # Show last 10 warnings
-        moderator = bot.get_user(warning['moderator'])
+    for warning_id, warning in page:
+        moderator = bot.get_user(warning.moderator)
         embed.add_field(
-            name=f"Warning {i}",
-            value=f"**Reason:** {warning['reason']}\n**Moderator:** {moderator or 'Unknown'}\n**Date:** {warning['timestamp'][:10]}",
+            name=f"Warning #{warning_id}",
+            value=f"**Reason:** {warning.reason}\n**Moderator:** {moderator or 'Unknown'}\n**Date:** <t:{warning.timestamp}:d>",
             inline=False
         )
     
+    if len(page) == WARNINGS_PAGE_SIZE and page[-1][0] != warning_store.oldest(ctx.guild.id, member.id):
+        embed.set_footer(text=f"Older warnings: !warnings {member.id} {page[-1][0]}")
+    
+    await ctx.send(embed=embed)
+
+@bot.command(name='delwarn')
+@commands.has_permissions(manage_messages=True)
+async def delete_warning(ctx, member: discord.Member, warning_id: int):
+    """Delete a single warning"""
+    if not warning_store.remove(ctx.guild.id, member.id, warning_id):
+        await ctx.send(f"{member.mention} has no warning #{warning_id} in this server.")
+        return
+    
+    embed = discord.Embed(
+        title="Warning Deleted",
+        description=f"Deleted warning #{warning_id} from {member.mention}.\nRemaining warnings: {warning_store.count(ctx.guild.id, member.id)}",
+        color=0x00ff00
+    )
     await ctx.send(embed=embed)
+    await log_action(ctx.guild, f"**{ctx.author}** deleted warning #{warning_id} from **{member}**")
+
+@bot.command(name='clearwarns')
+@commands.has_permissions(manage_messages=True)
+async def clear_warnings(ctx, member: discord.Member):
+    """Delete all of a member's warnings"""
+    cleared = warning_store.clear(ctx.guild.id, member.id)
+    if not cleared:
+        await ctx.send(f"{member.mention} has no warnings in this server.")
+        return
+    
+    embed = discord.Embed(
+        title="Warnings Cleared",
+        description=f"Cleared {cleared} warnings from {member.mention}.",
+        color=0x00ff00
+    )
+    await ctx.send(embed=embed)
+    await log_action(ctx.guild, f"**{ctx.author}** cleared {cleared} warnings from **{member}**")
 
 @bot.command(name='clear', aliases=['purge'])
 @commands.has_permissions(manage_messages=True)
@@ -278,7 +948,7 @@ async def clear_messages(ctx, amount: int = 10):
     if amount > 100:
         amount = 100
     
-    deleted = await ctx.channel.purge(limit=amount + 1)
+    deleted = await rest.call(LANE_MODERATION, ('bulk_delete', ctx.channel.id), ctx.channel.purge, limit=amount + 1)
     embed = discord.Embed(
         title="Messages Cleared",
         description=f"Deleted {len(deleted) - 1} messages.",
@@ -287,7 +957,7 @@ async def clear_messages(ctx, amount: int = 10):
     
     msg = await ctx.send(embed=embed)
     await asyncio.sleep(5)
-    await msg.delete()
+    await rest.call(LANE_MODERATION, ('delete', ctx.channel.id), msg.delete)
 
 # UTILITY COMMANDS
 @bot.command(name='userinfo', aliases=['ui'])
@@ -356,93 +1026,952 @@ async def on_message(message):
     
     # Check automod
     if message.guild:
+        await load_guild_state(message.guild.id)
         await check_automod(message)
     
     await bot.process_commands(message)
 
-async def check_automod(message):
-    """Check message against automod rules"""
-    config = load_automod_config(message.guild.id)
+WORD_FILTER_GATE_MAX = 32  # longest word list that gets a regex pre-check
+
+class WordFilter:
+    """Aho-Corasick automaton that finds every filtered word in one pass"""
+    __slots__ = ('_gate', '_goto', '_fail', '_out')
+
+    def __init__(self, words):
+        # Most messages contain no filtered word; for short lists one C-speed
+        # search rules that out before the automaton walks the text in Python.
+        # The alternation is tried at every position, so past a few dozen
+        # words it costs more than the walk it would skip.
+        words = [word for word in words if word]
+        self._gate = None
+        if len(words) <= WORD_FILTER_GATE_MAX:
+            self._gate = re.compile('|'.join(re.escape(word) for word in words) or '(?!)')
+        self._goto = [{}]
+        self._out = [()]
+        for word in words:
+            state = 0
+            for char in word:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._out.append(())
+                state = next_state
+            self._out[state] += (word,)
+        
+        # Breadth-first pass to link every state to its longest proper suffix
+        self._fail = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._out[next_state] += self._out[fail]
+
+    def find_all(self, text):
+        """Return every filtered word contained in text, in order of first match"""
+        if self._gate is not None and not self._gate.search(text):
+            return []
+        goto, fail, out = self._goto, self._fail, self._out
+        found = {}
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                for word in out[state]:
+                    found[word] = None
+        return list(found)
+
+# Every link and custom emoji token starts with one of these characters, so
+# the pattern is anchored on a single character class and the regex engine
+# can skip plain text at C speed. It runs over the lowercased content, so
+# links count whatever their case (HTTPS://, Discord.gg/), and animated
+# custom emojis (<a:name:id>) count as emojis; the per-rule regexes this
+# replaced missed both. An invite must start a word, so lookalike domains
+# such as xdiscord.gg or my-discord.gg are not taken for one.
+MESSAGE_TOKEN_PATTERN = re.compile(
+    '[dh<]'
+    r'(?:(?<=d)(?<![\w-]d)iscord(?:\.gg|(?:app)?\.com/invite)/\w+'
+    r'|(?<=h)ttps?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
+    r'|(?<=<)a?:\w*:\d*>)'
+)
+# One match per emoji as displayed: a flag (a pair of regional indicators),
+# or a base emoji with its skin tone and variation selectors, joined by ZWJ
+# into family and profession sequences
+EMOJI_BASE = '[\u2600-\u27bf\U0001f000-\U0001faff][\ufe0f\U0001f3fb-\U0001f3ff]*'
+UNICODE_EMOJI_PATTERN = re.compile(
+    '[\U0001f1e6-\U0001f1ff]{2}|' + EMOJI_BASE + '(?:\u200d' + EMOJI_BASE + ')*'
+)
+INVITE_PATTERN = re.compile(r'(?<![\w-])discord(?:\.gg|(?:app)?\.com/invite)/\w+')
+
+class MessageScan:
+    """Everything the automod rules read from a message's content"""
+    __slots__ = ('content', 'invites', 'urls', 'custom_emojis', 'unicode_emojis', '_lowered')
+
+    def __init__(self, content):
+        self.content = content
+        # Plain text keeps the shared empty tuples; the tokenizer swaps in lists
+        self.invites = ()
+        self.urls = ()
+        self.custom_emojis = 0
+        self.unicode_emojis = 0
+        self._lowered = None
+
+    @property
+    def emoji_count(self):
+        return self.custom_emojis + self.unicode_emojis
+
+    @property
+    def lowered(self):
+        """The content lowercased, computed on first use"""
+        if self._lowered is None:
+            self._lowered = self.content.lower()
+        return self._lowered
+
+def scan_message(content):
+    """Tokenize message content once for all automod rules"""
+    scan = MessageScan(content)
+    # Every link has a slash and every custom emoji a '<', so substring tests
+    # rule out all tokens in plain chat text without starting the regex engine
+    if '/' in content or '<' in content:
+        scan.invites = []
+        scan.urls = []
+        for match in MESSAGE_TOKEN_PATTERN.finditer(scan.lowered):
+            token = match.group()
+            first = token[0]
+            if first == 'h':
+                scan.urls.append(token)
+                if INVITE_PATTERN.search(token):
+                    scan.invites.append(token)
+            elif first == 'd':
+                scan.invites.append(token)
+            else:
+                scan.custom_emojis += 1
+    if not content.isascii():
+        scan.unicode_emojis = len(UNICODE_EMOJI_PATTERN.findall(content))
+    return scan
+
+class SpamDetector:
+    """Per-(guild, user) message rate detector over fixed-size timestamp rings"""
+    __slots__ = ('idle_timeout', 'max_users', '_rings')
+
+    def __init__(self, idle_timeout=120, max_users=500000):
+        self.idle_timeout = idle_timeout
+        self.max_users = max_users
+        # key -> [next slot, last seen, ring of timestamps], least recently seen first
+        self._rings = OrderedDict()
+
+    def __len__(self):
+        return len(self._rings)
+
+    def hit(self, key, limit, window, now=None):
+        """Record a message and return True if it is the limit-th within window seconds"""
+        if now is None:
+            now = time.monotonic()
+        size = limit - 1
+        entry = self._rings.get(key)
+        if entry is None or len(entry[2]) != size:
+            entry = [0, now, array('d', [float('-inf')]) * size]
+            self._rings[key] = entry
+        else:
+            self._rings.move_to_end(key)
+        
+        # The slot about to be overwritten holds the oldest of the previous limit - 1 messages
+        index, _, ring = entry
+        spamming = now - ring[index] < window
+        ring[index] = now
+        entry[0] = (index + 1) % size
+        entry[1] = now
+        
+        self._evict(now)
+        return spamming
+
+    def _evict(self, now):
+        rings = self._rings
+        while rings:
+            key, entry = next(iter(rings.items()))
+            if len(rings) <= self.max_users and now - entry[1] < self.idle_timeout:
+                break
+            del rings[key]
+
+spam_detector = SpamDetector()
+
+class RaidDetector:
+    """Per-guild join counters over time buckets that flag raids"""
+    BUCKETS = 10
+    RAID_COOLDOWN = 120  # seconds of calm before raid mode ends
+
+    def __init__(self):
+        # guild_id -> [bucket seconds, bucket ids, join counts, time every bucket
+        # has expired and raid mode has ended by], least recently joined first
+        self._counters = OrderedDict()
+        self._raid_until = {}
+
+    def __len__(self):
+        return len(self._counters)
+
+    def record_join(self, guild_id, joins, seconds, now=None):
+        """Count a join and return (in raid mode, raid just started)"""
+        if now is None:
+            now = time.monotonic()
+        width = seconds / self.BUCKETS
+        counter = self._counters.get(guild_id)
+        if counter is None or counter[0] != width:
+            counter = [width, array('q', [-1]) * self.BUCKETS, array('l', [0]) * self.BUCKETS, 0]
+            self._counters[guild_id] = counter
+        else:
+            self._counters.move_to_end(guild_id)
+        counter[3] = now + seconds
+        _, bucket_ids, counts, _ = counter
+        
+        bucket = int(now // width)
+        slot = bucket % self.BUCKETS
+        if bucket_ids[slot] != bucket:
+            bucket_ids[slot] = bucket
+            counts[slot] = 0
+        counts[slot] += 1
+        
+        oldest = bucket - self.BUCKETS
+        recent = sum(count for bucket_id, count in zip(bucket_ids, counts) if bucket_id > oldest)
+        
+        was_raid = self.in_raid(guild_id, now)
+        self._evict(now)
+        if recent >= joins:
+            self._raid_until[guild_id] = now + self.RAID_COOLDOWN
+            counter[3] = max(counter[3], now + self.RAID_COOLDOWN)
+            return True, not was_raid
+        return was_raid, False
+
+    def _evict(self, now):
+        """Drop guilds whose buckets have all expired and whose raid mode has ended"""
+        counters = self._counters
+        while counters:
+            guild_id, counter = next(iter(counters.items()))
+            if counter[3] > now:
+                break
+            del counters[guild_id]
+            self._raid_until.pop(guild_id, None)
+
+    def in_raid(self, guild_id, now=None):
+        if now is None:
+            now = time.monotonic()
+        return self._raid_until.get(guild_id, 0) > now
+
+    def remaining(self, guild_id, now=None):
+        """Seconds until raid mode ends for the guild"""
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self._raid_until.get(guild_id, 0) - now)
+
+    def end_raid(self, guild_id):
+        self._raid_until.pop(guild_id, None)
+        self._counters.pop(guild_id, None)
+
+raid_detector = RaidDetector()
+raid_queues = {}  # guild_id -> ids of members held back during its raid
+raid_watchers = {}  # guild_id -> the task watching its raid
+RAID_ACTIONS = {'kick': 'kicked', 'queue': 'held until the raid ends'}
+
+async def handle_raid_join(member, automod_config):
+    """Kick or hold back a member who joined during a raid"""
+    account_age = discord.utils.utcnow() - member.created_at
+    is_new_account = account_age < datetime.timedelta(days=automod_config['raid_account_age'])
     
+    if is_new_account and automod_config['raid_action'] == 'kick':
+        try:
+            await rest.call(LANE_AUTOMOD, ('members', member.guild.id), member.kick, reason="Anti-raid: new account joined during a raid")
+            return
+        except:
+            pass
+    
+    # Autoroles are applied once the raid is over; welcome messages are skipped.
+    # Every held member is kept, so none is left without their autoroles
+    raid_queues.setdefault(member.guild.id, []).append(member.id)
+
+def start_raid_watch(guild):
+    """Watch a guild's raid unless a watcher is already running for it"""
+    if guild.id not in raid_watchers:
+        raid_watchers[guild.id] = bot.loop.create_task(watch_raid(guild))
+
+async def watch_raid(guild):
+    """Log a raid, wait for it to calm down, then release held members"""
+    try:
+        # A raid that starts again while the last one is being released is watched by the same task
+        while True:
+            await log_action(guild, "**Anti-Raid:** Join flood detected, raid mode enabled. "
+                                    "Welcome messages and autoroles are paused.")
+            while raid_detector.in_raid(guild.id):
+                await asyncio.sleep(min(raid_detector.remaining(guild.id) + 1, 5))
+            await release_raid_queue(guild)
+            if not raid_detector.in_raid(guild.id):
+                break
+    finally:
+        raid_watchers.pop(guild.id, None)
+
+async def release_raid_queue(guild):
+    """Apply autoroles to members held back during a raid"""
+    queue = raid_queues.pop(guild.id, None)
+    config = await guild_configs.load_async(guild.id)
+    roles = [role for role in map(guild.get_role, config.autoroles) if role]
+    released = 0
+    
+    for member_id in queue or ():
+        member = guild.get_member(member_id)
+        if not member:
+            continue
+        if roles:
+            try:
+                await rest.call(LANE_AUTOMOD, ('members', guild.id), member.add_roles, *roles, reason="Anti-raid: raid ended", atomic=False)
+            except:
+                continue
+        released += 1
+    
+    await log_action(guild, f"**Anti-Raid:** Raid mode ended. Released {released} held members.")
+
+WORD_PATTERN = re.compile(r'\w+')
+
+class DuplicateDetector:
+    """Per-channel MinHash index of recent messages for catching near-duplicate floods"""
+    NUM_HASHES = 16  # a power of two, so a hash's low bits pick its bin
+    ROWS_PER_BAND = 2  # divides NUM_HASHES
+    BIN_BITS = NUM_HASHES.bit_length() - 1
+    BIN_MASK = NUM_HASHES - 1
+    SIMILARITY = 0.5
+    MIN_LENGTH = 10
+    MAX_LENGTH = 256
+    SHINGLE_SIZE = 4
+
+    def __init__(self, history=50, max_channels=20000):
+        self.history = history
+        self.max_channels = max_channels
+        # channel_id -> (deque of (timestamp, signature, band keys), band key -> deque of entries)
+        self._channels = OrderedDict()
+
+    def signature(self, lowered):
+        """MinHash signature of the message's character shingles, or None if it is too short
+
+        Uses one-permutation hashing: each shingle is hashed once and the low
+        bits pick which of the NUM_HASHES bins it competes for the minimum in,
+        so the cost is one hash per shingle instead of one per shingle per bin.
+        The hashes are visited in ascending order, so the first one seen in a
+        bin is its minimum and the scan stops once every bin has one.
+        """
+        text = ' '.join(WORD_PATTERN.findall(lowered))[:self.MAX_LENGTH]
+        if len(text) < self.MIN_LENGTH:
+            return None
+        size = self.SHINGLE_SIZE
+        bins = self.NUM_HASHES
+        bin_mask = self.BIN_MASK
+        shift = self.BIN_BITS
+        mins = [None] * bins
+        empty = bins
+        for h in sorted([hash(text[i:i + size]) for i in range(len(text) - size + 1)]):
+            if mins[h & bin_mask] is None:
+                mins[h & bin_mask] = h >> shift
+                empty -= 1
+                if not empty:
+                    break
+        
+        # Short messages leave some bins empty; borrow from the next filled bin
+        if empty:
+            for i in range(bins):
+                j = i
+                while mins[j % bins] is None:
+                    j += 1
+                mins[i] = mins[j % bins] + j - i
+        return tuple(mins)
+
+    def check(self, channel_id, lowered, window, stop_at=None, now=None):
+        """Record a message and return how many recent messages in the channel resemble it
+
+        Counting stops early once stop_at similar messages have been found.
+        """
+        signature = self.signature(lowered)
+        if signature is None:
+            return 0
+        if now is None:
+            now = time.monotonic()
+        
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = (deque(), {})
+            self._channels[channel_id] = channel
+            if len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+        else:
+            self._channels.move_to_end(channel_id)
+        entries, index = channel
+        
+        # Drop messages that left the window or overflow the history
+        while entries and (entries[0][0] < now - window or len(entries) >= self.history):
+            self._forget(entries.popleft(), index)
+        
+        rows = self.ROWS_PER_BAND
+        band_keys = tuple((band, signature[band:band + rows]) for band in range(0, self.NUM_HASHES, rows))
+        candidates = {}
+        for key in band_keys:
+            for entry in index.get(key, ()):
+                candidates[id(entry)] = entry
+        
+        needed = self.SIMILARITY * self.NUM_HASHES
+        similar = 0
+        for _, other, _ in candidates.values():
+            if sum(map(operator.eq, signature, other)) >= needed:
+                similar += 1
+                if similar == stop_at:
+                    break
+        
+        entry = (now, signature, band_keys)
+        entries.append(entry)
+        for key in band_keys:
+            bucket = index.get(key)
+            if bucket is None:
+                bucket = index[key] = deque()
+            bucket.append(entry)
+        return similar
+
+    @staticmethod
+    def _forget(entry, index):
+        # Entries are forgotten oldest first, so each is at the front of its buckets
+        for key in entry[2]:
+            bucket = index[key]
+            bucket.popleft()
+            if not bucket:
+                del index[key]
+
+duplicate_detector = DuplicateDetector()
+
+@dataclass(frozen=True)
+class AutomodPlan:
+    """The enabled automod checks of a guild, cheapest first"""
+    checks: tuple  # (name, check) pairs; check(message, scan, violations)
+    needs_scan: bool
+    punishment: str
+    regex_rules: tuple = ()  # (name, pattern) pairs, evaluated out of process
+
+def compile_automod_plan(config):
+    """Compile an automod config into a plan holding only its enabled checks"""
     if not config['enabled']:
-        return
+        return AutomodPlan(checks=(), needs_scan=False, punishment=config['punishment'])
     
-    violations = []
+    checks = []
+    scan_checks = []
     
-    # Check filtered words
-    if config['filter_words']:
-        for word in config['filter_words']:
-            if word.lower() in message.content.lower():
-                violations.append(f"Filtered word: {word}")
+    # Message metadata only, no content scan needed
+    if config['max_mentions'] is not None:
+        max_mentions = config['max_mentions']
+        def check_mentions(message, scan, violations):
+            mentions = len(message.mentions) + len(message.role_mentions)
+            if mentions > max_mentions:
+                violations.append(f"Too many mentions ({mentions})")
+        checks.append(('mentions', check_mentions))
+    
+    if config['anti_spam']:
+        spam_messages, spam_seconds = config['spam_messages'], config['spam_seconds']
+        def check_spam(message, scan, violations):
+            if spam_detector.hit((message.guild.id, message.author.id), spam_messages, spam_seconds):
+                violations.append(f"Spam ({spam_messages}+ messages in {spam_seconds}s)")
+        checks.append(('spam', check_spam))
     
-    # Check invite links
+    # Checks reading the single-pass scan, in increasing cost
     if config['filter_invites']:
-        invite_pattern = r'discord\.gg/\w+|discordapp\.com/invite/\w+'
-        if re.search(invite_pattern, message.content, re.IGNORECASE):
-            violations.append("Discord invite link")
+        def check_invites(message, scan, violations):
+            if scan.invites:
+                violations.append("Discord invite link")
+        scan_checks.append(('invites', check_invites))
     
-    # Check external links
     if config['filter_links']:
-        url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-        if re.search(url_pattern, message.content):
-            violations.append("External link")
+        def check_links(message, scan, violations):
+            if scan.urls:
+                violations.append("External link")
+        scan_checks.append(('links', check_links))
+    
+    if config['max_emojis'] is not None:
+        max_emojis = config['max_emojis']
+        def check_emojis(message, scan, violations):
+            if scan.emoji_count > max_emojis:
+                violations.append(f"Too many emojis ({scan.emoji_count})")
+        scan_checks.append(('emojis', check_emojis))
+    
+    if config['filter_words']:
+        word_filter = WordFilter(config['filter_words'])
+        def check_words(message, scan, violations):
+            for word in word_filter.find_all(scan.lowered):
+                violations.append(f"Filtered word: {word}")
+        scan_checks.append(('words', check_words))
+    
+    if config['anti_duplicates']:
+        duplicate_messages, duplicate_seconds = config['duplicate_messages'], config['duplicate_seconds']
+        def check_duplicates(message, scan, violations):
+            similar = duplicate_detector.check(
+                message.channel.id, scan.lowered, duplicate_seconds, stop_at=duplicate_messages - 1
+            )
+            if similar + 1 >= duplicate_messages:
+                violations.append(f"Repeated message ({similar + 1} similar messages)")
+        scan_checks.append(('duplicates', check_duplicates))
+    
+    return AutomodPlan(
+        checks=tuple(checks + scan_checks),
+        needs_scan=bool(scan_checks),
+        punishment=config['punishment'],
+        regex_rules=tuple((rule['name'], rule['pattern']) for rule in config['regex_rules'] if rule['enabled'])
+    )
+
+def rebuild_automod_plan(guild_id):
+    """Recompile a guild's automod plan after its config changed"""
+    automod_plans[guild_id] = compile_automod_plan(load_automod_config(guild_id))
+    return automod_plans[guild_id]
+
+def save_automod_config(guild_id, config):
+    """Persist a guild's automod config and recompile its plan after a change"""
+    automod_configs.store(guild_id, config)
+    mark_dirty('automod_configs', guild_id)
+    return rebuild_automod_plan(guild_id)
+
+def get_automod_plan(guild_id):
+    """Get the compiled automod plan for a guild, compiling it on first use"""
+    plan = automod_plans.get(guild_id)
+    if plan is None:
+        plan = rebuild_automod_plan(guild_id)
+    return plan
+
+# User-defined regex rules run in worker processes, so a pattern with
+# catastrophic backtracking can only ever stall a worker, never the event loop.
+REGEX_TIME_BUDGET = 0.1  # seconds per pattern evaluation
+REGEX_MAX_TIMEOUTS = 3  # consecutive timeouts before a rule is disabled
+REGEX_MAX_RULES = 10
+REGEX_MAX_LENGTH = 300
+REGEX_START_TIMEOUT = 30  # seconds for a new pool's workers to come up
+REGEX_PROBES = ('a' * 64 + '!', 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa' * 2 + '\n', '1' * 64 + 'x', ' ' * 64 + '!')
+
+# Workers are started from a clean forkserver process rather than forked
+# from the bot with its sockets and threads
+REGEX_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def _regex_worker_init(pids):
+    """Report the worker's pid so a runaway worker can be killed"""
+    pids.put(os.getpid())
+
+def _regex_search_many(patterns, content):
+    """Worker-side pattern evaluation; returns (matched, seconds spent) per pattern"""
+    results = []
+    for pattern in patterns:
+        start = time.perf_counter()
+        matched = re.search(pattern, content, re.IGNORECASE) is not None
+        results.append((matched, time.perf_counter() - start))
+    return results
+
+class RegexPoolError(Exception):
+    """Regex evaluation failed because the worker pool kept being restarted"""
+
+class RegexWorkerPool:
+    """Process pool that evaluates regex rules under a time budget
+
+    Workers take about half a second to start, since each one imports the
+    bot, so a pool is only used once every worker has reported its pid;
+    start-up never counts against an evaluation's budget.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._pool = None
+        self._pid_queue = None  # queue the current pool's workers report their pids on
+        self._pids = []
+        self._slots = asyncio.Semaphore(workers)
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        """Start the workers if there are none and wait until every one is up"""
+        async with self._start_lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(REGEX_START_METHOD)
+                pid_queue = context.Queue()
+                pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context,
+                    initializer=_regex_worker_init, initargs=(pid_queue,)
+                )
+                # Workers are spawned on demand, one for each submit that finds none idle
+                warmups = [pool.submit(int) for _ in range(self.workers)]
+                try:
+                    pids = await asyncio.to_thread(self._collect_pids, pid_queue, warmups)
+                except Exception as e:
+                    self._reap_later(pool, pid_queue, [])
+                    raise RegexPoolError(f"the regex workers did not start: {e!r}")
+                self._pool, self._pid_queue, self._pids = pool, pid_queue, pids
+        return self._pool
+
+    def _collect_pids(self, pid_queue, warmups):
+        deadline = time.monotonic() + REGEX_START_TIMEOUT
+        pids = []
+        while len(pids) < self.workers:
+            for warmup in warmups:
+                if warmup.done() and warmup.exception() is not None:
+                    raise warmup.exception()
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{len(pids)} of {self.workers} workers started")
+            try:
+                pids.append(pid_queue.get(timeout=0.1))
+            except queue.Empty:
+                pass
+        return pids
+
+    def _restart(self, pool=None):
+        """Shut the pool down, killing any worker stuck in a runaway pattern; the next evaluation starts a new one"""
+        if pool is not None and pool is not self._pool:
+            return  # Already replaced by another evaluation's restart
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        pid_queue, self._pid_queue = self._pid_queue, None
+        pids, self._pids = self._pids, []
+        self._reap_later(pool, pid_queue, pids)
+
+    @staticmethod
+    def _reap_later(pool, pid_queue, pids):
+        pool.shutdown(wait=False, cancel_futures=True)
+        # Shutting down doesn't stop a worker mid-pattern
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass  # Already exited
+        # The pid queue's semaphore is unlinked when the queue is closed, so
+        # it stays open until every worker that could still use it is gone
+        threading.Thread(target=RegexWorkerPool._reap, args=(pool, pid_queue), daemon=True).start()
+
+    @staticmethod
+    def _reap(pool, pid_queue):
+        pool.shutdown(wait=True)
+        pid_queue.close()
+        pid_queue.join_thread()
+
+    async def search(self, pattern, content, budget=REGEX_TIME_BUDGET):
+        """Return True if pattern matches, raising asyncio.TimeoutError if it ran over budget"""
+        matched, = await self.search_many((pattern,), content, budget)
+        if matched is None:
+            raise asyncio.TimeoutError
+        return matched
+
+    async def search_many(self, patterns, content, budget=REGEX_TIME_BUDGET):
+        """Evaluate patterns against content in one submit.
+
+        Returns True or False per pattern, or None for a pattern that ran over
+        budget. Raises RegexPoolError if the pool is restarted under the
+        evaluation twice.
+        """
+        for attempt in range(2):
+            pool = await self.start()
+            # Only submit when a worker is free so queueing never counts against the budget
+            async with self._slots:
+                future = asyncio.get_running_loop().run_in_executor(pool, _regex_search_many, patterns, content)
+                try:
+                    results = await asyncio.wait_for(future, timeout=budget * len(patterns) + 0.25)
+                except asyncio.TimeoutError:
+                    self._restart(pool)
+                    break
+                except BrokenProcessPool:
+                    # Another evaluation killed the pool while this one was in flight
+                    self._restart(pool)
+                    continue
+            return [matched if elapsed <= budget else None for matched, elapsed in results]
+        else:
+            raise RegexPoolError("the regex worker pool was restarted twice during one evaluation")
+        
+        # A pattern ran away and took the whole submit with it; evaluate the
+        # patterns one at a time to find out which
+        if len(patterns) == 1:
+            return [None]
+        return [(await self.search_many((pattern,), content, budget))[0] for pattern in patterns]
+
+    def shutdown(self):
+        self._restart()
+
+regex_pool = RegexWorkerPool()
+
+async def validate_regex_rule(pattern):
+    """Return an error message if a pattern can't be used as a rule, else None"""
+    if len(pattern) > REGEX_MAX_LENGTH:
+        return f"Patterns can be at most {REGEX_MAX_LENGTH} characters."
+    try:
+        re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        return f"Invalid pattern: {e}"
+    for probe in REGEX_PROBES:
+        try:
+            await regex_pool.search(pattern, probe)
+        except asyncio.TimeoutError:
+            return "This pattern is too slow (it may backtrack catastrophically)."
+        except RegexPoolError:
+            return "The pattern could not be checked right now, please try again."
+    return None
+
+async def evaluate_regex_rules(message, plan):
+    """Run a guild's regex rules against a message and return the violations"""
+    try:
+        results = await regex_pool.search_many(tuple(pattern for _, pattern in plan.regex_rules), message.content)
+    except RegexPoolError as e:
+        print(f"Regex rules were not evaluated for message {message.id} in {message.guild.id}: {e}")
+        return []
     
-    # Check excessive mentions
-    mentions = len(message.mentions) + len(message.role_mentions)
-    if mentions > config['max_mentions']:
-        violations.append(f"Too many mentions ({mentions})")
+    violations = []
+    timed_out = []
+    completed = []
+    for (name, _), matched in zip(plan.regex_rules, results):
+        if matched is None:
+            timed_out.append(name)
+            continue
+        if matched:
+            violations.append(f"Matched rule: {name}")
+        completed.append(name)
     
-    # Check excessive emojis
-    emoji_count = len(re.findall(r'<:\w*:\d*>', message.content))
-    if emoji_count > config['max_emojis']:
-        violations.append(f"Too many emojis ({emoji_count})")
+    if timed_out or completed:
+        await record_regex_timeouts(message.guild, timed_out, completed)
+    return violations
+
+async def record_regex_timeouts(guild, timed_out, completed):
+    """Count consecutive timeouts per rule and disable rules that keep timing out"""
+    config = await automod_configs.load_async(guild.id)
+    disabled = []
+    changed = False
+    for rule in config['regex_rules']:
+        if rule['name'] in timed_out:
+            rule['timeouts'] += 1
+            changed = True
+            if rule['timeouts'] >= REGEX_MAX_TIMEOUTS and rule['enabled']:
+                rule['enabled'] = False
+                disabled.append(rule['name'])
+        elif rule['name'] in completed and rule['timeouts']:
+            rule['timeouts'] = 0
+            changed = True
+    
+    if changed:
+        save_automod_config(guild.id, config)
+    if disabled:
+        for name in disabled:
+            await log_action(guild, f"**AutoMod:** Regex rule `{name}` was disabled after {REGEX_MAX_TIMEOUTS} timeouts in a row")
+
+async def check_automod(message):
+    """Check message against automod rules"""
+    plan = get_automod_plan(message.guild.id)
+    if not plan.checks and not plan.regex_rules:
+        return
+    
+    violations = []
+    scan = scan_message(message.content) if plan.needs_scan else None
+    for _, check in plan.checks:
+        check(message, scan, violations)
+    
+    # Regex rules are the most expensive, skip them once the message is already going
+    if not violations and plan.regex_rules:
+        violations.extend(await evaluate_regex_rules(message, plan))
     
     # Apply punishment if violations found
     if violations:
-        await delete_message_and_punish(message, violations, config['punishment'])
+        await delete_message_and_punish(message, violations, plan.punishment)
+
+# Violations are collected per channel for a short window and flushed with one
+# bulk delete, so a spam wave costs one REST call per 100 messages.
+BULK_DELETE_WINDOW = 1.0  # seconds
+BULK_DELETE_MAX = 100
+PUNISHMENT_SEVERITY = {'warn': 0, 'mute': 1, 'kick': 2, 'ban': 3}
+PUNISHMENT_PAST = {'warn': 'warned', 'mute': 'muted', 'kick': 'kicked', 'ban': 'banned'}
+pending_deletions = {}
+deletion_flushes = set()  # flush_deletions_later tasks, referenced until they finish
 
 async def delete_message_and_punish(message, violations, punishment):
-    """Delete message and apply punishment"""
+    """Queue a message for deletion and punishment in its channel's next batch"""
+    batch = pending_deletions.get(message.channel.id)
+    if batch is None:
+        batch = pending_deletions[message.channel.id] = []
+        task = asyncio.get_running_loop().create_task(flush_deletions_later(message.channel, batch))
+        deletion_flushes.add(task)
+        task.add_done_callback(deletion_flushes.discard)
+    batch.append((message, violations, punishment))
+    
+    if len(batch) >= BULK_DELETE_MAX:
+        await flush_deletions(message.channel)
+
+async def flush_deletions_later(channel, batch):
+    await asyncio.sleep(BULK_DELETE_WINDOW)
+    # The batch may already have been flushed for being full
+    if pending_deletions.get(channel.id) is batch:
+        await flush_deletions(channel)
+
+async def flush_deletions(channel):
+    """Bulk delete a channel's pending violations, then log and punish once per member"""
+    batch = pending_deletions.pop(channel.id, None)
+    if not batch:
+        return
+    
+    messages = [message for message, _, _ in batch]
     try:
-        await message.delete()
-        
-        # Log violation
-        violation_text = ", ".join(violations)
-        await log_action(message.guild, f"**AutoMod:** Deleted message from **{message.author}** in {message.channel.mention}\nViolations: {violation_text}")
-        
-        # Apply punishment
-        if punishment == 'warn':
-            if message.author.id not in user_warnings:
-                user_warnings[message.author.id] = []
-            
-            warning = {
-                'guild_id': message.guild.id,
-                'reason': f"AutoMod violation: {violation_text}",
-                'moderator': bot.user.id,
-                'timestamp': datetime.datetime.now().isoformat()
-            }
-            user_warnings[message.author.id].append(warning)
+        if len(messages) == 1:
+            await rest.call(LANE_AUTOMOD, ('delete', channel.id), messages[0].delete)
+        else:
+            await rest.call(LANE_AUTOMOD, ('bulk_delete', channel.id), channel.delete_messages, messages)
+    except discord.HTTPException:
+        # Fall back to single deletes, skipping messages that are already gone
+        for message in messages:
+            try:
+                await rest.call(LANE_AUTOMOD, ('delete', channel.id), message.delete)
+            except discord.HTTPException:
+                pass
+    
+    # Merge each member's violations and keep their harshest punishment
+    offenders = {}
+    for message, violations, punishment in batch:
+        if message.author.id not in offenders:
+            offenders[message.author.id] = [message.author, [], punishment, 0]
+        offender = offenders[message.author.id]
+        offender[1].extend(v for v in violations if v not in offender[1])
+        offender[3] += 1
+        if PUNISHMENT_SEVERITY.get(punishment, 0) > PUNISHMENT_SEVERITY.get(offender[2], 0):
+            offender[2] = punishment
+    
+    lines = []
+    for member, violations, _, count in offenders.values():
+        plural = "s" if count > 1 else ""
+        lines.append(f"**{member}** ({count} message{plural}): {', '.join(violations)}")
+    header = f"**AutoMod:** Deleted {len(messages)} message{'s' if len(messages) > 1 else ''} in {channel.mention}\n"
+    log_text = header + "\n".join(lines)
+    if len(log_text) > 4000:
+        log_text = log_text[:3997] + "..."
+    await log_action(channel.guild, log_text)
+    
+    config = await automod_configs.load_async(channel.guild.id)
+    guild_config = await guild_configs.load_async(channel.guild.id)
+    mute_role = channel.guild.get_role(guild_config.mute_role) if guild_config.mute_role else None
+    for member, violations, punishment, count in offenders.values():
+        score = add_violation_score(channel.guild.id, member.id, count, config['violation_half_life'])
+        punishment = escalate_punishment(punishment, score, config, can_mute=mute_role is not None)
+        await apply_automod_punishment(channel.guild, member, ", ".join(violations), punishment, mute_role,
+                                       config['automod_mute_duration'])
+
+# Violation scores decay exponentially. Each entry is a (score, timestamp,
+# half-life) triple and the decay is applied when the score is read, so no
+# background sweep is needed. Entries are kept in update order, and each write
+# drops the decayed entries at the stale end, so members who never offend
+# again are dropped by later writes.
+def decayed_score(score, updated, half_life, now):
+    return score * 0.5 ** (max(0.0, now - updated) / half_life)
+
+def current_violation_score(guild_id, user_id, half_life, now=None):
+    """Get a member's violation score decayed to now"""
+    entry = automod_violations.get((guild_id, user_id))
+    if entry is None:
+        return 0.0
+    if now is None:
+        now = time.time()
+    score, updated, _ = entry
+    score = decayed_score(score, updated, half_life, now)
+    if score < 0.01:
+        del automod_violations[(guild_id, user_id)]
+        return 0.0
+    return score
+
+def add_violation_score(guild_id, user_id, amount, half_life, now=None):
+    """Add to a member's decayed violation score and return the new score"""
+    if now is None:
+        now = time.time()
+    score = current_violation_score(guild_id, user_id, half_life, now) + amount
+    automod_violations[(guild_id, user_id)] = (score, now, half_life)
+    automod_violations.move_to_end((guild_id, user_id))
+    _prune_violation_scores(now)
+    return score
+
+def _prune_violation_scores(now):
+    """Drop the least recently updated scores that have decayed away"""
+    while automod_violations:
+        key, (score, updated, half_life) = next(iter(automod_violations.items()))
+        if decayed_score(score, updated, half_life, now) >= 0.01:
+            break
+        del automod_violations[key]
+
+def escalate_punishment(punishment, score, config, can_mute=True):
+    """Raise the configured punishment to match a member's violation score"""
+    escalated = punishment
+    if config['escalate_kick'] is not None and score >= config['escalate_kick']:
+        escalated = 'kick'
+    elif config['escalate_mute'] is not None and score >= config['escalate_mute'] and can_mute:
+        escalated = 'mute'
+    if PUNISHMENT_SEVERITY[escalated] > PUNISHMENT_SEVERITY.get(punishment, 0):
+        return escalated
+    return punishment
+
+def automod_fallback(guild, member, punishment, mute_role=None):
+    """The harshest punishment up to the given one that the bot's permissions and role position allow"""
+    me = guild.me
+    if punishment in ('kick', 'ban'):
+        permission = 'kick_members' if punishment == 'kick' else 'ban_members'
+        if getattr(me.guild_permissions, permission) and member.top_role < me.top_role:
+            return punishment
+        punishment = 'mute'
+    if punishment == 'mute':
+        if mute_role is not None and me.guild_permissions.manage_roles and mute_role < me.top_role:
+            return punishment
+    return 'warn'
+
+async def apply_automod_punishment(guild, member, violation_text, punishment, mute_role=None, mute_duration=None):
+    """Punish a member for automod violations and let them know what was done"""
+    # A punishment the bot can't carry out falls back to the next one it can,
+    # and the log says so rather than the member going unpunished
+    intended = punishment
+    punishment = automod_fallback(guild, member, punishment, mute_role)
+    # (a mute with no mute role set up is a warning by configuration, not a failure)
+    if punishment != intended and not (intended == 'mute' and mute_role is None):
+        await log_action(guild, f"**AutoMod:** Could not {intended} **{member}** (missing permission or role "
+                                f"hierarchy), so they were {PUNISHMENT_PAST[punishment]} instead")
+    reason = f"AutoMod violation: {violation_text}"
+    
+    description = f"Your message in **{guild.name}** was deleted for violating server rules.\nViolations: {violation_text}"
+    if punishment != 'warn':
+        description += f"\nAction taken: {punishment.title()}"
+    embed = discord.Embed(
+        title="AutoMod Violation",
+        description=description,
+        color=0xff0000
+    )
+    
+    async def notify():
+        try:
+            await rest.call(LANE_AUTOMOD, ('dm', member.id), member.send, embed=embed)
+        except discord.HTTPException:
+            pass  # User has DMs disabled
+    
+    # A removed member can't be reached afterwards, so the DM goes out first
+    if punishment in ('kick', 'ban'):
+        await notify()
+    
+    try:
+        if punishment == 'warn':
+            warning = WarningRecord(reason, bot.user.id, int(time.time()))
+            warning_store.add(guild.id, member.id, warning)
             
         elif punishment == 'mute':
-            config = load_guild_config(message.guild.id)
-            if config['mute_role']:
-                mute_role = message.guild.get_role(config['mute_role'])
-                if mute_role:
-                    await message.author.add_roles(mute_role, reason=f"AutoMod violation: {violation_text}")
+            await rest.call(LANE_AUTOMOD, ('members', guild.id), member.add_roles, mute_role, reason=reason)
+            expires_at = int(time.time()) + mute_duration if mute_duration is not None else None
+            mute_scheduler.schedule(guild.id, member.id, mute_role.id, expires_at)
         
-        # Send notification to user
-        try:
-            embed = discord.Embed(
-                title="AutoMod Violation",
-                description=f"Your message in **{message.guild.name}** was deleted for violating server rules.\nViolations: {violation_text}",
-                color=0xff0000
-            )
-            await message.author.send(embed=embed)
-        except:
-            pass  # User has DMs disabled
-            
-    except:
-        pass  # Message might already be deleted
+        elif punishment == 'kick':
+            await rest.call(LANE_AUTOMOD, ('members', guild.id), member.kick, reason=reason)
+            await log_action(guild, f"**AutoMod:** **{member}** was kicked for repeated violations")
+        
+        elif punishment == 'ban':
+            await rest.call(LANE_AUTOMOD, ('bans', guild.id), guild.ban, member, reason=reason, delete_message_days=0)
+            await log_action(guild, f"**AutoMod:** **{member}** was banned for repeated violations")
+    except discord.HTTPException:
+        await log_action(guild, f"**AutoMod:** Could not {punishment} **{member}**")
+        return  # Member may have left
+    
+    if punishment in ('warn', 'mute'):
+        await notify()
 
 # REACTION ROLES
 @bot.command(name='reactionrole', aliases=['rr'])
@@ -450,13 +1979,14 @@ async def delete_message_and_punish(message, violations, punishment):
 async def reaction_role(ctx, message_id: int, emoji, role: discord.Role):
     """Add a reaction role to a message"""
     try:
-        message = await ctx.channel.fetch_message(message_id)
-        await message.add_reaction(emoji)
+        message = await rest.call(LANE_USER, ('fetch', ctx.channel.id), ctx.channel.fetch_message, message_id)
+        await rest.call(LANE_USER, ('reactions', ctx.channel.id), message.add_reaction, emoji)
         
         if message_id not in reaction_roles:
             reaction_roles[message_id] = {}
         
         reaction_roles[message_id][str(emoji)] = role.id
+        mark_dirty('reaction_roles', message_id)
         
         embed = discord.Embed(
             title="Reaction Role Added",
@@ -481,7 +2011,7 @@ async def on_reaction_add(reaction, user):
             role = reaction.message.guild.get_role(role_id)
             if role:
                 try:
-                    await user.add_roles(role)
+                    await rest.call(LANE_USER, ('members', role.guild.id), user.add_roles, role)
                 except:
                     pass
 
@@ -498,7 +2028,7 @@ async def on_reaction_remove(reaction, user):
             role = reaction.message.guild.get_role(role_id)
             if role:
                 try:
-                    await user.remove_roles(role)
+                    await rest.call(LANE_USER, ('members', role.guild.id), user.remove_roles, role)
                 except:
                     pass
 
@@ -514,7 +2044,9 @@ async def config(ctx):
                        "`!config log <channel>` - Set log channel\n"
                        "`!config welcome <channel> <message>` - Set welcome settings\n"
                        "`!config leave <channel> <message>` - Set leave settings\n"
-                       "`!config autorole <role>` - Add autorole",
+                       "`!config autorole <role>` - Add autorole\n"
+                       "`!config levelups <mode> [channel] [window]` - Set level-up announcements\n"
+                       "`!config muterole` - Apply the mute role to channels missing it",
             color=0x00ff00
         )
         await ctx.send(embed=embed)
@@ -523,7 +2055,8 @@ async def config(ctx):
 async def set_prefix(ctx, prefix):
     """Set the bot prefix for this server"""
     config = load_guild_config(ctx.guild.id)
-    config['prefix'] = prefix
+    config.prefix = prefix
+    save_guild_config(ctx.guild.id, config)
     
     embed = discord.Embed(
         title="Prefix Updated",
@@ -536,7 +2069,8 @@ async def set_prefix(ctx, prefix):
 async def set_log_channel(ctx, channel: discord.TextChannel):
     """Set the log channel"""
     config = load_guild_config(ctx.guild.id)
-    config['log_channel'] = channel.id
+    config.log_channel = channel.id
+    save_guild_config(ctx.guild.id, config)
     
     embed = discord.Embed(
         title="Log Channel Set",
@@ -549,8 +2083,9 @@ async def set_log_channel(ctx, channel: discord.TextChannel):
 async def set_welcome(ctx, channel: discord.TextChannel, *, message):
     """Set welcome message and channel"""
     config = load_guild_config(ctx.guild.id)
-    config['welcome_channel'] = channel.id
-    config['welcome_message'] = message
+    config.welcome_channel = channel.id
+    config.welcome_message = message
+    save_guild_config(ctx.guild.id, config)
     
     embed = discord.Embed(
         title="Welcome Settings Updated",
@@ -559,6 +2094,60 @@ async def set_welcome(ctx, channel: discord.TextChannel, *, message):
     )
     await ctx.send(embed=embed)
 
+@config.command(name='muterole')
+async def sync_mute_role(ctx):
+    """Apply the mute role's overwrites to every channel missing them"""
+    config = load_guild_config(ctx.guild.id)
+    mute_role = ctx.guild.get_role(config.mute_role) if config.mute_role else None
+    if not mute_role:
+        await ctx.send("No mute role yet; one is created on the first `!mute`.")
+        return
+    
+    if not any(mute_provisioner.needs(channel, mute_role) for channel in ctx.guild.channels):
+        await ctx.send(f"{mute_role.mention} is already set up in every channel.")
+        return
+    mute_provisioner.start(ctx.guild, mute_role, ctx.channel)
+
+@config.command(name='levelups')
+async def set_levelups(ctx, mode: str, channel: Optional[discord.TextChannel] = None, window: Optional[int] = None):
+    """Set how level-ups are announced"""
+    mode = mode.lower()
+    if mode not in LEVELUP_MODES:
+        await ctx.send(f"Mode must be one of: {', '.join(LEVELUP_MODES)}")
+        return
+    if mode == 'channel' and channel is None:
+        await ctx.send("Channel mode needs a channel, e.g. `!config levelups channel #levels`.")
+        return
+    if window is not None and window < LEVELUP_CHANNEL_INTERVAL:
+        await ctx.send(f"Digest windows must be at least {LEVELUP_CHANNEL_INTERVAL} seconds.")
+        return
+    
+    config = load_guild_config(ctx.guild.id)
+    config.levelup_mode = mode
+    # Without a channel, digests keep going to the channel already set
+    if channel is not None:
+        config.levelup_channel = channel.id
+    else:
+        channel = ctx.guild.get_channel(config.levelup_channel) if config.levelup_channel else None
+    if window is not None:
+        config.levelup_window = window
+    save_guild_config(ctx.guild.id, config)
+    
+    descriptions = {
+        'off': "Level-ups will not be announced",
+        'here': "Level-ups will be announced in the channel they happen in",
+        'dm': "Level-ups will be announced by DM",
+        'channel': f"Level-ups will be announced in {channel.mention if channel else ''}",
+        'digest': f"Level-ups will be collected for {config.levelup_window} seconds and announced together "
+                  f"in {channel.mention if channel else 'the channel they happen in'}",
+    }
+    embed = discord.Embed(
+        title="Level-Up Announcements Updated",
+        description=descriptions[mode],
+        color=0x00ff00
+    )
+    await ctx.send(embed=embed)
+
 # AUTOMOD CONFIGURATION
 @bot.group(name='automod')
 @commands.has_permissions(administrator=True)
@@ -566,15 +2155,28 @@ async def automod(ctx):
     """AutoMod configuration commands"""
     if ctx.invoked_subcommand is None:
         config = load_automod_config(ctx.guild.id)
+        anti_spam = 'No'
+        if config['anti_spam']:
+            anti_spam = f"{config['spam_messages']} messages / {config['spam_seconds']}s"
+        escalation = 'Off'
+        if config['escalate_mute'] is not None or config['escalate_kick'] is not None:
+            escalation = (f"mute at {config['escalate_mute'] or '-'}, kick at {config['escalate_kick'] or '-'} "
+                          f"(half-life {config['violation_half_life'] // 60}m)")
+        mute_duration = 'Permanent'
+        if config['automod_mute_duration'] is not None:
+            mute_duration = f"{config['automod_mute_duration'] // 60}m"
         embed = discord.Embed(
             title="AutoMod Settings",
             description=f"**Status:** {'Enabled' if config['enabled'] else 'Disabled'}\n"
                        f"**Filter Words:** {len(config['filter_words'])} words\n"
                        f"**Filter Links:** {'Yes' if config['filter_links'] else 'No'}\n"
                        f"**Filter Invites:** {'Yes' if config['filter_invites'] else 'No'}\n"
-                       f"**Max Mentions:** {config['max_mentions']}\n"
-                       f"**Max Emojis:** {config['max_emojis']}\n"
-                       f"**Punishment:** {config['punishment'].title()}",
+                       f"**Anti-Spam:** {anti_spam}\n"
+                       f"**Max Mentions:** {config['max_mentions'] if config['max_mentions'] is not None else 'Off'}\n"
+                       f"**Max Emojis:** {config['max_emojis'] if config['max_emojis'] is not None else 'Off'}\n"
+                       f"**Punishment:** {config['punishment'].title()}\n"
+                       f"**AutoMod Mute Duration:** {mute_duration}\n"
+                       f"**Escalation:** {escalation}",
             color=0x00ff00
         )
         await ctx.send(embed=embed)
@@ -584,6 +2186,7 @@ async def enable_automod(ctx):
     """Enable AutoMod"""
     config = load_automod_config(ctx.guild.id)
     config['enabled'] = True
+    save_automod_config(ctx.guild.id, config)
     
     embed = discord.Embed(
         title="AutoMod Enabled",
@@ -597,6 +2200,7 @@ async def disable_automod(ctx):
     """Disable AutoMod"""
     config = load_automod_config(ctx.guild.id)
     config['enabled'] = False
+    save_automod_config(ctx.guild.id, config)
     
     embed = discord.Embed(
         title="AutoMod Disabled",
@@ -611,6 +2215,7 @@ async def add_filtered_word(ctx, *, word):
     config = load_automod_config(ctx.guild.id)
     if word.lower() not in config['filter_words']:
         config['filter_words'].append(word.lower())
+        save_automod_config(ctx.guild.id, config)
         await ctx.send(f"Added `{word}` to the word filter.")
     else:
         await ctx.send(f"`{word}` is already in the word filter.")
@@ -621,32 +2226,487 @@ async def remove_filtered_word(ctx, *, word):
     config = load_automod_config(ctx.guild.id)
     if word.lower() in config['filter_words']:
         config['filter_words'].remove(word.lower())
+        save_automod_config(ctx.guild.id, config)
         await ctx.send(f"Removed `{word}` from the word filter.")
     else:
         await ctx.send(f"`{word}` is not in the word filter.")
 
+@automod.command(name='links')
+async def set_filter_links(ctx, state: str):
+    """Toggle the external link filter"""
+    config = load_automod_config(ctx.guild.id)
+    if state.lower() not in ('on', 'off'):
+        await ctx.send("Use `!automod links on` or `!automod links off`.")
+        return
+    config['filter_links'] = state.lower() == 'on'
+    save_automod_config(ctx.guild.id, config)
+    await ctx.send(f"Link filter {'enabled' if config['filter_links'] else 'disabled'}.")
+
+@automod.command(name='invites')
+async def set_filter_invites(ctx, state: str):
+    """Toggle the Discord invite filter"""
+    config = load_automod_config(ctx.guild.id)
+    if state.lower() not in ('on', 'off'):
+        await ctx.send("Use `!automod invites on` or `!automod invites off`.")
+        return
+    config['filter_invites'] = state.lower() == 'on'
+    save_automod_config(ctx.guild.id, config)
+    await ctx.send(f"Invite filter {'enabled' if config['filter_invites'] else 'disabled'}.")
+
+@automod.command(name='maxmentions')
+async def set_max_mentions(ctx, limit: str):
+    """Set the mention limit per message, or turn it off"""
+    config = load_automod_config(ctx.guild.id)
+    if limit.lower() == 'off':
+        config['max_mentions'] = None
+    elif limit.isdigit():
+        config['max_mentions'] = int(limit)
+    else:
+        await ctx.send("Use a number or `off`.")
+        return
+    save_automod_config(ctx.guild.id, config)
+    await ctx.send(f"Max mentions set to {limit.lower()}.")
+
+@automod.command(name='maxemojis')
+async def set_max_emojis(ctx, limit: str):
+    """Set the emoji limit per message, or turn it off"""
+    config = load_automod_config(ctx.guild.id)
+    if limit.lower() == 'off':
+        config['max_emojis'] = None
+    elif limit.isdigit():
+        config['max_emojis'] = int(limit)
+    else:
+        await ctx.send("Use a number or `off`.")
+        return
+    save_automod_config(ctx.guild.id, config)
+    await ctx.send(f"Max emojis set to {limit.lower()}.")
+
+@automod.command(name='punishment')
+async def set_punishment(ctx, punishment: str):
+    """Set the base punishment for automod violations"""
+    config = load_automod_config(ctx.guild.id)
+    punishment = punishment.lower()
+    if punishment not in PUNISHMENT_SEVERITY:
+        await ctx.send("Punishment must be one of: warn, mute, kick, ban.")
+        return
+    config['punishment'] = punishment
+    save_automod_config(ctx.guild.id, config)
+    await ctx.send(f"AutoMod punishment set to {punishment}.")
+
+@automod.command(name='muteduration')
+async def set_automod_mute_duration(ctx, duration: str):
+    """Set how long automod mutes last (e.g. 30m, 1h, 1d), or make them permanent"""
+    config = load_automod_config(ctx.guild.id)
+    if duration.lower() == 'permanent':
+        config['automod_mute_duration'] = None
+    else:
+        seconds = parse_duration_seconds(duration)
+        if seconds is None or not 60 <= seconds <= 28 * 86400:
+            await ctx.send("Use a duration between 1m and 28d, such as `30m` or `1d`, or `permanent`.")
+            return
+        config['automod_mute_duration'] = seconds
+    save_automod_config(ctx.guild.id, config)
+    await ctx.send(f"AutoMod mutes now last {duration.lower()}.")
+
+@automod.command(name='escalation')
+async def set_escalation(ctx, mute_score: str, kick_score: Optional[str] = None, half_life_minutes: Optional[int] = None):
+    """Set the violation scores at which punishments escalate; without a kick score the current one is kept"""
+    config = load_automod_config(ctx.guild.id)
+    if mute_score.lower() == 'off':
+        config['escalate_mute'] = None
+        config['escalate_kick'] = None
+        save_automod_config(ctx.guild.id, config)
+        await ctx.send("Punishment escalation disabled.")
+        return
+    
+    usage = ("Use `!automod escalation <mute_score> [kick_score|off] [half_life_minutes]` "
+             "or `!automod escalation off`.")
+    try:
+        mute_at = float(mute_score)
+        if kick_score is None:
+            kick_at = config['escalate_kick']
+        elif kick_score.lower() == 'off':
+            kick_at = None
+        else:
+            kick_at = float(kick_score)
+    except ValueError:
+        await ctx.send(usage)
+        return
+    if mute_at <= 0 or (kick_at is not None and kick_at <= mute_at):
+        if kick_score is None and kick_at is not None:
+            await ctx.send(f"The current kick score ({kick_at:g}) is not above {mute_at:g}. "
+                           f"Give a higher kick score, or `off` to never kick.")
+        else:
+            await ctx.send("Scores must be positive and the kick score must be above the mute score.")
+        return
+    if half_life_minutes is not None and not 1 <= half_life_minutes <= 10080:
+        await ctx.send("Half-life must be between 1 minute and 7 days.")
+        return
+    
+    config['escalate_mute'] = mute_at
+    config['escalate_kick'] = kick_at
+    if half_life_minutes is not None:
+        config['violation_half_life'] = half_life_minutes * 60
+    save_automod_config(ctx.guild.id, config)
+    
+    embed = discord.Embed(
+        title="Escalation Updated",
+        description=f"Each deleted message adds 1 to a member's score, which halves every "
+                    f"{config['violation_half_life'] // 60} minutes.\n"
+                    f"**Mute at:** {mute_at:g}\n**Kick at:** {f'{kick_at:g}' if kick_at is not None else 'Never'}",
+        color=0x00ff00
+    )
+    await ctx.send(embed=embed)
+
+@automod.command(name='antispam')
+async def set_anti_spam(ctx, state: str, messages: Optional[int] = None, seconds: Optional[int] = None):
+    """Toggle spam detection and set its message rate"""
+    config = load_automod_config(ctx.guild.id)
+    state = state.lower()
+    if state not in ('on', 'off'):
+        await ctx.send("Use `!automod antispam on [messages] [seconds]` or `!automod antispam off`.")
+        return
+    
+    if messages is not None and not 2 <= messages <= 50:
+        await ctx.send("Messages must be between 2 and 50.")
+        return
+    if seconds is not None and not 1 <= seconds <= 120:
+        await ctx.send("Seconds must be between 1 and 120.")
+        return
+    
+    config['anti_spam'] = state == 'on'
+    if messages is not None:
+        config['spam_messages'] = messages
+    if seconds is not None:
+        config['spam_seconds'] = seconds
+    save_automod_config(ctx.guild.id, config)
+    
+    if config['anti_spam']:
+        description = f"Members sending {config['spam_messages']} messages within {config['spam_seconds']} seconds will be punished."
+    else:
+        description = "Spam detection has been disabled."
+    embed = discord.Embed(
+        title="Anti-Spam Updated",
+        description=description,
+        color=0x00ff00
+    )
+    await ctx.send(embed=embed)
+
+@automod.command(name='antiraid')
+async def set_anti_raid(ctx, state: str, joins: Optional[int] = None, seconds: Optional[int] = None):
+    """Toggle raid detection and set its join rate"""
+    config = load_automod_config(ctx.guild.id)
+    state = state.lower()
+    if state not in ('on', 'off'):
+        await ctx.send("Use `!automod antiraid on [joins] [seconds]` or `!automod antiraid off`.")
+        return
+    
+    if joins is not None and not 3 <= joins <= 500:
+        await ctx.send("Joins must be between 3 and 500.")
+        return
+    if seconds is not None and not 5 <= seconds <= 600:
+        await ctx.send("Seconds must be between 5 and 600.")
+        return
+    
+    config['anti_raid'] = state == 'on'
+    if joins is not None:
+        config['raid_joins'] = joins
+    if seconds is not None:
+        config['raid_seconds'] = seconds
+    save_automod_config(ctx.guild.id, config)
+    
+    if config['anti_raid']:
+        description = (f"Raid mode starts when {config['raid_joins']} members join within {config['raid_seconds']} seconds.\n"
+                       f"New accounts joining during a raid will be {RAID_ACTIONS[config['raid_action']]}.")
+    else:
+        description = "Raid detection has been disabled."
+    embed = discord.Embed(
+        title="Anti-Raid Updated",
+        description=description,
+        color=0x00ff00
+    )
+    await ctx.send(embed=embed)
+
+@automod.command(name='antiduplicate')
+async def set_anti_duplicate(ctx, state: str, messages: Optional[int] = None, seconds: Optional[int] = None):
+    """Toggle near-duplicate flood detection"""
+    config = load_automod_config(ctx.guild.id)
+    state = state.lower()
+    if state not in ('on', 'off'):
+        await ctx.send("Use `!automod antiduplicate on [messages] [seconds]` or `!automod antiduplicate off`.")
+        return
+    
+    if messages is not None and not 2 <= messages <= 20:
+        await ctx.send("Messages must be between 2 and 20.")
+        return
+    if seconds is not None and not 5 <= seconds <= 300:
+        await ctx.send("Seconds must be between 5 and 300.")
+        return
+    
+    config['anti_duplicates'] = state == 'on'
+    if messages is not None:
+        config['duplicate_messages'] = messages
+    if seconds is not None:
+        config['duplicate_seconds'] = seconds
+    save_automod_config(ctx.guild.id, config)
+    
+    if config['anti_duplicates']:
+        description = (f"Messages will be removed once {config['duplicate_messages']} near-identical messages "
+                       f"are sent in a channel within {config['duplicate_seconds']} seconds.")
+    else:
+        description = "Duplicate message detection has been disabled."
+    embed = discord.Embed(
+        title="Anti-Duplicate Updated",
+        description=description,
+        color=0x00ff00
+    )
+    await ctx.send(embed=embed)
+
+@automod.group(name='regex', invoke_without_command=True)
+async def regex_rules(ctx):
+    """Manage custom regex rules"""
+    await ctx.send("Use `!automod regex add <name> <pattern>`, `!automod regex remove <name>`, "
+                   "`!automod regex enable <name>` or `!automod regex list`.")
+
+@regex_rules.command(name='add')
+async def add_regex_rule(ctx, name: str, *, pattern: str):
+    """Add a regex rule"""
+    config = load_automod_config(ctx.guild.id)
+    if any(rule['name'] == name.lower() for rule in config['regex_rules']):
+        await ctx.send(f"A rule named `{name}` already exists.")
+        return
+    if len(config['regex_rules']) >= REGEX_MAX_RULES:
+        await ctx.send(f"This server already has the maximum of {REGEX_MAX_RULES} regex rules.")
+        return
+    
+    error = await validate_regex_rule(pattern)
+    if error:
+        await ctx.send(error)
+        return
+    
+    config['regex_rules'].append({'name': name.lower(), 'pattern': pattern, 'enabled': True, 'timeouts': 0})
+    save_automod_config(ctx.guild.id, config)
+    await ctx.send(f"Added regex rule `{name.lower()}`.")
+
+@regex_rules.command(name='remove')
+async def remove_regex_rule(ctx, name: str):
+    """Remove a regex rule"""
+    config = load_automod_config(ctx.guild.id)
+    remaining = [rule for rule in config['regex_rules'] if rule['name'] != name.lower()]
+    if len(remaining) == len(config['regex_rules']):
+        await ctx.send(f"There is no rule named `{name}`.")
+        return
+    
+    config['regex_rules'] = remaining
+    save_automod_config(ctx.guild.id, config)
+    await ctx.send(f"Removed regex rule `{name.lower()}`.")
+
+@regex_rules.command(name='enable')
+async def enable_regex_rule(ctx, name: str):
+    """Re-enable a regex rule that was disabled after timing out"""
+    config = load_automod_config(ctx.guild.id)
+    for rule in config['regex_rules']:
+        if rule['name'] == name.lower():
+            rule['enabled'] = True
+            rule['timeouts'] = 0
+            save_automod_config(ctx.guild.id, config)
+            await ctx.send(f"Enabled regex rule `{rule['name']}`.")
+            return
+    await ctx.send(f"There is no rule named `{name}`.")
+
+@regex_rules.command(name='list')
+async def list_regex_rules(ctx):
+    """List regex rules"""
+    config = load_automod_config(ctx.guild.id)
+    if not config['regex_rules']:
+        await ctx.send("This server has no regex rules.")
+        return
+    
+    embed = discord.Embed(
+        title="Regex Rules",
+        color=0x00ff00
+    )
+    for rule in config['regex_rules']:
+        status = "Enabled" if rule['enabled'] else "Disabled (timed out)"
+        embed.add_field(name=f"{rule['name']} - {status}", value=f"`{rule['pattern']}`", inline=False)
+    await ctx.send(embed=embed)
+
+@automod.command(name='raidaction')
+async def set_raid_action(ctx, action: str, account_age_days: Optional[int] = None):
+    """Choose whether new accounts are kicked or held during a raid"""
+    config = load_automod_config(ctx.guild.id)
+    action = action.lower()
+    if action not in ('kick', 'queue'):
+        await ctx.send("Raid action must be `kick` or `queue`.")
+        return
+    
+    config['raid_action'] = action
+    if account_age_days is not None:
+        config['raid_account_age'] = max(0, account_age_days)
+    save_automod_config(ctx.guild.id, config)
+    await ctx.send(f"Accounts younger than {config['raid_account_age']} days joining during a raid will be {RAID_ACTIONS[action]}.")
+
+@automod.command(name='raidend')
+async def end_raid(ctx):
+    """End raid mode and release held members"""
+    if not raid_detector.in_raid(ctx.guild.id):
+        await ctx.send("This server is not in raid mode.")
+        return
+    
+    # watch_raid notices the raid is over and releases the queue
+    raid_detector.end_raid(ctx.guild.id)
+    await ctx.send("Raid mode ended. Held members will receive their autoroles shortly.")
+
 # UTILITY FUNCTIONS
-async def create_mute_role(guild):
-    """Create a mute role with proper permissions"""
+# Mute role overwrites are applied a few channels at a time, categories first
+# so channels created in a category later inherit them. Channels that already
+# carry the overwrite are skipped, so running again resumes after failures.
+MUTE_OVERWRITE = {'send_messages': False, 'speak': False, 'add_reactions': False}
+MUTE_PROVISION_CONCURRENCY = 5
+MUTE_PROVISION_REPORT_SECONDS = 5
+
+class MuteRoleProvisioner:
+    """Applies a guild's mute role overwrites to its channels"""
+
+    def __init__(self):
+        self.running = {}  # guild_id -> provisioning task
+        self.failed = {}  # guild_id -> ids of channels whose last attempt failed
+
+    @staticmethod
+    def needs(channel, role):
+        overwrite = channel.overwrites_for(role)
+        return any(getattr(overwrite, name) is not value for name, value in MUTE_OVERWRITE.items())
+
+    def start(self, guild, role, report_channel=None):
+        """Provision in the background unless the guild already is"""
+        task = self.running.get(guild.id)
+        if task is None or task.done():
+            task = self.running[guild.id] = bot.loop.create_task(self.provision(guild, role, report_channel))
+        return task
+
+    async def provision(self, guild, role, report_channel=None):
+        """Overwrite the role's permissions in every channel that lacks them, returning (done, failed)"""
+        # Categories go first, in full, so their channels can inherit from them.
+        # Channels synced with their category take its overwrites and are skipped
+        categories = [category for category in guild.categories if self.needs(category, role)]
+        channels = [
+            channel for channel in guild.channels
+            if not isinstance(channel, discord.CategoryChannel) and not channel.permissions_synced
+            and self.needs(channel, role)
+        ]
+        todo = categories + channels
+        done = 0
+        failed = set()
+        
+        async def worker(pending):
+            nonlocal done
+            for channel in pending:
+                if not self.needs(channel, role):
+                    done += 1  # Set up by prepare() for a mute meanwhile
+                    continue
+                try:
+                    await rest.call(LANE_MODERATION, ('channels', channel.id), channel.set_permissions,
+                                    role, reason="Mute role setup", **MUTE_OVERWRITE)
+                    done += 1
+                except Exception as e:
+                    # One bad channel must not stop the worker and strand the rest
+                    if not isinstance(e, discord.HTTPException):
+                        print(f"Failed to set up the mute role in {channel.id}: {e}")
+                    failed.add(channel.id)
+        
+        progress = None
+        if report_channel and todo:
+            try:
+                progress = await rest.call(LANE_MODERATION, ('send', report_channel.id), report_channel.send,
+                                           f"Setting up {role.mention} in {len(todo)} channels...")
+            except discord.HTTPException:
+                pass
+        
+        async def run():
+            for phase in (categories, channels):
+                pending = iter(phase)
+                await asyncio.gather(*(worker(pending) for _ in range(MUTE_PROVISION_CONCURRENCY)))
+        
+        workers = asyncio.ensure_future(run())
+        while not workers.done():
+            await asyncio.wait({workers}, timeout=MUTE_PROVISION_REPORT_SECONDS)
+            if progress and not workers.done():
+                try:
+                    await rest.call(LANE_LOG, ('edit', progress.channel.id), progress.edit,
+                                    content=f"Setting up {role.mention}: {done + len(failed)}/{len(todo)} channels...")
+                except discord.HTTPException:
+                    pass
+        
+        if failed:
+            self.failed[guild.id] = failed
+        else:
+            self.failed.pop(guild.id, None)
+        summary = f"{role.mention} is set up in {done}/{len(todo)} channels that needed it."
+        if failed:
+            summary += f" {len(failed)} failed and will be retried on the next mute."
+        if progress:
+            try:
+                await rest.call(LANE_MODERATION, ('edit', progress.channel.id), progress.edit, content=summary)
+            except discord.HTTPException:
+                pass
+        if failed:
+            await log_action(guild, f"**Mute role:** Could not set up {role.mention} in {len(failed)} channels")
+        return done, len(failed)
+
+    def in_progress(self, guild_id):
+        task = self.running.get(guild_id)
+        return task is not None and not task.done()
+
+    async def prepare(self, guild, role, channel):
+        """Set up the categories and the given channel right away, ahead of the background run
+
+        Returns False if any of them could not be set up.
+        """
+        phases = [[category for category in guild.categories if self.needs(category, role)]]
+        if not channel.permissions_synced and self.needs(channel, role):
+            phases.append([channel])
+        for targets in phases:
+            results = await asyncio.gather(*(
+                rest.call(LANE_MODERATION, ('channels', target.id), target.set_permissions,
+                          role, reason="Mute role setup", **MUTE_OVERWRITE)
+                for target in targets
+            ), return_exceptions=True)
+            if any(isinstance(result, Exception) for result in results):
+                return False
+        return True
+
+mute_provisioner = MuteRoleProvisioner()
+
+async def create_mute_role(guild, report_channel=None):
+    """Create a mute role and start setting up its channel overwrites, None if creation fails"""
     try:
-        mute_role = await guild.create_role(
+        mute_role = await rest.call(
+            LANE_MODERATION, ('roles', guild.id), guild.create_role,
             name="Muted",
             color=discord.Color(0x818386),
             reason="Auto-created mute role"
         )
-        
-        for channel in guild.channels:
-            try:
-                await channel.set_permissions(mute_role, send_messages=False, speak=False, add_reactions=False)
-            except:
-                pass
-        
-        return mute_role
-    except:
+    except discord.HTTPException as e:
+        print(f"Failed to create a mute role in {guild.id}: {e}")
         return None
+    
+    mute_provisioner.start(guild, mute_role, report_channel)
+    return mute_role
 
-def parse_duration(duration_str):
-    """Parse duration string (e.g., '1h', '30m', '1d')"""
+@bot.event
+async def on_guild_channel_create(channel):
+    """Give new channels the mute role's overwrites unless their category already did"""
+    config = await guild_configs.load_async(channel.guild.id)
+    role = channel.guild.get_role(config.mute_role) if config.mute_role else None
+    if role and mute_provisioner.needs(channel, role):
+        try:
+            await rest.call(LANE_MODERATION, ('channels', channel.id), channel.set_permissions,
+                            role, reason="Mute role setup", **MUTE_OVERWRITE)
+        except discord.HTTPException:
+            mute_provisioner.failed.setdefault(channel.guild.id, set()).add(channel.id)
+
+def parse_duration_seconds(duration_str):
+    """Parse duration string (e.g., '1h', '30m', '1d') into seconds"""
     duration_regex = re.match(r'(\d+)([smhd])', duration_str.lower())
     if not duration_regex:
         return None
@@ -665,48 +2725,316 @@ def parse_duration(duration_str):
     else:
         return None
     
+    return seconds
+
+def parse_duration(duration_str):
+    """Parse duration string (e.g., '1h', '30m', '1d') into the time it ends"""
+    seconds = parse_duration_seconds(duration_str)
+    if seconds is None:
+        return None
     return datetime.datetime.now() + datetime.timedelta(seconds=seconds)
 
+# LOG SINK
+# Log events are queued per guild and sent in packed messages: events share an
+# embed's description up to its limit, and a message carries up to 10 embeds
+# within Discord's per-message character limit. A guild's queue is sent once a
+# full message is waiting or LOG_FLUSH_DELAY after its oldest event.
+LOG_FLUSH_DELAY = 2.0  # seconds
+LOG_QUEUE_MAX = 1000  # events waiting per guild before new ones are dropped
+LOG_EMBED_CHARS = 4096
+LOG_MESSAGE_CHARS = 6000
+LOG_MESSAGE_EMBEDS = 10
+LOG_SEPARATOR = "\n\n"
+
+class LogQueue:
+    __slots__ = ('events', 'chars', 'wakeup', 'sender')
+
+    def __init__(self):
+        self.events = deque()  # (created, text)
+        self.chars = 0
+        self.wakeup = asyncio.Event()
+        self.sender = None  # the _drain task, held here so it isn't collected mid-wait
+
+class LogSink:
+    """Per-guild log queues drained by one sender task each"""
+
+    def __init__(self):
+        self.queues = {}  # guild_id -> LogQueue, only while it has a sender
+        self.dropped = 0
+        self.sent_events = 0
+        self.sent_messages = 0
+
+    @property
+    def depth(self):
+        return sum(len(queue.events) for queue in self.queues.values())
+
+    def push(self, guild, text):
+        text = text if len(text) <= LOG_EMBED_CHARS else text[:LOG_EMBED_CHARS - 3] + "..."
+        queue = self.queues.get(guild.id)
+        if queue is None:
+            queue = self.queues[guild.id] = LogQueue()
+            queue.sender = bot.loop.create_task(self._drain(guild, queue))
+        if len(queue.events) >= LOG_QUEUE_MAX:
+            self.dropped += 1
+            return
+        queue.events.append((datetime.datetime.now(), text))
+        queue.chars += len(text) + len(LOG_SEPARATOR)
+        if queue.chars >= LOG_MESSAGE_CHARS:
+            queue.wakeup.set()
+
+    async def _drain(self, guild, queue):
+        try:
+            while queue.events:
+                if queue.chars < LOG_MESSAGE_CHARS:
+                    try:
+                        await asyncio.wait_for(queue.wakeup.wait(), LOG_FLUSH_DELAY)
+                    except asyncio.TimeoutError:
+                        pass
+                queue.wakeup.clear()
+                config = await guild_configs.load_async(guild.id)
+                channel = guild.get_channel(config.log_channel) if config.log_channel else None
+                if channel is None:
+                    self.dropped += len(queue.events)
+                    break
+                count, embeds = self._pack(queue)
+                try:
+                    await rest.call(LANE_LOG, ('send', channel.id), channel.send, embeds=embeds)
+                    self.sent_events += count
+                    self.sent_messages += 1
+                except discord.HTTPException:
+                    self.dropped += count  # Missing access, or the channel was deleted
+        finally:
+            del self.queues[guild.id]
+
+    def _pack(self, queue):
+        """Take as many events off the queue as fit in one message"""
+        embeds = []
+        lines, created, length, total, count = [], None, 0, 0, 0
+        while queue.events:
+            event_created, text = queue.events[0]
+            added = len(text) + (len(LOG_SEPARATOR) if lines else 0)
+            if lines and length + added > LOG_EMBED_CHARS:
+                if len(embeds) + 1 == LOG_MESSAGE_EMBEDS:
+                    break
+                embeds.append(self._embed(lines, created))
+                lines, length, added = [], 0, len(text)
+            if total + added > LOG_MESSAGE_CHARS:
+                break
+            queue.events.popleft()
+            queue.chars -= len(text) + len(LOG_SEPARATOR)
+            if not lines:
+                created = event_created
+            lines.append(text)
+            length += added
+            total += added
+            count += 1
+        if lines:
+            embeds.append(self._embed(lines, created))
+        return count, embeds
+
+    @staticmethod
+    def _embed(lines, created):
+        return discord.Embed(
+            description=LOG_SEPARATOR.join(lines),
+            timestamp=created,
+            color=0x00ff00
+        )
+
+log_sink = LogSink()
+
 async def log_action(guild, message):
-    """Log an action to the log channel"""
-    config = load_guild_config(guild.id)
-    if config['log_channel']:
-        channel = guild.get_channel(config['log_channel'])
-        if channel:
-            embed = discord.Embed(
-                description=message,
-                timestamp=datetime.datetime.now(),
-                color=0x00ff00
-            )
+    """Queue an action for the log channel's next batch"""
+    config = await guild_configs.load_async(guild.id)
+    if config.log_channel:
+        log_sink.push(guild, message)
+
+# MUTE EXPIRY
+MUTE_RECONCILE_CONCURRENCY = 5  # role removals in flight while reconciling
+MUTE_RECONCILE_BATCH = 500  # guild configs read per backend call while reconciling
+MUTE_RETRY_DELAY = 30  # seconds before the first retry of a failed unmute, doubled each time
+MUTE_RETRY_MAX_DELAY = 3600
+MUTE_EXPIRE_ATTEMPTS = 10
+
+class MuteScheduler:
+    """Mute records keyed by (guild, user), expired from a heap of deadlines"""
+
+    def __init__(self):
+        self.mutes = {}  # guild_id -> user_id -> MuteRecord
+        # (expires_at, guild_id, user_id); cancelled or replaced entries stay
+        # until they reach the top and are skipped there
+        self._heap = []
+        self._stale = 0
+        self._wakeup = asyncio.Event()
+        self._expiring = set()  # (guild_id, user_id) whose role removal is in flight
+        self._retries = {}  # (guild_id, user_id) -> (failed attempts, retry deadline in the heap)
+        self._task = None
+
+    def get(self, guild_id, user_id):
+        return self.mutes.get(guild_id, {}).get(user_id)
+
+    def schedule(self, guild_id, user_id, role_id, expires_at=None):
+        """Record a mute, replacing any earlier one; expires_at None is permanent"""
+        previous = self.get(guild_id, user_id)
+        if previous is not None and previous.expires_at is not None:
+            self._stale += 1
+        self.mutes.setdefault(guild_id, {})[user_id] = MuteRecord(role_id, expires_at)
+        mark_dirty('mutes', guild_id, user_id)
+        if expires_at is not None:
+            self._push(expires_at, guild_id, user_id)
+
+    def _remove(self, guild_id, user_id):
+        self._retries.pop((guild_id, user_id), None)
+        members = self.mutes.get(guild_id, {})
+        record = members.pop(user_id, None)
+        if record is not None:
+            if not members:
+                del self.mutes[guild_id]
+            mark_dirty('mutes', guild_id, user_id)
+        return record
+
+    def cancel(self, guild_id, user_id):
+        """Drop a mute record, as when a moderator unmutes early"""
+        record = self._remove(guild_id, user_id)
+        if record is not None and record.expires_at is not None:
+            self._stale += 1
+            if self._stale > 1024 and self._stale > len(self._heap) // 2:
+                self._rebuild()
+        return record
+
+    def _push(self, expires_at, guild_id, user_id):
+        heapq.heappush(self._heap, (expires_at, guild_id, user_id))
+        if self._heap[0] == (expires_at, guild_id, user_id):
+            # New earliest deadline; the runner recomputes its sleep
+            self._wakeup.set()
+
+    def _rebuild(self):
+        # Processes sharing a backend load every mute; each expires only its own guilds'
+        self._heap = [
+            (record.expires_at, guild_id, user_id)
+            for guild_id, members in self.mutes.items() if bot.get_guild(guild_id) is not None
+            for user_id, record in members.items()
+            if record.expires_at is not None
+        ]
+        self._heap.extend((retry_at, guild_id, user_id) for (guild_id, user_id), (_, retry_at) in self._retries.items())
+        heapq.heapify(self._heap)
+        self._stale = 0
+
+    def start(self):
+        """Start expiring the loaded records once connected, when the guilds this process holds are known"""
+        if self._task is None:
+            self._task = bot.loop.create_task(self._run())
+
+    async def _run(self):
+        await bot.wait_until_ready()
+        # Mutes that lapsed while offline are expired by the reconcile
+        try:
+            await self.reconcile()
+        except Exception as e:
+            print(f'Mute reconcile failed: {e}')
+        self._rebuild()
+        while True:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, guild_id, user_id = heapq.heappop(self._heap)
+                record = self.get(guild_id, user_id)
+                retry = self._retries.get((guild_id, user_id))
+                # A pending retry supersedes the original deadline
+                if record is None or deadline != (retry[1] if retry else record.expires_at):
+                    self._stale = max(0, self._stale - 1)
+                    continue
+                await self._expire(guild_id, user_id, record)
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
             try:
-                await channel.send(embed=embed)
-            except:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
                 pass
 
-@tasks.loop(minutes=1)
-async def automod_check():
-    """Check for expired mutes"""
-    current_time = datetime.datetime.now()
-    to_unmute = []
-    
-    for user_id, mute_data in muted_users.items():
-        if mute_data['unmute_time'] <= current_time:
-            to_unmute.append(user_id)
-    
-    for user_id in to_unmute:
-        mute_data = muted_users[user_id]
-        guild = bot.get_guild(mute_data['guild_id'])
-        if guild:
-            member = guild.get_member(user_id)
-            role = guild.get_role(mute_data['role_id'])
-            if member and role:
-                try:
-                    await member.remove_roles(role, reason="Mute expired")
-                    await log_action(guild, f"**{member}** was automatically unmuted (mute expired)")
-                except:
-                    pass
-        
-        del muted_users[user_id]
+    async def _expire(self, guild_id, user_id, record):
+        """Lift a lapsed mute; the record is only dropped once the role is off or can't be removed"""
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            # Held by another process sharing the backend, which lifts the mute
+            # and drops the row; this one must not delete it from under it
+            return
+        member = guild.get_member(user_id)
+        role = guild.get_role(record.role_id)
+        if member and role:
+            self._expiring.add((guild_id, user_id))
+            try:
+                await rest.call(LANE_MODERATION, ('members', guild_id), member.remove_roles, role, reason="Mute expired")
+            except Exception as e:
+                if self._retry(guild_id, user_id, record):
+                    return
+                await log_action(guild, f"Could not automatically unmute **{member}** after {MUTE_EXPIRE_ATTEMPTS} attempts: {e}")
+            else:
+                await log_action(guild, f"**{member}** was automatically unmuted (mute expired)")
+            finally:
+                self._expiring.discard((guild_id, user_id))
+        # Replaced or cancelled while the removal was in flight
+        if self.get(guild_id, user_id) is record:
+            self._remove(guild_id, user_id)
+
+    def _retry(self, guild_id, user_id, record):
+        """Schedule another unmute attempt with backoff; False once the attempts run out"""
+        if self.get(guild_id, user_id) is not record:
+            return False
+        attempts, _ = self._retries.get((guild_id, user_id), (0, None))
+        if attempts + 1 >= MUTE_EXPIRE_ATTEMPTS:
+            return False
+        retry_at = time.time() + min(MUTE_RETRY_DELAY * 2 ** attempts, MUTE_RETRY_MAX_DELAY)
+        self._retries[(guild_id, user_id)] = (attempts + 1, retry_at)
+        self._push(retry_at, guild_id, user_id)
+        return True
+
+    async def reconcile(self):
+        """Match the mute records against each guild's mute role holders after connecting
+
+        Holders without a record were muted while the bot was away and are
+        tracked as permanent mutes. Records of members who no longer hold the
+        role are dropped, and lapsed mutes are lifted a few at a time. The
+        cache is still cold at on_ready, so every guild's config is read, in
+        batches that don't enter the cache, and guilds without a mute role
+        are skipped. The scheduler runs it once, on the first connect.
+        """
+        now = time.time()
+        lapsed = []
+        adopted = dropped = 0
+        guilds = list(bot.guilds)
+        for start in range(0, len(guilds), MUTE_RECONCILE_BATCH):
+            batch = guilds[start:start + MUTE_RECONCILE_BATCH]
+            configs = await guild_configs.peek_many_async([guild.id for guild in batch])
+            for guild in batch:
+                config = configs[guild.id]
+                role = guild.get_role(config.mute_role) if config.mute_role else None
+                if role is None:
+                    continue
+                holders = {member.id for member in role.members}
+                records = self.mutes.get(guild.id, {})
+                untracked = holders.difference(records)
+                for user_id, record in list(records.items()):
+                    if user_id in holders:
+                        if record.expires_at is not None and record.expires_at <= now:
+                            lapsed.append((guild.id, user_id, record))
+                    elif guild.get_member(user_id) is not None:
+                        # Unmuted by hand; members who left keep their record
+                        self.cancel(guild.id, user_id)
+                        dropped += 1
+                for user_id in untracked:
+                    if (guild.id, user_id) not in self._expiring:
+                        self.schedule(guild.id, user_id, role.id)
+                        adopted += 1
+
+        pending = iter(lapsed)
+
+        async def worker():
+            for guild_id, user_id, record in pending:
+                await self._expire(guild_id, user_id, record)
+
+        await asyncio.gather(*(worker() for _ in range(MUTE_RECONCILE_CONCURRENCY)))
+        print(f'Reconciled mutes: {len(lapsed)} lapsed, {adopted} untracked, {dropped} stale')
+
+mute_scheduler = MuteScheduler()
 
 # FUN COMMANDS
 @bot.command(name='8ball')
@@ -781,7 +3109,9 @@ async def help_command(ctx, category: str = None):
                        "**!mute <user> [duration] [reason]** - Mute a member\n"
                        "**!unmute <user> [reason]** - Unmute a member\n"
                        "**!warn <user> [reason]** - Warn a member\n"
-                       "**!warnings [user]** - Show warnings\n"
+                       "**!warnings [user] [before_id]** - Show warnings, 10 at a time\n"
+                       "**!delwarn <user> <id>** - Delete a warning\n"
+                       "**!clearwarns <user>** - Delete all of a member's warnings\n"
                        "**!clear [amount]** - Clear messages",
             color=0xff9500
         )
@@ -792,7 +3122,11 @@ async def help_command(ctx, category: str = None):
                        "**!config log <channel>** - Set log channel\n"
                        "**!config welcome <channel> <message>** - Set welcome message\n"
                        "**!config leave <channel> <message>** - Set leave message\n"
-                       "**!config autorole <role>** - Add autorole",
+                       "**!config autorole <role>** - Add autorole\n"
+                       "**!config levelups <off|here|dm|channel|digest> [channel] [seconds]** - Set level-up announcements\n"
+                       "**!config muterole** - Apply the mute role to channels missing it\n"
+                       "**!data export** - Download this server's data\n"
+                       "**!data import** - Import an attached data export",
             color=0x0099ff
         )
     elif category == "automod":
@@ -802,7 +3136,19 @@ async def help_command(ctx, category: str = None):
                        "**!automod enable** - Enable AutoMod\n"
                        "**!automod disable** - Disable AutoMod\n"
                        "**!automod addword <word>** - Add filtered word\n"
-                       "**!automod removeword <word>** - Remove filtered word",
+                       "**!automod removeword <word>** - Remove filtered word\n"
+                       "**!automod links <on/off>** - Filter external links\n"
+                       "**!automod invites <on/off>** - Filter Discord invites\n"
+                       "**!automod maxmentions <number/off>** - Set mention limit\n"
+                       "**!automod maxemojis <number/off>** - Set emoji limit\n"
+                       "**!automod antispam <on/off> [messages] [seconds]** - Configure spam detection\n"
+                       "**!automod antiraid <on/off> [joins] [seconds]** - Configure raid detection\n"
+                       "**!automod raidaction <kick/queue> [account_age_days]** - Handle new accounts during raids\n"
+                       "**!automod raidend** - End raid mode\n"
+                       "**!automod antiduplicate <on/off> [messages] [seconds]** - Catch copy-paste floods\n"
+                       "**!automod regex <add/remove/enable/list>** - Manage custom regex rules\n"
+                       "**!automod punishment <warn/mute/kick/ban>** - Set base punishment\n"
+                       "**!automod escalation <mute_score/off> [kick_score/off] [half_life_minutes]** - Escalate repeat offenders",
             color=0xff0080
         )
     elif category == "roles":
@@ -818,7 +3164,11 @@ async def help_command(ctx, category: str = None):
             description="**!userinfo [user]** - Get user information\n"
                        "**!serverinfo** - Get server information\n"
                        "**!avatar [user]** - Get user's avatar\n"
-                       "**!ping** - Check bot latency",
+                       "**!ping** - Check bot latency\n"
+                       "**!remind <duration> <message>** - Set a reminder\n"
+                       "**!remind every <interval> <message>** - Set a recurring reminder\n"
+                       "**!reminders [list]** - List your reminders\n"
+                       "**!reminders cancel <id>** - Cancel a reminder",
             color=0x00ff80
         )
     elif category == "fun":
@@ -847,8 +3197,166 @@ async def ping(ctx):
     )
     await ctx.send(embed=embed)
 
-# LEVELING SYSTEM (Simple implementation)
-user_xp = {}
+@bot.command(name='botstats')
+@commands.is_owner()
+async def bot_stats(ctx):
+    """Show guild cache and storage statistics"""
+    embed = discord.Embed(
+        title="📊 Bot Stats",
+        description=f"Guilds: {len(bot.guilds)}",
+        color=0x00ff00
+    )
+    for cache in (guild_configs, automod_configs):
+        embed.add_field(
+            name=cache.namespace,
+            value=f"Resident: {len(cache)}/{cache.max_guilds}\n"
+                  f"Hit rate: {cache.hit_rate:.1%}\n"
+                  f"Evictions: {cache.evictions}",
+            inline=True
+        )
+    if storage is not None:
+        embed.add_field(
+            name="Storage",
+            value=f"Pending: {storage.pending}\nJournal: {storage.journal_bytes / 1024:.0f} KiB\n"
+                  f"Member data: {len(storage.loaded_guilds)} guilds",
+            inline=True
+        )
+    embed.add_field(
+        name="REST Lanes",
+        value="\n".join(
+            f"{name}: {rest.queued[lane]} queued, {rest.completed[lane]} done"
+            for lane, name in enumerate(LANE_NAMES)
+        ) + f"\nRate limited: {rest.rate_limited}",
+        inline=True
+    )
+    embed.add_field(
+        name="Joins",
+        value=f"Queued: {join_pipeline.queue.qsize() if join_pipeline.queue else 0}/{JOIN_QUEUE_MAX}\n"
+              f"Deferred: {join_pipeline.deferred}/{JOIN_OVERFLOW_MAX}\n"
+              f"Processed: {join_pipeline.processed}\n"
+              f"Dropped: {join_pipeline.dropped}"
+              + (f" ({join_pipeline.guild_drops.get(ctx.guild.id, 0)} here)" if ctx.guild else ""),
+        inline=True
+    )
+    embed.add_field(
+        name="Log Sink",
+        value=f"Queued: {log_sink.depth} in {len(log_sink.queues)} guilds\n"
+              f"Sent: {log_sink.sent_events} events in {log_sink.sent_messages} messages\n"
+              f"Dropped: {log_sink.dropped}",
+        inline=True
+    )
+    await ctx.send(embed=embed)
+
+# LEVELING SYSTEM (Simple implementation)
+# Level-ups are announced per the guild's levelup_mode. Channel announcements
+# are throttled per channel: level-ups inside the throttle, or inside a digest
+# window, wait in the channel's pending batch and go out as one message.
+LEVELUP_MODES = ('off', 'here', 'dm', 'channel', 'digest')
+LEVELUP_CHANNEL_INTERVAL = 10  # seconds between announcements in one channel
+LEVELUP_DIGEST_LINES = 20  # members listed by name in one announcement
+LEVELUP_GUILD_DMS = 5  # level-up DMs one guild sends per LEVELUP_CHANNEL_INTERVAL
+
+user_xp = {}
+
+class LevelUpAnnouncer:
+    """Sends level-up announcements, batching those that arrive close together"""
+
+    def __init__(self):
+        self.pending = {}  # channel_id -> {member_id: (mention, level)}
+        self.pending_dms = {}  # guild_id -> {member_id: (member, level)}
+        # channel_id, or guild_id for DMs -> monotonic time of the last announcement
+        self.last_sent = {}
+        self._tasks = set()
+
+    def _spawn(self, coro):
+        task = bot.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _delay(self, target_id):
+        return max(0, self.last_sent.get(target_id, 0) + LEVELUP_CHANNEL_INTERVAL - time.monotonic())
+
+    def _mark_sent(self, target_id):
+        now = time.monotonic()
+        self.last_sent[target_id] = now
+        if len(self.last_sent) > 10000:
+            self.last_sent = {
+                target_id: sent for target_id, sent in self.last_sent.items()
+                if sent + LEVELUP_CHANNEL_INTERVAL > now
+            }
+
+    def announce(self, config, message, level):
+        mode = config.levelup_mode
+        if mode == 'off':
+            return
+        member = message.author
+        if mode == 'dm':
+            # DMs can't be merged, so each guild sends a few per interval
+            # and a member who levels again while waiting gets one DM
+            batch = self.pending_dms.get(message.guild.id)
+            if batch is None:
+                batch = self.pending_dms[message.guild.id] = {}
+                self._spawn(self._flush_dms_later(message.guild, self._delay(message.guild.id)))
+            batch[member.id] = (member, level)
+            return
+        
+        channel = message.channel
+        if mode != 'here' and config.levelup_channel:
+            channel = message.guild.get_channel(config.levelup_channel) or channel
+        
+        batch = self.pending.get(channel.id)
+        if batch is None:
+            delay = self._delay(channel.id)
+            if mode == 'digest':
+                delay = max(delay, config.levelup_window)
+            batch = self.pending[channel.id] = {}
+            self._spawn(self._flush_later(channel, delay))
+        batch[member.id] = (member.mention, level)
+
+    async def _flush_dms_later(self, guild, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        batch = self.pending_dms.pop(guild.id)
+        self._mark_sent(guild.id)
+        members = list(batch.values())
+        for member, level in members[:LEVELUP_GUILD_DMS]:
+            embed = discord.Embed(
+                title="🎉 Level Up!",
+                description=f"You reached level {level} in **{guild.name}**!",
+                color=0x00ff00
+            )
+            self._spawn(self._send(('dm', member.id), member, embed))
+        if len(members) > LEVELUP_GUILD_DMS:
+            # The rest go out next interval, ahead of members who level up meanwhile
+            waiting = self.pending_dms[guild.id] = {}
+            self._spawn(self._flush_dms_later(guild, LEVELUP_CHANNEL_INTERVAL))
+            for member, level in members[LEVELUP_GUILD_DMS:]:
+                waiting[member.id] = (member, level)
+
+    async def _flush_later(self, channel, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        batch = self.pending.pop(channel.id)
+        self._mark_sent(channel.id)
+        
+        lines = [f"{mention} reached level {level}!" for mention, level in batch.values()]
+        if len(lines) > LEVELUP_DIGEST_LINES:
+            more = len(lines) - LEVELUP_DIGEST_LINES
+            lines = lines[:LEVELUP_DIGEST_LINES] + [f"...and {more} more"]
+        embed = discord.Embed(
+            title="🎉 Level Up!" if len(batch) == 1 else "🎉 Level Ups!",
+            description="\n".join(lines),
+            color=0x00ff00
+        )
+        await self._send(('send', channel.id), channel, embed)
+
+    async def _send(self, route, target, embed):
+        try:
+            await rest.call(LANE_USER, route, target.send, embed=embed)
+        except discord.HTTPException:
+            pass  # DMs closed, or no access to the channel
+
+levelup_announcer = LevelUpAnnouncer()
 
 @bot.event
 async def on_message_xp(message):
@@ -863,27 +3371,20 @@ async def on_message_xp(message):
         user_xp[guild_id] = {}
     
     if user_id not in user_xp[guild_id]:
-        user_xp[guild_id][user_id] = {'xp': 0, 'level': 1}
+        user_xp[guild_id][user_id] = XPRecord()
     
     # Award 1-3 XP per message (random)
-    xp_gain = random.randint(1, 3)
-    user_xp[guild_id][user_id]['xp'] += xp_gain
+    record = user_xp[guild_id][user_id]
+    record.xp += random.randint(1, 3)
+    mark_dirty('user_xp', guild_id, user_id)
     
     # Check for level up
-    current_xp = user_xp[guild_id][user_id]['xp']
-    current_level = user_xp[guild_id][user_id]['level']
-    xp_needed = current_level * 100  # 100 XP per level
+    xp_needed = record.level * 100  # 100 XP per level
     
-    if current_xp >= xp_needed:
-        user_xp[guild_id][user_id]['level'] += 1
-        user_xp[guild_id][user_id]['xp'] = current_xp - xp_needed
-        
-        embed = discord.Embed(
-            title="🎉 Level Up!",
-            description=f"{message.author.mention} reached level {user_xp[guild_id][user_id]['level']}!",
-            color=0x00ff00
-        )
-        await message.channel.send(embed=embed)
+    if record.xp >= xp_needed:
+        record.level += 1
+        record.xp -= xp_needed
+        levelup_announcer.announce(load_guild_config(guild_id), message, record.level)
 
 @bot.command(name='level', aliases=['lvl'])
 async def check_level(ctx, member: Optional[discord.Member] = None):
@@ -904,8 +3405,8 @@ async def check_level(ctx, member: Optional[discord.Member] = None):
         return
     
     user_data = user_xp[guild_id][user_id]
-    level = user_data['level']
-    xp = user_data['xp']
+    level = user_data.level
+    xp = user_data.xp
     xp_needed = level * 100
     
     embed = discord.Embed(
@@ -936,7 +3437,7 @@ async def leaderboard(ctx):
     # Sort users by level, then by XP
     sorted_users = sorted(
         user_xp[guild_id].items(),
-        key=lambda x: (x[1]['level'], x[1]['xp']),
+        key=lambda x: (x[1].level, x[1].xp),
         reverse=True
     )
     
@@ -950,7 +3451,7 @@ async def leaderboard(ctx):
         if user:
             embed.add_field(
                 name=f"{i}. {user}",
-                value=f"Level {data['level']} ({data['xp']} XP)",
+                value=f"Level {data.level} ({data.xp} XP)",
                 inline=False
             )
     
@@ -965,12 +3466,7 @@ def get_user_economy(guild_id, user_id):
         user_economy[guild_id] = {}
     
     if user_id not in user_economy[guild_id]:
-        user_economy[guild_id][user_id] = {
-            'coins': 100,  # Starting coins
-            'bank': 0,
-            'last_daily': None,
-            'last_work': None
-        }
+        user_economy[guild_id][user_id] = EconomyRecord()
     
     return user_economy[guild_id][user_id]
 
@@ -987,9 +3483,9 @@ async def check_balance(ctx, member: Optional[discord.Member] = None):
         color=0x00ff00
     )
     embed.set_thumbnail(url=member.display_avatar.url)
-    embed.add_field(name="Wallet", value=f"{data['coins']:,} coins", inline=True)
-    embed.add_field(name="Bank", value=f"{data['bank']:,} coins", inline=True)
-    embed.add_field(name="Total", value=f"{data['coins'] + data['bank']:,} coins", inline=True)
+    embed.add_field(name="Wallet", value=f"{data.coins:,} coins", inline=True)
+    embed.add_field(name="Bank", value=f"{data.bank:,} coins", inline=True)
+    embed.add_field(name="Total", value=f"{data.coins + data.bank:,} coins", inline=True)
     
     await ctx.send(embed=embed)
 
@@ -997,13 +3493,12 @@ async def check_balance(ctx, member: Optional[discord.Member] = None):
 async def daily_reward(ctx):
     """Claim daily reward"""
     data = get_user_economy(ctx.guild.id, ctx.author.id)
-    now = datetime.datetime.now()
+    now = int(time.time())
     
-    if data['last_daily']:
-        last_daily = datetime.datetime.fromisoformat(data['last_daily'])
-        if (now - last_daily).days < 1:
-            time_left = last_daily + datetime.timedelta(days=1) - now
-            hours, remainder = divmod(int(time_left.total_seconds()), 3600)
+    if data.last_daily:
+        time_left = data.last_daily + 86400 - now
+        if time_left > 0:
+            hours, remainder = divmod(time_left, 3600)
             minutes, _ = divmod(remainder, 60)
             
             embed = discord.Embed(
@@ -1015,8 +3510,9 @@ async def daily_reward(ctx):
             return
     
     reward = random.randint(50, 200)
-    data['coins'] += reward
-    data['last_daily'] = now.isoformat()
+    data.coins += reward
+    data.last_daily = now
+    mark_dirty('user_economy', ctx.guild.id, ctx.author.id)
     
     embed = discord.Embed(
         title="🎁 Daily Reward",
@@ -1029,13 +3525,12 @@ async def daily_reward(ctx):
 async def work_command(ctx):
     """Work for coins"""
     data = get_user_economy(ctx.guild.id, ctx.author.id)
-    now = datetime.datetime.now()
+    now = int(time.time())
     
-    if data['last_work']:
-        last_work = datetime.datetime.fromisoformat(data['last_work'])
-        if (now - last_work).total_seconds() < 3600:  # 1 hour cooldown
-            time_left = last_work + datetime.timedelta(hours=1) - now
-            minutes, _ = divmod(int(time_left.total_seconds()), 60)
+    if data.last_work:
+        time_left = data.last_work + 3600 - now  # 1 hour cooldown
+        if time_left > 0:
+            minutes, _ = divmod(time_left, 60)
             
             embed = discord.Embed(
                 title="⏰ Work Cooldown",
@@ -1052,8 +3547,9 @@ async def work_command(ctx):
     
     job = random.choice(jobs)
     reward = random.randint(20, 80)
-    data['coins'] += reward
-    data['last_work'] = now.isoformat()
+    data.coins += reward
+    data.last_work = now
+    mark_dirty('user_economy', ctx.guild.id, ctx.author.id)
     
     embed = discord.Embed(
         title="💼 Work Complete",
@@ -1071,14 +3567,15 @@ async def gamble_coins(ctx, amount: int):
     
     data = get_user_economy(ctx.guild.id, ctx.author.id)
     
-    if amount > data['coins']:
+    if amount > data.coins:
         await ctx.send("You don't have enough coins!")
         return
     
     # 45% chance to win, 55% chance to lose
+    mark_dirty('user_economy', ctx.guild.id, ctx.author.id)
     if random.random() < 0.45:
         winnings = int(amount * 1.5)
-        data['coins'] += winnings - amount
+        data.coins += winnings - amount
         
         embed = discord.Embed(
             title="🎰 Jackpot!",
@@ -1086,7 +3583,7 @@ async def gamble_coins(ctx, amount: int):
             color=0x00ff00
         )
     else:
-        data['coins'] -= amount
+        data.coins -= amount
         
         embed = discord.Embed(
             title="💸 You Lost!",
@@ -1142,8 +3639,9 @@ async def create_ticket(ctx, *, reason="No reason provided"):
         category = guild.get_channel(ticket_categories[guild.id])
     
     if not category:
-        category = await guild.create_category("🎫 Support Tickets")
+        category = await rest.call(LANE_USER, ('channels', guild.id), guild.create_category, "🎫 Support Tickets")
         ticket_categories[guild.id] = category.id
+        mark_dirty('ticket_categories', guild.id)
     
     # Create ticket channel
     channel_name = f"ticket-{ctx.author.name.lower()}-{ctx.author.discriminator}"
@@ -1160,7 +3658,8 @@ async def create_ticket(ctx, *, reason="No reason provided"):
             overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
     
     try:
-        ticket_channel = await guild.create_text_channel(
+        ticket_channel = await rest.call(
+            LANE_USER, ('channels', guild.id), guild.create_text_channel,
             channel_name,
             category=category,
             overwrites=overwrites
@@ -1173,7 +3672,7 @@ async def create_ticket(ctx, *, reason="No reason provided"):
         )
         embed.add_field(name="Close Ticket", value="Use `!close` to close this ticket", inline=False)
         
-        await ticket_channel.send(f"{ctx.author.mention}", embed=embed)
+        await rest.call(LANE_USER, ('send', ticket_channel.id), ticket_channel.send, f"{ctx.author.mention}", embed=embed)
         await ctx.send(f"Ticket created: {ticket_channel.mention}")
         
     except Exception as e:
@@ -1194,7 +3693,7 @@ async def close_ticket(ctx):
     await ctx.send(embed=embed)
     
     await asyncio.sleep(10)
-    await ctx.channel.delete(reason="Ticket closed")
+    await rest.call(LANE_USER, ('channels', ctx.channel.id), ctx.channel.delete, reason="Ticket closed")
 
 # ERROR HANDLING
 @bot.event
@@ -1239,69 +3738,273 @@ async def on_command_error(ctx, error):
         await ctx.send(embed=embed)
 
 # REMINDER SYSTEM
-reminders = {}
+# Pending reminders sit on a hierarchical timing wheel: 1 second ticks and
+# four levels of 64 slots, so a reminder up to ~194 days out is inserted into
+# one slot in O(1) and moved down at most three times before it fires. Later
+# ones wait in an overflow list that is re-sorted onto the wheel every few days.
+WHEEL_BITS = 6
+WHEEL_SLOTS = 1 << WHEEL_BITS
+WHEEL_LEVELS = 4
+REMINDER_MIN_INTERVAL = 60  # shortest recurring reminder, in seconds
+REMINDER_MAX_RECURRING = 10  # recurring reminders one user can have
+REMINDER_SEND_CONCURRENCY = 10
+REMINDER_ID_BLOCK = 100  # ids reserved from the shared counter at a time
+
+reminders = {}  # reminder_id -> ReminderRecord
+
+class TimingWheel:
+    """Hierarchical timing wheel of (deadline, item) entries with 1 second ticks"""
+
+    def __init__(self, now):
+        self.current = int(now)  # next tick to process
+        self.levels = [[[] for _ in range(WHEEL_SLOTS)] for _ in range(WHEEL_LEVELS)]
+        self.overflow = []
+
+    def add(self, deadline, item):
+        deadline = max(int(deadline), self.current)
+        delta = deadline - self.current
+        for level in range(WHEEL_LEVELS):
+            if delta < 1 << (WHEEL_BITS * (level + 1)):
+                slot = (deadline >> (WHEEL_BITS * level)) & (WHEEL_SLOTS - 1)
+                self.levels[level][slot].append((deadline, item))
+                return
+        self.overflow.append((deadline, item))
+
+    def advance(self, now):
+        """Yield the items of every tick up to now, moving entries down as levels roll over"""
+        while self.current <= now:
+            tick = self.current
+            for level in range(WHEEL_LEVELS - 1, 0, -1):
+                if tick & ((1 << (WHEEL_BITS * level)) - 1) == 0:
+                    if level == WHEEL_LEVELS - 1 and self.overflow:
+                        # Swap first: entries still past the horizon are appended back onto overflow
+                        entries, self.overflow = self.overflow, []
+                        self._reinsert(entries)
+                    slots = self.levels[level]
+                    slot = (tick >> (WHEEL_BITS * level)) & (WHEEL_SLOTS - 1)
+                    entries, slots[slot] = slots[slot], []
+                    self._reinsert(entries)
+            slots = self.levels[0]
+            entries, slots[tick & (WHEEL_SLOTS - 1)] = slots[tick & (WHEEL_SLOTS - 1)], []
+            self.current += 1
+            for _, item in entries:
+                yield item
+
+    def _reinsert(self, entries):
+        for deadline, item in entries:
+            self.add(deadline, item)
+
+class ReminderEngine:
+    """Stores reminders under monotonic ids and delivers them from a timing wheel
+
+    Processes sharing a backend draw ids from one counter in blocks, and each
+    one delivers only the reminders of the guilds it holds.
+    """
+
+    def __init__(self):
+        self.next_id = 1
+        self.last_id = 0  # end of the reserved block of ids
+        self._id_lock = asyncio.Lock()
+        self.by_user = {}  # user_id -> set of reminder ids
+        self.wheel = TimingWheel(time.time())
+        self._task = None
+        self._due = None  # queue of reminders waiting for a sender
+        self._senders = []
+
+    async def _allocate_id(self):
+        async with self._id_lock:
+            if self.next_id > self.last_id:
+                if storage is not None:
+                    self.last_id = await storage.allocate_ids(REMINDER_ID_META, REMINDER_ID_BLOCK)
+                else:
+                    self.last_id = self.next_id + REMINDER_ID_BLOCK - 1
+                self.next_id = self.last_id - REMINDER_ID_BLOCK + 1
+            reminder_id = self.next_id
+            self.next_id += 1
+            return reminder_id
+
+    async def add(self, user_id, channel_id, guild_id, message, due_at, interval=None):
+        reminder_id = await self._allocate_id()
+        reminders[reminder_id] = ReminderRecord(user_id, channel_id, message, due_at, interval, guild_id)
+        self.by_user.setdefault(user_id, set()).add(reminder_id)
+        self.wheel.add(due_at, reminder_id)
+        mark_dirty('reminders', reminder_id)
+        return reminder_id
+
+    def cancel(self, reminder_id):
+        # The wheel entry stays behind and is skipped when its tick comes
+        reminder = reminders.pop(reminder_id, None)
+        if reminder is not None:
+            self._unindex(reminder_id, reminder)
+            mark_dirty('reminders', reminder_id)
+        return reminder
+
+    def recurring_count(self, user_id):
+        return sum(1 for i in self.by_user.get(user_id, ()) if reminders[i].interval)
+
+    def for_user(self, user_id):
+        """(id, reminder) pairs of a user, soonest first"""
+        ids = self.by_user.get(user_id, ())
+        return sorted(((i, reminders[i]) for i in ids), key=lambda item: item[1].due_at)
+
+    def _unindex(self, reminder_id, reminder):
+        ids = self.by_user.get(reminder.user_id)
+        if ids is not None:
+            ids.discard(reminder_id)
+            if not ids:
+                del self.by_user[reminder.user_id]
+
+    def _owns(self, reminder):
+        """Whether this process delivers a reminder"""
+        if reminder.guild_id == 0:
+            return bot.shard_id in (None, 0)  # Discord sends DMs to shard 0
+        return bot.get_guild(reminder.guild_id) is not None
+
+    def _index(self):
+        """Index the loaded reminders of this process's guilds and let go of the rest"""
+        self.wheel = TimingWheel(time.time())
+        self.by_user = {}
+        for reminder_id, reminder in list(reminders.items()):
+            if not self._owns(reminder):
+                # The row stays in the backend for the process that holds the guild
+                del reminders[reminder_id]
+                if storage is not None:
+                    storage.write_back('reminders', (reminder_id,), reminder)
+                continue
+            self.by_user.setdefault(reminder.user_id, set()).add(reminder_id)
+            self.wheel.add(reminder.due_at, reminder_id)
+
+    def start(self):
+        """Start delivering reminders once connected, when the guilds this process holds are known"""
+        if self._task is None:
+            self._due = asyncio.Queue()
+            self._senders = [bot.loop.create_task(self._send_due()) for _ in range(REMINDER_SEND_CONCURRENCY)]
+            self._task = bot.loop.create_task(self._run())
+
+    async def _run(self):
+        await bot.wait_until_ready()
+        self._index()
+        while True:
+            now = time.time()
+            for reminder_id in self.wheel.advance(int(now)):
+                self._fire(reminder_id, int(now))
+            await asyncio.sleep(self.wheel.current - time.time())
+
+    def _fire(self, reminder_id, now):
+        reminder = reminders.get(reminder_id)
+        if reminder is None or reminder.due_at > now:
+            return  # Cancelled, or rescheduled later and still on the wheel
+        # Queue the fields, not the record: a one-off record is dropped right below
+        self._due.put_nowait((reminder.user_id, reminder.channel_id, reminder.message))
+        if reminder.interval:
+            # Skip occurrences missed while the bot was down instead of sending them all
+            missed = (now - reminder.due_at) // reminder.interval + 1
+            reminder.due_at += missed * reminder.interval
+            self.wheel.add(reminder.due_at, reminder_id)
+            mark_dirty('reminders', reminder_id)
+        else:
+            self.cancel(reminder_id)
+
+    async def _send_due(self):
+        while True:
+            user_id, channel_id, message = await self._due.get()
+            user = bot.get_user(user_id)
+            channel = bot.get_channel(channel_id)
+            if user and channel:
+                embed = discord.Embed(
+                    title="⏰ Reminder",
+                    description=f"You asked me to remind you about: {message}",
+                    color=0x00ff00
+                )
+                try:
+                    await rest.call(LANE_USER, ('send', channel.id), channel.send, f"{user.mention}", embed=embed)
+                except:
+                    pass
+
+reminder_engine = ReminderEngine()
 
 @bot.command(name='remind', aliases=['remindme'])
 async def set_reminder(ctx, duration, *, message):
-    """Set a reminder"""
-    remind_time = parse_duration(duration)
-    if not remind_time:
+    """Set a reminder; `!remind every 1d <message>` repeats it"""
+    interval = None
+    if duration.lower() == 'every':
+        duration, _, message = message.partition(' ')
+        interval = parse_duration_seconds(duration)
+        if interval is not None and interval < REMINDER_MIN_INTERVAL:
+            await ctx.send(f"Recurring reminders need an interval of at least {REMINDER_MIN_INTERVAL} seconds.")
+            return
+        if reminder_engine.recurring_count(ctx.author.id) >= REMINDER_MAX_RECURRING:
+            await ctx.send(f"You already have {REMINDER_MAX_RECURRING} recurring reminders. "
+                           f"Cancel one with `!reminders cancel <id>` first.")
+            return
+        if not message:
+            await ctx.send("What should I remind you about?")
+            return
+    
+    seconds = parse_duration_seconds(duration)
+    if seconds is None:
         await ctx.send("Invalid duration format! Use formats like `1h`, `30m`, `1d`.")
         return
     
-    reminder_id = len(reminders)
-    reminders[reminder_id] = {
-        'user_id': ctx.author.id,
-        'channel_id': ctx.channel.id,
-        'message': message,
-        'time': remind_time
-    }
+    due_at = int(time.time()) + seconds
+    reminder_id = await reminder_engine.add(
+        ctx.author.id, ctx.channel.id, ctx.guild.id if ctx.guild else 0, message, due_at, interval
+    )
     
     embed = discord.Embed(
         title="⏰ Reminder Set",
-        description=f"I'll remind you about: {message}\nTime: {remind_time.strftime('%Y-%m-%d %H:%M:%S')}",
+        description=f"I'll remind you about: {message}\nTime: <t:{due_at}:f>"
+                    + (f"\nRepeats every {duration}" if interval else "")
+                    + f"\nID: {reminder_id}",
         color=0x00ff00
     )
     await ctx.send(embed=embed)
 
-@tasks.loop(minutes=1)
-async def check_reminders():
-    """Check for due reminders"""
-    current_time = datetime.datetime.now()
-    to_remove = []
-    
-    for reminder_id, reminder in reminders.items():
-        if reminder['time'] <= current_time:
-            user = bot.get_user(reminder['user_id'])
-            channel = bot.get_channel(reminder['channel_id'])
-            
-            if user and channel:
-                embed = discord.Embed(
-                    title="⏰ Reminder",
-                    description=f"You asked me to remind you about: {reminder['message']}",
-                    color=0x00ff00
-                )
-                try:
-                    await channel.send(f"{user.mention}", embed=embed)
-                except:
-                    pass
-            
-            to_remove.append(reminder_id)
+@bot.group(name='reminders', invoke_without_command=True)
+async def reminders_group(ctx):
+    """List your reminders"""
+    await list_reminders(ctx)
+
+@reminders_group.command(name='list')
+async def list_reminders(ctx):
+    """List your pending reminders"""
+    pending = reminder_engine.for_user(ctx.author.id)
+    if not pending:
+        await ctx.send("You have no pending reminders.")
+        return
     
-    for reminder_id in to_remove:
-        del reminders[reminder_id]
+    embed = discord.Embed(
+        title="⏰ Your Reminders",
+        color=0x00ff00
+    )
+    for reminder_id, reminder in pending[:10]:
+        repeat = f" (every {reminder.interval}s)" if reminder.interval else ""
+        embed.add_field(
+            name=f"#{reminder_id} - <t:{reminder.due_at}:R>{repeat}",
+            value=reminder.message[:200],
+            inline=False
+        )
+    if len(pending) > 10:
+        embed.set_footer(text=f"Showing the next 10 of {len(pending)} reminders")
+    await ctx.send(embed=embed)
 
-# Start reminder checking when bot is ready
-@bot.event
-async def on_ready_tasks():
-    check_reminders.start()
+@reminders_group.command(name='cancel')
+async def cancel_reminder(ctx, reminder_id: int):
+    """Cancel one of your reminders"""
+    reminder = reminders.get(reminder_id)
+    if reminder is None or reminder.user_id != ctx.author.id:
+        await ctx.send(f"You have no reminder #{reminder_id}.")
+        return
+    
+    reminder_engine.cancel(reminder_id)
+    await ctx.send(f"Cancelled reminder #{reminder_id}.")
 
 # ADDITIONAL UTILITY COMMANDS
 @bot.command(name='say')
 @commands.has_permissions(manage_messages=True)
 async def say_message(ctx, *, message):
     """Make the bot say something"""
-    await ctx.message.delete()
+    await rest.call(LANE_USER, ('delete', ctx.channel.id), ctx.message.delete)
     await ctx.send(message)
 
 @bot.command(name='embed')
@@ -1340,11 +4043,1392 @@ async def create_poll(ctx, question, *options):
     poll_message = await ctx.send(embed=embed)
     
     for i in range(len(options)):
-        await poll_message.add_reaction(reactions[i])
+        await rest.call(LANE_USER, ('reactions', poll_message.channel.id), poll_message.add_reaction, reactions[i])
 
-# Modified on_message to include XP system
-original_on_message = bot.get_listener('on_message')
+# PERSISTENCE
+# The module-level dicts stay the hot copy of all state. Mutations only mark a
+# key dirty. Every second the dirty entries are appended to a binary journal,
+# and every few minutes a checkpoint folds everything changed since the last
+# one into the storage backend and deletes the journal segments it covers.
+# Startup loads the backend's snapshot and replays only the journal after it.
+# Guild and automod configs are read lazily, one entry at a time. A guild's XP,
+# economy and warning rows are read together the first time the guild is used,
+# so restart time does not grow with them. Only the small remaining namespaces
+# (reaction roles, reminders, ticket categories, mutes) are decoded at startup.
+# Guild configs are also published to the backend within a second of changing,
+# with a version bump, so processes sharing a backend drop their stale copies.
+STORAGE_URL = os.environ.get('CARLBOT_STORAGE', 'sqlite')  # sqlite, memory or redis://host:port/db
+DATABASE_PATH = os.environ.get('CARLBOT_DB', 'carlbot.db')
+NODE_NAME = os.environ.get('CARLBOT_NODE', '')  # tells processes sharing a backend apart
+JOURNAL_DIR = os.environ.get(
+    'CARLBOT_JOURNAL', f'{DATABASE_PATH}.{NODE_NAME}.journal' if NODE_NAME else f'{DATABASE_PATH}.journal'
+)
+JOURNAL_CHECKPOINT_BYTES = 16 * 1024 * 1024  # checkpoint early once the journal grows past this
+CHECKPOINT_META = f'checkpoint_seq:{NODE_NAME}' if NODE_NAME else 'checkpoint_seq'
+WARNING_ID_META = f'next_warning_id:{NODE_NAME}' if NODE_NAME else 'next_warning_id'
+# Reminders are keyed by id alone, so every process draws ids from one shared
+# counter, holding the last id handed out, a block at a time
+REMINDER_ID_META = 'last_reminder_id'
+LOAD_BATCH = 10000  # snapshot rows parsed per json.loads call at startup
+
+# namespace -> (dict, key depth); depth 2 means dict[outer][inner]
+STORED_STATE = {
+    'guild_configs': (guild_configs, 1),
+    'automod_configs': (automod_configs, 1),
+    'user_xp': (user_xp, 2),
+    'user_economy': (user_economy, 2),
+    'reaction_roles': (reaction_roles, 1),
+    'reminders': (reminders, 1),
+    'ticket_categories': (ticket_categories, 1),
+    'mutes': (mute_scheduler.mutes, 2),
+    'warnings': (warning_store.warnings, 3),
+}
+# Journal records refer to namespaces by position, so only append to this.
+JOURNAL_NAMESPACES = (
+    'guild_configs', 'automod_configs', 'user_xp', 'user_economy',
+    'reaction_roles', 'reminders', 'ticket_categories', 'warnings', 'mutes',
+)
+JOURNAL_NAMESPACE_IDS = {namespace: i for i, namespace in enumerate(JOURNAL_NAMESPACES)}
+
+# Namespaces held in a GuildStateCache are read from the backend on first
+# access instead of at startup, and are versioned
+CACHED_NAMESPACES = frozenset(
+    namespace for namespace, (state, _) in STORED_STATE.items() if isinstance(state, GuildStateCache)
+)
+# Member data keyed by guild first; a guild's rows are read together the
+# first time the guild is used, and stay resident from then on
+GUILD_NAMESPACES = frozenset({'user_xp', 'user_economy', 'warnings'})
+# Neither is read at startup
+LAZY_NAMESPACES = CACHED_NAMESPACES | GUILD_NAMESPACES
+
+# Journal record: header (payload length, crc32 of the payload, sequence
+# number), then op, namespace id, key count, the keys as signed 64-bit ints
+# and, for puts, the JSON value
+JOURNAL_HEADER = struct.Struct('<IIQ')
+JOURNAL_PREFIX = struct.Struct('<BBB')
+JOURNAL_PUT = 1
+JOURNAL_DELETE = 2
+
+# namespace -> record class its entries are stored as
+STATE_RECORDS = {
+    'guild_configs': GuildConfig,
+    'user_xp': XPRecord,
+    'user_economy': EconomyRecord,
+    'warnings': WarningRecord,
+    'mutes': MuteRecord,
+    'reminders': ReminderRecord,
+}
+
+def _encode_default(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    return value.isoformat()
+
+def encode_state_value(value):
+    return json.dumps(value, separators=(',', ':'), default=_encode_default)
+
+def decode_state_value(namespace, data):
+    return build_state_value(namespace, json.loads(data))
+
+def build_state_value(namespace, value):
+    """The in-memory form of a decoded JSON value"""
+    if namespace in STATE_RECORDS:
+        return STATE_RECORDS[namespace].from_dict(value)
+    if namespace == 'automod_configs':
+        # Start from the defaults so settings added since the entry was stored exist
+        config = default_automod_config()
+        config.update(value)
+        return config
+    return value
+
+def state_key(key):
+    return ':'.join(map(str, key))
+
+def encode_journal_record(seq, namespace, key, data):
+    """Pack one journal record; data is the encoded value, or None for a delete"""
+    op = JOURNAL_DELETE if data is None else JOURNAL_PUT
+    payload = struct.pack(f'<BBB{len(key)}q', op, JOURNAL_NAMESPACE_IDS[namespace], len(key), *key)
+    if data is not None:
+        payload += data.encode()
+    return JOURNAL_HEADER.pack(len(payload), zlib.crc32(payload), seq) + payload
+
+def read_journal(path):
+    """Yield (seq, namespace, key, data) from a segment, stopping at a torn tail"""
+    with open(path, 'rb') as f:
+        buf = f.read()
+    offset = 0
+    while offset + JOURNAL_HEADER.size <= len(buf):
+        length, crc, seq = JOURNAL_HEADER.unpack_from(buf, offset)
+        start = offset + JOURNAL_HEADER.size
+        payload = buf[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            # A write cut short by a crash; nothing after it was acknowledged
+            break
+        op, namespace_id, count = JOURNAL_PREFIX.unpack_from(payload)
+        key = struct.unpack_from(f'<{count}q', payload, JOURNAL_PREFIX.size)
+        data = payload[JOURNAL_PREFIX.size + 8 * count:] if op == JOURNAL_PUT else None
+        yield seq, JOURNAL_NAMESPACES[namespace_id], key, data
+        offset = start + length
+
+# Storage backends hold encoded state as (namespace, key) -> JSON text, with a
+# version per key and per namespace for the versioned namespaces. Every method
+# is blocking and thread safe; the Storage layer calls them from worker threads.
+# Keys are the key parts joined with ':', so a guild's member data shares the
+# "<guild_id>:" prefix and scan_guild reads it without walking other guilds.
+# scan_keys yields keys alone, a batch at a time, without reading the values.
+# write returns the new version of every key it bumped, so a process can tell
+# its own bumps from other processes' changes. allocate adds to a meta counter
+# atomically and returns its new value, so processes can share an id sequence.
+class MemoryBackend:
+    """State kept in this process only, for tests and throwaway runs"""
+
+    def __init__(self):
+        self._rows = {}
+        self._meta = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def scan(self, exclude):
+        with self._lock:
+            return [(namespace, key, value) for (namespace, key), value in self._rows.items()
+                    if namespace not in exclude]
+
+    def scan_guild(self, namespaces, guild_id):
+        prefix = f'{guild_id}:'
+        with self._lock:
+            return [(namespace, key, value) for (namespace, key), value in self._rows.items()
+                    if namespace in namespaces and key.startswith(prefix)]
+
+    def scan_keys(self, namespaces):
+        with self._lock:
+            return [(namespace, key) for namespace, key in self._rows if namespace in namespaces]
+
+    def get_many(self, namespace, keys):
+        with self._lock:
+            return [(self._rows.get((namespace, key)), self._versions.get((namespace, key), 0)) for key in keys]
+
+    def write(self, upserts, deletes, meta, bump):
+        with self._lock:
+            for namespace, key, value in upserts:
+                self._rows[(namespace, key)] = value
+            for entry in deletes:
+                self._rows.pop(entry, None)
+            self._meta.update(meta)
+            for entry in bump:
+                self._versions[entry] = self._versions.get(entry, 0) + 1
+            for namespace in {namespace for namespace, _ in bump}:
+                self._meta[f'version:{namespace}'] = self._meta.get(f'version:{namespace}', 0) + 1
+            return {entry: self._versions[entry] for entry in bump}
+
+    def get_meta(self, name):
+        with self._lock:
+            return self._meta.get(name)
+
+    def allocate(self, name, count):
+        with self._lock:
+            self._meta[name] = self._meta.get(name, 0) + count
+            return self._meta[name]
+
+    def versions(self, namespace, keys):
+        with self._lock:
+            return [self._versions.get((namespace, key), 0) for key in keys]
+
+    def namespace_version(self, namespace):
+        return self.get_meta(f'version:{namespace}') or 0
+
+    def close(self):
+        pass
+
+class SQLiteBackend:
+    """State stored in a local SQLite database"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS state ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+            'PRIMARY KEY (namespace, key)) WITHOUT ROWID'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS versions ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, version INTEGER NOT NULL, '
+            'PRIMARY KEY (namespace, key)) WITHOUT ROWID'
+        )
+        # Lazy loads run in worker threads, each reading through its own
+        # connection; with WAL they never wait on a checkpoint's write
+        self._readers = threading.local()
+        self._reader_connections = []
+
+    def _reader(self):
+        reader = getattr(self._readers, 'connection', None)
+        if reader is None:
+            # Not bound to this thread only so close can shut it from another
+            reader = self._readers.connection = sqlite3.connect(self.path, check_same_thread=False)
+            with self._lock:
+                self._reader_connections.append(reader)
+        return reader
+
+    def scan(self, exclude):
+        rows = []
+        with self._lock:
+            # One primary key range per namespace, so excluded rows are never visited
+            for namespace in JOURNAL_NAMESPACES:
+                if namespace not in exclude:
+                    rows.extend((namespace, key, value) for key, value in self._conn.execute(
+                        'SELECT key, value FROM state WHERE namespace = ?', (namespace,)
+                    ))
+        return rows
+
+    def scan_guild(self, namespaces, guild_id):
+        reader = self._reader()
+        rows = []
+        for namespace in namespaces:
+            # ';' sorts right after ':', so this is a range of the primary key
+            rows.extend((namespace, key, value) for key, value in reader.execute(
+                'SELECT key, value FROM state WHERE namespace = ? AND key >= ? AND key < ?',
+                (namespace, f'{guild_id}:', f'{guild_id};')
+            ))
+        return rows
+
+    def scan_keys(self, namespaces):
+        reader = self._reader()
+        for namespace in namespaces:
+            for key, in reader.execute('SELECT key FROM state WHERE namespace = ?', (namespace,)):
+                yield namespace, key
+
+    def get_many(self, namespace, keys):
+        reader = self._reader()
+        results = []
+        for key in keys:
+            row = reader.execute(
+                'SELECT value FROM state WHERE namespace = ? AND key = ?', (namespace, key)
+            ).fetchone()
+            version = reader.execute(
+                'SELECT version FROM versions WHERE namespace = ? AND key = ?', (namespace, key)
+            ).fetchone()
+            results.append((row[0] if row else None, version[0] if version else 0))
+        return results
+
+    def write(self, upserts, deletes, meta, bump):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(
+                    'INSERT INTO state (namespace, key, value) VALUES (?, ?, ?) '
+                    'ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value',
+                    upserts
+                )
+                self._conn.executemany('DELETE FROM state WHERE namespace = ? AND key = ?', deletes)
+                self._conn.executemany(
+                    'INSERT INTO meta (name, value) VALUES (?, ?) '
+                    'ON CONFLICT (name) DO UPDATE SET value = excluded.value',
+                    meta.items()
+                )
+                self._conn.executemany(
+                    'INSERT INTO versions (namespace, key, version) VALUES (?, ?, 1) '
+                    'ON CONFLICT (namespace, key) DO UPDATE SET version = version + 1',
+                    bump
+                )
+                self._conn.executemany(
+                    'INSERT INTO meta (name, value) VALUES (?, 1) '
+                    'ON CONFLICT (name) DO UPDATE SET value = value + 1',
+                    [(f'version:{namespace}',) for namespace in {namespace for namespace, _ in bump}]
+                )
+                bumped = {
+                    (namespace, key): self._conn.execute(
+                        'SELECT version FROM versions WHERE namespace = ? AND key = ?', (namespace, key)
+                    ).fetchone()[0]
+                    for namespace, key in bump
+                }
+            except:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return bumped
+
+    def get_meta(self, name):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def allocate(self, name, count):
+        with self._lock:
+            return self._conn.execute(
+                'INSERT INTO meta (name, value) VALUES (?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value RETURNING value',
+                (name, count)
+            ).fetchone()[0]
+
+    def versions(self, namespace, keys):
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                found.update(self._conn.execute(
+                    f'SELECT key, version FROM versions WHERE namespace = ? '
+                    f'AND key IN ({",".join("?" * len(chunk))})',
+                    (namespace, *chunk)
+                ))
+        return [found.get(key, 0) for key in keys]
+
+    def namespace_version(self, namespace):
+        return self.get_meta(f'version:{namespace}') or 0
+
+    def close(self):
+        with self._lock:
+            for reader in self._reader_connections:
+                reader.close()
+            self._reader_connections = []
+            self._conn.close()
+
+class RespError(Exception):
+    """Error reply from a Redis protocol server"""
+
+def encode_resp_command(command):
+    parts = [b'*%d\r\n' % len(command)]
+    for arg in command:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+class RespConnection:
+    """Minimal Redis protocol client that sends commands in pipelined batches"""
+
+    def __init__(self, host, port, db=0, password=None, timeout=5):
+        self.address = (host, port)
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def execute(self, *commands):
+        """Send the commands in one write and return their replies in order"""
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            try:
+                return self._round_trip(commands)
+            except (OSError, ConnectionError):
+                self._disconnect()
+                raise
+
+    def _connect(self):
+        self._sock = socket.create_connection(self.address, self.timeout)
+        self._file = self._sock.makefile('rb')
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        if setup:
+            self._round_trip(setup)
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+        self._sock = self._file = None
+
+    def _round_trip(self, commands):
+        self._sock.sendall(b''.join(map(encode_resp_command, commands)))
+        # Read every reply before raising so the stream stays in step
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def _read_reply(self):
+        line = self._file.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by the storage server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b'+':
+            return body.decode()
+        if kind == b'-':
+            return RespError(body.decode())
+        if kind == b':':
+            return int(body)
+        if kind == b'$':
+            length = int(body)
+            return None if length < 0 else self._file.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(body)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from the storage server: {line!r}")
 
+class RedisBackend:
+    """State stored in hashes on a Redis protocol server, shared between processes"""
+
+    BATCH = 1000  # fields per command
+
+    def __init__(self, connection, prefix='carlbot:', reader=None):
+        self.connection = connection
+        # Lazy loads use their own connection so they never queue behind a checkpoint's pipeline
+        self.reader = reader or connection
+        self.prefix = prefix
+
+    def _state(self, namespace):
+        return f'{self.prefix}state:{namespace}'
+
+    def _guild_keys(self, namespace, guild_id):
+        """Set of the keys one guild has in a GUILD_NAMESPACES hash"""
+        return f'{self.prefix}keys:{namespace}:{guild_id}'
+
+    def _versions(self, namespace):
+        return f'{self.prefix}version:{namespace}'
+
+    def scan(self, exclude):
+        rows = []
+        for namespace in JOURNAL_NAMESPACES:
+            if namespace in exclude:
+                continue
+            cursor = b'0'
+            while True:
+                cursor, fields = self.connection.execute(
+                    ('HSCAN', self._state(namespace), cursor, 'COUNT', self.BATCH)
+                )[0]
+                rows.extend((namespace, fields[i].decode(), fields[i + 1].decode())
+                            for i in range(0, len(fields), 2))
+                if cursor == b'0':
+                    break
+        return rows
+
+    def scan_keys(self, namespaces):
+        for namespace in namespaces:
+            cursor = b'0'
+            while True:
+                cursor, fields = self.reader.execute(
+                    ('HSCAN', self._state(namespace), cursor, 'COUNT', self.BATCH)
+                )[0]
+                for key in fields[::2]:
+                    yield namespace, key.decode()
+                if cursor == b'0':
+                    break
+
+    def scan_guild(self, namespaces, guild_id):
+        namespaces = list(namespaces)
+        key_sets = self.reader.execute(*(('SMEMBERS', self._guild_keys(namespace, guild_id)) for namespace in namespaces))
+        commands = []
+        wanted = []
+        for namespace, keys in zip(namespaces, key_sets):
+            keys = [key.decode() for key in keys]
+            for i in range(0, len(keys), self.BATCH):
+                commands.append(('HMGET', self._state(namespace), *keys[i:i + self.BATCH]))
+                wanted.append((namespace, keys[i:i + self.BATCH]))
+        replies = self.reader.execute(*commands) if commands else []
+        # A key indexed while another process deleted its row has no value
+        return [(namespace, key, value.decode())
+                for (namespace, keys), values in zip(wanted, replies)
+                for key, value in zip(keys, values) if value is not None]
+
+    def get_many(self, namespace, keys):
+        values, versions = self.reader.execute(
+            ('HMGET', self._state(namespace), *keys),
+            ('HMGET', self._versions(namespace), *keys)
+        )
+        return [(None if value is None else value.decode(), int(version or 0))
+                for value, version in zip(values, versions)]
+
+    def write(self, upserts, deletes, meta, bump):
+        commands = [('MULTI',)]
+        by_namespace = {}
+        for namespace, key, value in upserts:
+            by_namespace.setdefault(namespace, []).extend((key, value))
+        for namespace, fields in by_namespace.items():
+            for i in range(0, len(fields), 2 * self.BATCH):
+                commands.append(('HSET', self._state(namespace), *fields[i:i + 2 * self.BATCH]))
+        commands.extend(self._index_commands('SADD', ((namespace, key) for namespace, key, _ in upserts)))
+        by_namespace = {}
+        for namespace, key in deletes:
+            by_namespace.setdefault(namespace, []).append(key)
+        for namespace, keys in by_namespace.items():
+            for i in range(0, len(keys), self.BATCH):
+                commands.append(('HDEL', self._state(namespace), *keys[i:i + self.BATCH]))
+        commands.extend(self._index_commands('SREM', deletes))
+        for name, value in meta.items():
+            commands.append(('HSET', f'{self.prefix}meta', name, value))
+        first_bump = len(commands) - 1  # EXEC results leave out the MULTI
+        for namespace, key in bump:
+            commands.append(('HINCRBY', self._versions(namespace), key, 1))
+        for namespace in {namespace for namespace, _ in bump}:
+            commands.append(('HINCRBY', f'{self.prefix}meta', f'version:{namespace}', 1))
+        commands.append(('EXEC',))
+        results = self.connection.execute(*commands)[-1]
+        for result in results or ():
+            if isinstance(result, RespError):
+                raise result
+        return {entry: results[first_bump + i] for i, entry in enumerate(bump)}
+
+    def _index_commands(self, command, entries):
+        """Add or remove member data keys in their guild's key set"""
+        by_set = {}
+        for namespace, key in entries:
+            if namespace in GUILD_NAMESPACES:
+                by_set.setdefault(self._guild_keys(namespace, key.split(':', 1)[0]), []).append(key)
+        return [(command, name, *keys) for name, keys in by_set.items()]
+
+    def get_meta(self, name):
+        value = self.connection.execute(('HGET', f'{self.prefix}meta', name))[0]
+        return None if value is None else int(value)
+
+    def allocate(self, name, count):
+        return self.connection.execute(('HINCRBY', f'{self.prefix}meta', name, count))[0]
+
+    def versions(self, namespace, keys):
+        commands = [('HMGET', self._versions(namespace), *keys[i:i + self.BATCH])
+                    for i in range(0, len(keys), self.BATCH)]
+        replies = self.connection.execute(*commands) if commands else []
+        return [int(version or 0) for reply in replies for version in reply]
+
+    def namespace_version(self, namespace):
+        return self.get_meta(f'version:{namespace}') or 0
+
+    def close(self):
+        for connection in {self.connection, self.reader}:
+            with connection._lock:
+                connection._disconnect()
+
+def open_backend(url):
+    """Storage backend for a CARLBOT_STORAGE value"""
+    if url == 'memory':
+        return MemoryBackend()
+    if url == 'sqlite':
+        return SQLiteBackend(DATABASE_PATH)
+    if url.startswith('redis://'):
+        parts = urllib.parse.urlsplit(url)
+        address = (parts.hostname or 'localhost', parts.port or 6379, int(parts.path.strip('/') or 0), parts.password)
+        return RedisBackend(RespConnection(*address), reader=RespConnection(*address))
+    raise ValueError(f"Unknown storage backend: {url}")
+
+class Storage:
+    """Backend snapshot of the in-memory state plus a local journal of the changes since"""
+
+    def __init__(self, backend, journal_dir):
+        self.backend = backend
+        self.journal_dir = journal_dir  # None keeps no journal
+        self.journal_bytes = 0
+        self._journal_dirty = set()
+        self._snapshot_dirty = set()
+        self._publish_dirty = set()
+        self._writing = set()
+        self._publishing = set()  # published entries taken off _snapshot_dirty while their write runs
+        # Encoded values of lazily loaded entries that left memory before
+        # their latest change reached the snapshot; None records a delete
+        self._evicted = {}
+        # Guilds whose member data has been read, and the journal tail entries
+        # held in _evicted for guilds that have not been read yet
+        self.loaded_guilds = set()
+        self._guild_changes = {}
+        self._guild_loads = {}  # guild_id -> task reading the guild's rows
+        self._namespace_versions = {}
+        self._seq = 0
+        self._segments = []
+        self._journal_lock = asyncio.Lock()
+        self._checkpoint_lock = asyncio.Lock()
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+
+    def mark_dirty(self, namespace, key):
+        self._journal_dirty.add((namespace, key))
+        self._snapshot_dirty.add((namespace, key))
+        if namespace in CACHED_NAMESPACES:
+            self._publish_dirty.add((namespace, key))
+
+    @property
+    def pending(self):
+        return len(self._journal_dirty)
+
+    @property
+    def checkpointing(self):
+        return self._checkpoint_lock.locked()
+
+    def fetch(self, namespace, key):
+        """Encoded value and version of a lazily loaded entry; None if it was never stored"""
+        if (namespace, key) in self._evicted:
+            # The entry is resident again and stays dirty, so it is written from memory
+            return self._evicted.pop((namespace, key)), None
+        return self.backend.get_many(namespace, [state_key(key)])[0]
+
+    async def fetch_async(self, namespace, key):
+        """fetch with the backend read in a worker thread"""
+        if (namespace, key) in self._evicted:
+            return self._evicted.pop((namespace, key)), None
+        return (await asyncio.to_thread(self.backend.get_many, namespace, [state_key(key)]))[0]
+
+    async def fetch_many_async(self, namespace, keys):
+        """Values and versions of many entries in one backend read, for callers that don't make them resident"""
+        evicted = {key: self._evicted[(namespace, key)] for key in keys if (namespace, key) in self._evicted}
+        stored = [key for key in keys if key not in evicted]
+        rows = await asyncio.to_thread(self.backend.get_many, namespace, list(map(state_key, stored))) if stored else []
+        found = dict(zip(stored, rows))
+        return [found[key] if key in found else (evicted[key], None) for key in keys]
+
+    def write_back(self, namespace, key, value):
+        """Keep an evicted entry's value until the snapshot holds it"""
+        if self.is_dirty(namespace, key):
+            self._evicted[(namespace, key)] = encode_state_value(value)
+
+    def is_dirty(self, namespace, key):
+        entry = (namespace, key)
+        return entry in self._snapshot_dirty or entry in self._writing or entry in self._publishing
+
+    def _left_memory(self, namespace, key):
+        """Whether a lazily loaded entry missing from memory was never read, rather than deleted"""
+        if (namespace, key) in self._evicted:
+            return False
+        if namespace in GUILD_NAMESPACES:
+            return key[0] not in self.loaded_guilds
+        return namespace in CACHED_NAMESPACES
+
+    def _guild_pending(self, namespace, key):
+        return namespace in GUILD_NAMESPACES and key[0] not in self.loaded_guilds
+
+    async def load_guild_async(self, guild_id):
+        """Read a guild's member data in a worker thread the first time the guild is used"""
+        if guild_id in self.loaded_guilds:
+            return
+        loading = self._guild_loads.get(guild_id)
+        if loading is None:
+            loading = self._guild_loads[guild_id] = asyncio.ensure_future(self._load_guild(guild_id))
+            loading.add_done_callback(lambda _: self._guild_loads.pop(guild_id, None))
+        # One caller giving up must not cancel the read for the others
+        await asyncio.shield(loading)
+
+    async def _load_guild(self, guild_id):
+        rows = await asyncio.to_thread(self.backend.scan_guild, GUILD_NAMESPACES, guild_id)
+        by_namespace = {}
+        for namespace, key, data in rows:
+            by_namespace.setdefault(namespace, []).append((key, data))
+        for namespace, namespace_rows in by_namespace.items():
+            self._load_rows(namespace, namespace_rows)
+        # Journal tail changes are newer than the snapshot rows
+        for namespace, key in self._guild_changes.pop(guild_id, ()):
+            self._set_state(namespace, key, self._evicted.pop((namespace, key)))
+        self.loaded_guilds.add(guild_id)
+        warning_store.finish_loading(guild_id)
+
+    def release_guild(self, guild_id):
+        """Drop a guild's member data from memory; changes not yet in the snapshot wait in _evicted"""
+        if guild_id not in self.loaded_guilds:
+            return
+        for entry in self._snapshot_dirty | self._writing | self._publishing:
+            namespace, key = entry
+            if namespace in GUILD_NAMESPACES and key[0] == guild_id:
+                self._evicted[entry] = self._encode(namespace, key)
+                self._guild_changes.setdefault(guild_id, set()).add(entry)
+        user_xp.pop(guild_id, None)
+        user_economy.pop(guild_id, None)
+        warning_store.forget_guild(guild_id)
+        self.loaded_guilds.discard(guild_id)
+
+    def _apply(self, namespace, key, data):
+        if namespace in LAZY_NAMESPACES:
+            self._evicted[(namespace, key)] = None if data is None else data.decode()
+            if namespace in GUILD_NAMESPACES:
+                self._guild_changes.setdefault(key[0], set()).add((namespace, key))
+            return
+        self._set_state(namespace, key, data)
+
+    def _set_state(self, namespace, key, data):
+        """Place an encoded value in memory, or remove the entry if data is None"""
+        state, _ = STORED_STATE[namespace]
+        for part in key[:-1]:
+            state = state.get(part) if data is None else state.setdefault(part, {})
+            if state is None:
+                return
+        if data is None:
+            state.pop(key[-1], None)
+        else:
+            state[key[-1]] = decode_state_value(namespace, data)
+
+    def _load_rows(self, namespace, rows):
+        """Place one namespace's snapshot rows in memory, parsing their JSON a batch at a time"""
+        state, _ = STORED_STATE[namespace]
+        for start in range(0, len(rows), LOAD_BATCH):
+            batch = rows[start:start + LOAD_BATCH]
+            # One json.loads per batch instead of one per row
+            values = json.loads('[' + ','.join(data for _, data in batch) + ']')
+            for (key, _), value in zip(batch, values):
+                *parents, last = map(int, key.split(':'))
+                target = state
+                for part in parents:
+                    target = target.setdefault(part, {})
+                target[last] = build_state_value(namespace, value)
+
+    def load(self):
+        """Load the snapshot and replay the journal tail, called once at startup
+
+        Lazily loaded namespaces are left in the backend; replayed changes to
+        them wait in _evicted until their entry or guild is read.
+        """
+        by_namespace = {}
+        for namespace, key, data in self.backend.scan(LAZY_NAMESPACES):
+            if namespace in JOURNAL_NAMESPACES:
+                by_namespace.setdefault(namespace, []).append((key, data))
+        checkpoint_seq = self.backend.get_meta(CHECKPOINT_META) or 0
+        for namespace, rows in by_namespace.items():
+            self._load_rows(namespace, rows)
+
+        self._seq = checkpoint_seq
+        replayed = 0
+        if self.journal_dir:
+            self._segments = sorted(
+                os.path.join(self.journal_dir, name)
+                for name in os.listdir(self.journal_dir) if name.endswith('.log')
+            )
+        for segment in self._segments:
+            for seq, namespace, key, data in read_journal(segment):
+                if seq <= checkpoint_seq:
+                    continue
+                self._apply(namespace, key, data)
+                # Replayed changes go into the next checkpoint so the old segments can be dropped
+                self._snapshot_dirty.add((namespace, key))
+                self._seq = max(self._seq, seq)
+                replayed += 1
+            self.journal_bytes += os.path.getsize(segment)
+        warning_store.next_id = max(
+            [self.backend.get_meta(WARNING_ID_META) or 1]
+            + [key[2] + 1 for namespace, key in self._evicted if namespace == 'warnings']
+        )
+        self._open_segment()
+        return sum(map(len, by_namespace.values())), replayed
+
+    def _open_segment(self):
+        if not self.journal_dir:
+            return
+        # The timestamp keeps a restart from appending after a torn record in
+        # a segment that started at the same sequence number
+        name = f'{self._seq + 1:020d}-{time.time_ns()}.log'
+        self._segments.append(os.path.join(self.journal_dir, name))
+
+    def _encode(self, namespace, key):
+        """Serialize the current value of a key, or None if it was removed"""
+        if (namespace, key) in self._evicted:
+            return self._evicted[(namespace, key)]
+        value, _ = STORED_STATE[namespace]
+        for part in key:
+            value = value.get(part)
+            if value is None:
+                return None
+        return encode_state_value(value)
+
+    def _append(self, segment, data):
+        with open(segment, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def flush_journal(self):
+        """Append every entry changed since the last call to the journal"""
+        async with self._journal_lock:
+            if not self._journal_dirty:
+                return 0
+            dirty, self._journal_dirty = self._journal_dirty, set()
+            if not self.journal_dir:
+                return 0
+            records = []
+            for namespace, key in dirty:
+                try:
+                    data = self._encode(namespace, key)
+                    if data is None and self._left_memory(namespace, key):
+                        # Changed after it was evicted; its last value was already handed back
+                        continue
+                    record = encode_journal_record(self._seq + 1, namespace, key, data)
+                except Exception as e:
+                    # One unencodable entry must not stop every other entry from being journaled
+                    self._snapshot_dirty.discard((namespace, key))
+                    print(f"Dropped unencodable {namespace} entry {key!r} from the journal: {e}")
+                    continue
+                self._seq += 1
+                records.append(record)
+            data = b''.join(records)
+            try:
+                await asyncio.to_thread(self._append, self._segments[-1], data)
+            except Exception as e:
+                # Keep the entries dirty so the next flush retries them
+                self._journal_dirty |= dirty
+                print(f"Failed to append to journal in {self.journal_dir}: {e}")
+                return 0
+            self.journal_bytes += len(data)
+            return len(dirty)
+
+    async def publish(self):
+        """Write changed guild configs to the backend now, bumping their versions"""
+        if not self._publish_dirty:
+            return 0
+        dirty, self._publish_dirty = self._publish_dirty, set()
+        upserts = []
+        for namespace, key in dirty:
+            data = self._encode(namespace, key)
+            if data is not None:
+                upserts.append((namespace, state_key(key), data))
+        # The backend will hold these values, so the next checkpoint need not
+        # write them again unless they change meanwhile and are marked anew
+        staged = dirty & self._snapshot_dirty
+        self._snapshot_dirty -= staged
+        self._publishing = staged
+        try:
+            bumped = await asyncio.to_thread(
+                self.backend.write, upserts, [], {}, [(namespace, key) for namespace, key, _ in upserts]
+            )
+        except Exception as e:
+            self._publish_dirty |= dirty
+            self._snapshot_dirty |= staged
+            print(f"Failed to publish config changes: {e}")
+            return 0
+        finally:
+            self._publishing = set()
+        self._note_own_versions(bumped)
+        return len(upserts)
+
+    def _note_own_versions(self, bumped):
+        """Record the versions of our own writes so refresh does not rescan or drop our entries for them"""
+        for (namespace, key), version in bumped.items():
+            cache, _ = STORED_STATE[namespace]
+            cache.set_version(int(key), version)
+        # Each write bumps a namespace's version once; another process's
+        # write still leaves the seen version behind and forces a rescan
+        for namespace in {namespace for namespace, _ in bumped}:
+            if namespace in self._namespace_versions:
+                self._namespace_versions[namespace] += 1
+
+    async def refresh(self, cache):
+        """Drop resident clean entries another process has changed since they were loaded"""
+        namespace = cache.namespace
+        version = await asyncio.to_thread(self.backend.namespace_version, namespace)
+        if version == self._namespace_versions.get(namespace):
+            return 0
+        self._namespace_versions[namespace] = version
+        guild_ids = cache.resident()
+        versions = await asyncio.to_thread(
+            self.backend.versions, namespace, [str(guild_id) for guild_id in guild_ids]
+        )
+        dropped = 0
+        for guild_id, stored in zip(guild_ids, versions):
+            if cache.version(guild_id) != stored and not self.is_dirty(namespace, (guild_id,)):
+                dropped += cache.invalidate(guild_id)
+        return dropped
+
+    def _remove_segments(self, segments):
+        for segment in segments:
+            try:
+                os.remove(segment)
+            except FileNotFoundError:
+                pass
+
+    async def checkpoint(self):
+        """Fold the changes since the last checkpoint into the snapshot and drop the covered journal"""
+        async with self._checkpoint_lock:
+            await self.flush_journal()
+            # Nothing below awaits until the write, so every record up to
+            # covered_seq is reflected in the values collected here
+            covered_seq = self._seq
+            covered_segments = self._segments
+            self._segments = []
+            self._open_segment()
+            self.journal_bytes = 0
+
+            # Entries a publish is still writing go in too: their journal
+            # records are dropped below, and that write may yet fail
+            dirty, self._snapshot_dirty = self._snapshot_dirty | self._publishing, set()
+            upserts = []
+            deletes = []
+            bump = []
+            unpublished = []
+            for namespace, key in dirty:
+                data = self._encode(namespace, key)
+                db_key = state_key(key)
+                if data is None and self._left_memory(namespace, key):
+                    continue
+                if data is None:
+                    deletes.append((namespace, db_key))
+                else:
+                    upserts.append((namespace, db_key, data))
+                    if (namespace, key) in self._publish_dirty:
+                        # Not published yet; the checkpoint publishes it, with the one bump
+                        self._publish_dirty.discard((namespace, key))
+                        unpublished.append((namespace, key))
+                        bump.append((namespace, db_key))
+            # Entries being written still count as dirty if they are evicted meanwhile
+            self._writing = dirty
+            meta = {
+                CHECKPOINT_META: covered_seq,
+                WARNING_ID_META: warning_store.next_id,
+            }
+            try:
+                bumped = await asyncio.to_thread(self.backend.write, upserts, deletes, meta, bump)
+            except Exception as e:
+                # The old segments stay on disk and are replayed if we restart first
+                self._snapshot_dirty |= dirty
+                self._publish_dirty.update(unpublished)
+                self._segments = covered_segments + self._segments
+                print(f"Failed to write snapshot to {STORAGE_URL}: {e}")
+                return 0
+            finally:
+                self._writing = set()
+            self._note_own_versions(bumped)
+            for entry in dirty:
+                # Tail changes of unread guilds are kept until the guild is
+                # read, in case the read started before this write
+                if entry not in self._snapshot_dirty and not self._guild_pending(*entry):
+                    self._evicted.pop(entry, None)
+            await asyncio.to_thread(self._remove_segments, covered_segments)
+            return len(dirty)
+
+    async def allocate_ids(self, name, count):
+        """Reserve count ids from a counter shared through the backend; returns the last one"""
+        return await asyncio.to_thread(self.backend.allocate, name, count)
+
+    def close(self):
+        self.backend.close()
+
+storage = None
+
+def mark_dirty(namespace, *key):
+    """Queue a changed state entry for the journal and the next checkpoint"""
+    if storage is not None:
+        storage.mark_dirty(namespace, key)
+
+journal_checkpoint = None  # checkpoint started by flush_journal once the journal grew too big
+
+@tasks.loop(seconds=1)
+async def flush_journal():
+    """Append changed state to the journal and publish changed configs"""
+    global journal_checkpoint
+    await storage.flush_journal()
+    await storage.publish()
+    if storage.journal_bytes > JOURNAL_CHECKPOINT_BYTES and not storage.checkpointing:
+        if journal_checkpoint is None or journal_checkpoint.done():
+            journal_checkpoint = bot.loop.create_task(storage.checkpoint())
+
+@tasks.loop(minutes=5)
+async def checkpoint_storage():
+    """Fold the journal into the backend snapshot"""
+    await storage.checkpoint()
+
+@tasks.loop(seconds=2)
+async def refresh_config_cache():
+    """Drop cached guild configs changed by other processes"""
+    for cache in (guild_configs, automod_configs):
+        try:
+            await storage.refresh(cache)
+        except Exception as e:
+            print(f"Failed to check {cache.namespace} versions: {e}")
+
+async def setup_hook():
+    """Load stored state before connecting to Discord"""
+    global storage
+    backend = open_backend(STORAGE_URL)
+    storage = Storage(backend, None if isinstance(backend, MemoryBackend) else JOURNAL_DIR)
+    started = time.perf_counter()
+    count, replayed = await asyncio.to_thread(storage.load)
+    print(f'Loaded {count} stored records and replayed {replayed} journal records '
+          f'in {time.perf_counter() - started:.2f}s')
+    try:
+        await regex_pool.start()
+    except RegexPoolError as e:
+        print(f"Regex rules will start their workers on first use: {e}")
+    rest.start()
+    flush_journal.start()
+    checkpoint_storage.start()
+    refresh_config_cache.start()
+    mute_scheduler.start()
+    reminder_engine.start()
+    join_pipeline.start()
+
+bot.setup_hook = setup_hook
+
+_bot_close = bot.close
+
+async def close_bot():
+    """Write pending state before shutting down"""
+    if storage is not None:
+        flush_journal.cancel()
+        checkpoint_storage.cancel()
+        refresh_config_cache.cancel()
+        if journal_checkpoint is not None:
+            try:
+                await journal_checkpoint
+            except Exception as e:
+                print(f"Journal checkpoint failed: {e}")
+        await storage.checkpoint()
+        storage.close()
+    regex_pool.shutdown()
+    await _bot_close()
+
+bot.close = close_bot
+
+# DATA EXPORT / IMPORT
+# Guild data moves between deployments as gzip-compressed JSONL, one record
+# per line: {"type", "guild_id", ..., "data"}. Both directions stream in
+# batches, so memory stays bounded by one batch plus one guild's key lists.
+EXPORT_BATCH = 1000  # records per compressed write
+IMPORT_BATCH_BYTES = 1024 * 1024  # JSONL read per import transaction
+
+def iter_guild_records(guild_id, role_ids=None):
+    """Yield the export records of one guild; reaction roles need the guild's role ids"""
+    yield {'type': 'guild_config', 'guild_id': guild_id, 'data': load_guild_config(guild_id).to_dict()}
+    yield {'type': 'automod_config', 'guild_id': guild_id, 'data': load_automod_config(guild_id)}
+    # Key lists are copied so the dicts can change between batches
+    members = warning_store.warnings.get(guild_id, {})
+    for user_id in list(members):
+        for warning_id, warning in list(members.get(user_id, {}).items()):
+            yield {'type': 'warning', 'guild_id': guild_id, 'user_id': user_id,
+                   'id': warning_id, 'data': warning.to_dict()}
+    for kind, state in (('xp', user_xp), ('economy', user_economy)):
+        for user_id, record in list(state.get(guild_id, {}).items()):
+            yield {'type': kind, 'guild_id': guild_id, 'user_id': user_id, 'data': record.to_dict()}
+    if guild_id in ticket_categories:
+        yield {'type': 'ticket_category', 'guild_id': guild_id, 'data': ticket_categories[guild_id]}
+    if role_ids is not None:
+        for message_id, emojis in list(reaction_roles.items()):
+            if all(role_id in role_ids for role_id in emojis.values()):
+                yield {'type': 'reaction_role', 'guild_id': guild_id, 'message_id': message_id, 'data': emojis}
+
+async def iter_all_records(guild_ids):
+    """Yield the export records of several guilds, then every reaction role
+
+    Each guild's member data is read before its records and released after
+    them, so only one guild's is resident at a time.
+    """
+    for guild_id in guild_ids:
+        await storage.load_guild_async(guild_id)
+        for record in iter_guild_records(guild_id):
+            yield record
+        storage.release_guild(guild_id)
+    # Reaction roles are keyed by message alone, so offline exports cannot tell their guild
+    for message_id, emojis in list(reaction_roles.items()):
+        yield {'type': 'reaction_role', 'guild_id': None, 'message_id': message_id, 'data': emojis}
+
+def stored_guild_ids():
+    """Every guild with stored data, for offline exports; reads keys only, never the rows"""
+    guild_ids = set(warning_store.warnings) | set(user_xp) | set(user_economy) | set(ticket_categories)
+    guild_ids.update(key[0] for namespace, key in storage._evicted if namespace in LAZY_NAMESPACES)
+    for namespace, key in storage.backend.scan_keys(LAZY_NAMESPACES):
+        guild_ids.add(int(key.split(':', 1)[0]))
+    return sorted(guild_ids)
+
+async def _aiter_records(records):
+    for record in records:
+        yield record
+
+async def export_records(path, records):
+    """Stream records, an iterable or async iterable, into a gzip JSONL file, compressing each batch in a worker thread"""
+    if not hasattr(records, '__aiter__'):
+        records = _aiter_records(records)
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        batch = []
+        async for record in records:
+            batch.append(json.dumps(record, separators=(',', ':'), default=_encode_default))
+            if len(batch) == EXPORT_BATCH:
+                await asyncio.to_thread(f.write, '\n'.join(batch) + '\n')
+                count += len(batch)
+                batch = []
+        if batch:
+            await asyncio.to_thread(f.write, '\n'.join(batch) + '\n')
+            count += len(batch)
+    return count
+
+def is_snowflake(value):
+    return type(value) is int and 0 <= value < 2 ** 63
+
+def is_count(value, low=0, high=2 ** 63 - 1):
+    return type(value) is int and low <= value <= high
+
+def is_optional_snowflake(value):
+    return value is None or is_snowflake(value)
+
+def is_optional_text(value, limit=2000):
+    return value is None or (isinstance(value, str) and len(value) <= limit)
+
+def is_score(value):
+    return type(value) in (int, float) and 0 < value < 1e6
+
+# Field checks for imported records; fields missing from a record keep their defaults
+IMPORT_FIELDS = {
+    'guild_config': {
+        'prefix': lambda value: isinstance(value, str) and 0 < len(value) <= 10,
+        'log_channel': is_optional_snowflake,
+        'mute_role': is_optional_snowflake,
+        'welcome_channel': is_optional_snowflake,
+        'welcome_message': is_optional_text,
+        'leave_channel': is_optional_snowflake,
+        'leave_message': is_optional_text,
+        'autoroles': lambda value: isinstance(value, list) and len(value) <= 250 and all(map(is_snowflake, value)),
+        'levelup_mode': lambda value: value in LEVELUP_MODES,
+        'levelup_channel': is_optional_snowflake,
+        'levelup_window': lambda value: is_count(value, LEVELUP_CHANNEL_INTERVAL, 86400),
+    },
+    'warning': {
+        'reason': lambda value: isinstance(value, str) and len(value) <= 2000,
+        'moderator': is_snowflake,
+        'timestamp': is_count,
+    },
+    'xp': {
+        'xp': is_count,
+        'level': lambda value: is_count(value, 1),
+    },
+    'economy': {
+        'coins': lambda value: is_count(value, -(2 ** 63), 2 ** 63 - 1),
+        'bank': lambda value: is_count(value, -(2 ** 63), 2 ** 63 - 1),
+        'last_daily': lambda value: value is None or is_count(value),
+        'last_work': lambda value: value is None or is_count(value),
+    },
+    # The ranges match what the !automod commands accept
+    'automod_config': {
+        'enabled': lambda value: type(value) is bool,
+        'anti_spam': lambda value: type(value) is bool,
+        'spam_messages': lambda value: is_count(value, 2, 50),
+        'spam_seconds': lambda value: is_count(value, 1, 120),
+        'anti_raid': lambda value: type(value) is bool,
+        'raid_joins': lambda value: is_count(value, 3, 500),
+        'raid_seconds': lambda value: is_count(value, 5, 600),
+        'raid_action': lambda value: value in RAID_ACTIONS,
+        'raid_account_age': lambda value: is_count(value, 0, 36500),
+        'anti_duplicates': lambda value: type(value) is bool,
+        'duplicate_messages': lambda value: is_count(value, 2, 20),
+        'duplicate_seconds': lambda value: is_count(value, 5, 300),
+        'regex_rules': lambda value: isinstance(value, list) and len(value) <= REGEX_MAX_RULES,
+        'filter_words': lambda value: isinstance(value, list) and all(
+            isinstance(word, str) and 0 < len(word) <= 100 for word in value
+        ),
+        'filter_links': lambda value: type(value) is bool,
+        'filter_invites': lambda value: type(value) is bool,
+        'max_mentions': lambda value: value is None or is_count(value, 0, 10000),
+        'max_emojis': lambda value: value is None or is_count(value, 0, 10000),
+        'punishment': lambda value: value in PUNISHMENT_SEVERITY,
+        'escalate_mute': lambda value: value is None or is_score(value),
+        'escalate_kick': lambda value: value is None or is_score(value),
+        'violation_half_life': lambda value: is_count(value, 60, 10080 * 60),
+        'automod_mute_duration': lambda value: value is None or is_count(value, 60, 28 * 86400),
+    },
+}
+
+async def check_import_record(record):
+    """Return why a parsed export record can't be imported, or None if it can"""
+    if not isinstance(record, dict):
+        return "not an object"
+    kind = record.get('type')
+    data = record.get('data')
+    guild_id = record.get('guild_id')
+    if not (is_snowflake(guild_id) or (kind == 'reaction_role' and guild_id is None)):
+        return "bad guild_id"
+    if kind in ('warning', 'xp', 'economy') and not is_snowflake(record.get('user_id')):
+        return "bad user_id"
+    if kind == 'warning' and not is_snowflake(record.get('id')):
+        return "bad warning id"
+    if kind == 'ticket_category':
+        return None if is_snowflake(data) else "bad ticket category"
+    if kind == 'reaction_role':
+        if not is_snowflake(record.get('message_id')):
+            return "bad message_id"
+        if not isinstance(data, dict) or not data or not all(
+            isinstance(emoji, str) and len(emoji) <= 100 and is_snowflake(role_id) for emoji, role_id in data.items()
+        ):
+            return "bad reaction roles"
+        return None
+    if kind not in IMPORT_FIELDS:
+        return f"unknown record type {kind!r}"
+    if not isinstance(data, dict):
+        return "data is not an object"
+    
+    fields = IMPORT_FIELDS[kind]
+    for name, value in data.items():
+        if name in fields and not fields[name](value):
+            return f"bad {kind} field {name!r}"
+    if kind == 'automod_config':
+        mute_at, kick_at = data.get('escalate_mute'), data.get('escalate_kick')
+        if mute_at is not None and kick_at is not None and kick_at <= mute_at:
+            return "escalate_kick must be above escalate_mute"
+        names = set()
+        for rule in data.get('regex_rules', ()):
+            if not isinstance(rule, dict) or not isinstance(rule.get('name'), str) or not isinstance(rule.get('pattern'), str):
+                return "bad regex rule"
+            if not 0 < len(rule['name']) <= 100 or rule['name'].lower() in names:
+                return "bad regex rule name"
+            names.add(rule['name'].lower())
+            error = await validate_regex_rule(rule['pattern'])
+            if error:
+                return f"regex rule {rule['name']!r}: {error}"
+    return None
+
+def apply_import_record(record):
+    """Store one exported record, replacing any existing entry; check it with check_import_record first"""
+    kind = record['type']
+    guild_id = record['guild_id']
+    data = record['data']
+    if kind == 'guild_config':
+        config = load_guild_config(guild_id)
+        imported = GuildConfig.from_dict(data)
+        for name in GuildConfig.__slots__:
+            setattr(config, name, getattr(imported, name))
+        save_guild_config(guild_id, config)
+    elif kind == 'automod_config':
+        fields = IMPORT_FIELDS['automod_config']
+        settings = {name: value for name, value in data.items() if name in fields}
+        if 'regex_rules' in settings:
+            # Imported rules start enabled with a clean timeout count, as if added by !automod regex add
+            settings['regex_rules'] = [
+                {'name': rule['name'].lower(), 'pattern': rule['pattern'], 'enabled': True, 'timeouts': 0}
+                for rule in settings['regex_rules']
+            ]
+        config = load_automod_config(guild_id)
+        config.update(settings)
+        save_automod_config(guild_id, config)
+    elif kind == 'warning':
+        warning_store.put(guild_id, record['user_id'], record['id'], WarningRecord.from_dict(data))
+    elif kind in ('xp', 'economy'):
+        state, record_type = (user_xp, XPRecord) if kind == 'xp' else (user_economy, EconomyRecord)
+        state.setdefault(guild_id, {})[record['user_id']] = record_type.from_dict(data)
+        mark_dirty(f'user_{kind}', guild_id, record['user_id'])
+    elif kind == 'ticket_category':
+        ticket_categories[guild_id] = data
+        mark_dirty('ticket_categories', guild_id)
+    elif kind == 'reaction_role':
+        reaction_roles[record['message_id']] = data
+        mark_dirty('reaction_roles', record['message_id'])
+    else:
+        raise ValueError(f"Unknown record type: {kind}")
+
+async def import_records(path, accept=None):
+    """Load a gzip JSONL export, committing each batch to storage as one transaction
+
+    Returns (imported, skipped by accept, invalid) counts.
+    """
+    imported = skipped = invalid = 0
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        while True:
+            lines = await asyncio.to_thread(f.readlines, IMPORT_BATCH_BYTES)
+            if not lines:
+                break
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    invalid += 1
+                    continue
+                error = await check_import_record(record)
+                if error:
+                    if invalid < 10:
+                        print(f"Skipping invalid export record: {error}")
+                    invalid += 1
+                    continue
+                if accept is not None and not accept(record):
+                    skipped += 1
+                    continue
+                if storage is not None and record['guild_id'] is not None:
+                    await storage.load_guild_async(record['guild_id'])
+                apply_import_record(record)
+                imported += 1
+            if storage is not None:
+                await storage.checkpoint()
+    return imported, skipped, invalid
+
+def describe_throughput(count, path, elapsed):
+    size = os.path.getsize(path) / (1024 * 1024)
+    return (f"{count:,} records, {size:.1f} MiB compressed in {elapsed:.2f}s "
+            f"({count / max(elapsed, 1e-9):,.0f} records/s)")
+
+@bot.group(name='data')
+@commands.has_permissions(administrator=True)
+async def data_group(ctx):
+    """Export or import this server's stored data"""
+    if ctx.invoked_subcommand is None:
+        await ctx.send("Use `!data export` or `!data import` with an export attached.")
+
+@data_group.command(name='export')
+async def data_export(ctx):
+    """Export this server's data as gzip JSONL"""
+    role_ids = {role.id for role in ctx.guild.roles}
+    fd, path = tempfile.mkstemp(suffix='.jsonl.gz')
+    os.close(fd)
+    try:
+        started = time.perf_counter()
+        count = await export_records(path, iter_guild_records(ctx.guild.id, role_ids))
+        summary = describe_throughput(count, path, time.perf_counter() - started)
+        await ctx.send(
+            f"📦 Exported {summary}",
+            file=discord.File(path, filename=f"{ctx.guild.id}-export.jsonl.gz")
+        )
+    except Exception as e:
+        await ctx.send(f"Failed to export data: {e}")
+    finally:
+        os.remove(path)
+
+@data_group.command(name='import')
+async def data_import(ctx):
+    """Import an attached export; only records for this server are loaded"""
+    if not ctx.message.attachments:
+        await ctx.send("Attach a `.jsonl.gz` export to import.")
+        return
+
+    guild = ctx.guild
+
+    def accept(record):
+        if record['guild_id'] != guild.id:
+            return False
+        if record['type'] == 'reaction_role':
+            # Message ids are global, so only entries this guild already owns may be replaced
+            current = reaction_roles.get(record['message_id'])
+            return (current is not None and all(guild.get_role(role_id) for role_id in current.values())
+                    and all(guild.get_role(role_id) for role_id in record['data'].values()))
+        return True
+
+    fd, path = tempfile.mkstemp(suffix='.jsonl.gz')
+    os.close(fd)
+    try:
+        await ctx.message.attachments[0].save(path)
+        started = time.perf_counter()
+        imported, skipped, invalid = await import_records(path, accept)
+        summary = describe_throughput(imported, path, time.perf_counter() - started)
+        await ctx.send(f"📥 Imported {summary}"
+                       + (f"\nSkipped {skipped:,} records for other servers or messages." if skipped else "")
+                       + (f"\nRejected {invalid:,} invalid records." if invalid else ""))
+        await log_action(guild, f"**{ctx.author}** imported {imported:,} data records")
+    except Exception as e:
+        await ctx.send(f"Failed to import data: {e}")
+    finally:
+        os.remove(path)
+
+async def run_data_command(args):
+    """Offline export or import against the configured storage; stop the bot first
+
+    args carries command ('export' or 'import'), path and, for exports, an
+    optional guild list; tools/data.py parses them from the command line.
+    """
+    global storage
+    backend = open_backend(STORAGE_URL)
+    storage = Storage(backend, None if isinstance(backend, MemoryBackend) else JOURNAL_DIR)
+    try:
+        await asyncio.to_thread(storage.load)
+        started = time.perf_counter()
+        if args.command == 'export':
+            guild_ids = args.guild or await asyncio.to_thread(stored_guild_ids)
+            count = await export_records(args.path, iter_all_records(guild_ids))
+            print(f"Exported {describe_throughput(count, args.path, time.perf_counter() - started)}")
+        else:
+            count, _, invalid = await import_records(args.path)
+            print(f"Imported {describe_throughput(count, args.path, time.perf_counter() - started)}"
+                  + (f", rejected {invalid:,} invalid records" if invalid else ""))
+        await storage.checkpoint()
+    finally:
+        storage.close()
+
+# Modified on_message to include XP system
 @bot.event
 async def on_message_combined(message):
     if message.author.bot:
@@ -1352,6 +5436,7 @@ async def on_message_combined(message):
     
     # Check automod
     if message.guild:
+        await load_guild_state(message.guild.id)
         await check_automod(message)
         # Award XP
         await on_message_xp(message)
@@ -1359,8 +5444,13 @@ async def on_message_combined(message):
     await bot.process_commands(message)
 
 # Replace the on_message event
-bot.remove_listener(on_message)
-bot.add_listener(on_message_combined, 'on_message')
+bot.on_message = on_message_combined
+
+@bot.before_invoke
+async def load_command_guild_state(ctx):
+    """Commands read configs synchronously, so load them before the command runs"""
+    if ctx.guild:
+        await load_guild_state(ctx.guild.id)
 
 # BOT TOKEN - Replace with your bot token
 # bot.run('MTM5MzU1NTM0ODI4NzM5MzgyMg.GdTnJv.ckKWNKCZ7al-7i6kulNK-om1lD9kqSO2yvjF3c')
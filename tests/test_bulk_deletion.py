@@ -0,0 +1,119 @@
+"""Batching automod deletions per channel, the bulk delete fallback, and punishing once per member.
+
+Run from the repository root:
+
+    python -m unittest tests.test_bulk_deletion
+"""
+import asyncio
+import os
+import sys
+import unittest
+from unittest import mock
+
+import discord
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+GUILD_ID = 1046520000000000000
+CHANNEL_ID = 1046520000000000001
+
+
+class FakeChannel:
+    def __init__(self):
+        self.id = CHANNEL_ID
+        self.guild = mock.Mock(id=GUILD_ID)
+        self.mention = f'<#{CHANNEL_ID}>'
+        self.delete_messages = mock.AsyncMock()
+        self.guild.get_role.return_value = None
+
+
+def fake_message(channel, author_id):
+    author = mock.Mock(id=author_id)
+    author.__str__ = lambda _: f'user{author_id}'
+    return mock.Mock(channel=channel, author=author, delete=mock.AsyncMock())
+
+
+async def call(lane, route, func, *args, **kwargs):
+    return await func(*args, **kwargs)
+
+
+class BulkDeletionTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.channel = FakeChannel()
+        self.log_action = mock.AsyncMock()
+        self.punish = mock.AsyncMock()
+        patches = (
+            mock.patch.object(carlbot, 'rest', mock.Mock(call=mock.AsyncMock(side_effect=call))),
+            mock.patch.object(carlbot, 'log_action', self.log_action),
+            mock.patch.object(carlbot, 'apply_automod_punishment', self.punish),
+            mock.patch.object(carlbot, 'automod_violations', carlbot.OrderedDict()),
+            mock.patch.object(carlbot, 'BULK_DELETE_WINDOW', 0.01),
+            mock.patch.dict(carlbot.pending_deletions, clear=True),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(carlbot.automod_configs.invalidate, GUILD_ID)
+        self.addCleanup(carlbot.guild_configs.invalidate, GUILD_ID)
+
+    async def queue(self, author_id, violations=('Filtered word',), punishment='warn'):
+        message = fake_message(self.channel, author_id)
+        await carlbot.delete_message_and_punish(message, list(violations), punishment)
+        return message
+
+    async def settle(self):
+        await asyncio.gather(*carlbot.deletion_flushes)
+
+    async def test_a_channel_window_is_one_bulk_delete(self):
+        messages = [await self.queue(n) for n in range(3)]
+        self.channel.delete_messages.assert_not_awaited()
+        await self.settle()
+        self.channel.delete_messages.assert_awaited_once_with(messages)
+        self.assertNotIn(CHANNEL_ID, carlbot.pending_deletions)
+
+    async def test_a_single_message_is_deleted_alone(self):
+        message = await self.queue(1)
+        await self.settle()
+        message.delete.assert_awaited_once()
+        self.channel.delete_messages.assert_not_awaited()
+
+    async def test_a_full_batch_is_flushed_at_once(self):
+        with mock.patch.object(carlbot, 'BULK_DELETE_MAX', 3):
+            messages = [await self.queue(n) for n in range(3)]
+        self.channel.delete_messages.assert_awaited_once_with(messages)
+        await self.settle()
+        self.channel.delete_messages.assert_awaited_once()
+
+    async def test_a_failed_bulk_delete_falls_back_to_single_deletes(self):
+        error = discord.HTTPException(mock.Mock(status=400, reason='Bad Request'), 'too old')
+        self.channel.delete_messages.side_effect = error
+        messages = [await self.queue(n) for n in range(3)]
+        messages[1].delete.side_effect = error
+        await self.settle()
+        for message in messages:
+            message.delete.assert_awaited_once()
+        self.punish.assert_awaited()
+
+    async def test_each_member_is_logged_and_punished_once(self):
+        await self.queue(1, ['Filtered word'])
+        await self.queue(2, ['Discord invite'], 'mute')
+        await self.queue(1, ['Filtered word', 'External link'], 'kick')
+        await self.settle()
+
+        self.log_action.assert_awaited_once()
+        log_text = self.log_action.await_args.args[1]
+        self.assertIn("Deleted 3 messages", log_text)
+        self.assertIn("**user1** (2 messages): Filtered word, External link", log_text)
+        self.assertIn("**user2** (1 message): Discord invite", log_text)
+
+        punished = {call.args[1].id: call.args[2:4] for call in self.punish.await_args_list}
+        self.assertEqual(punished, {1: ('Filtered word, External link', 'kick'), 2: ('Discord invite', 'mute')})
+        # Each deleted message adds to the member's violation score
+        self.assertEqual(carlbot.automod_violations[(GUILD_ID, 1)][0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""Checking imported records, batched import checkpoints and the export round trip.
+
+Run from the repository root:
+
+    python -m unittest tests.test_data_import
+"""
+import gzip
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+GUILD_ID = 1046520000000000000
+USER_ID = 1046520000000001000
+
+
+def write_export(path, records):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for record in records:
+            f.write((record if isinstance(record, str) else json.dumps(record)) + '\n')
+
+
+class CheckImportRecordTest(unittest.IsolatedAsyncioTestCase):
+
+    async def check(self, record):
+        return await carlbot.check_import_record(record)
+
+    async def test_valid_records_pass(self):
+        for record in (
+            {'type': 'xp', 'guild_id': GUILD_ID, 'user_id': USER_ID, 'data': {'xp': 10, 'level': 2}},
+            {'type': 'warning', 'guild_id': GUILD_ID, 'user_id': USER_ID, 'id': 7,
+             'data': {'reason': 'spam', 'moderator': USER_ID, 'timestamp': 1700000000}},
+            {'type': 'guild_config', 'guild_id': GUILD_ID, 'data': {'prefix': '?', 'autoroles': [1, 2]}},
+            {'type': 'ticket_category', 'guild_id': GUILD_ID, 'data': 5},
+            {'type': 'reaction_role', 'guild_id': None, 'message_id': 9, 'data': {'👍': 3}},
+        ):
+            with self.subTest(type=record['type']):
+                self.assertIsNone(await self.check(record))
+
+    async def test_bad_records_are_rejected(self):
+        xp = {'type': 'xp', 'guild_id': GUILD_ID, 'user_id': USER_ID, 'data': {'xp': 10, 'level': 2}}
+        cases = {
+            'not an object': [xp],
+            'bad guild_id': dict(xp, guild_id=-1),
+            'bad user_id': dict(xp, user_id='1'),
+            "bad xp field 'xp'": dict(xp, data={'xp': 1.5}),
+            "bad xp field 'level'": dict(xp, data={'level': 0}),
+            'data is not an object': dict(xp, data=[]),
+            "unknown record type 'badge'": dict(xp, type='badge'),
+            "bad guild_config field 'prefix'": {'type': 'guild_config', 'guild_id': GUILD_ID, 'data': {'prefix': ''}},
+            'bad ticket category': {'type': 'ticket_category', 'guild_id': GUILD_ID, 'data': 'x'},
+            'bad reaction roles': {'type': 'reaction_role', 'guild_id': None, 'message_id': 9, 'data': {}},
+            'escalate_kick must be above escalate_mute': {
+                'type': 'automod_config', 'guild_id': GUILD_ID, 'data': {'escalate_mute': 5, 'escalate_kick': 5},
+            },
+        }
+        for error, record in cases.items():
+            with self.subTest(error=error):
+                self.assertEqual(await self.check(record), error)
+
+
+class ImportRecordsTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, 'export.jsonl.gz')
+        self.storage = carlbot.Storage(carlbot.MemoryBackend(), None)
+        patches = (
+            mock.patch.object(carlbot, 'storage', self.storage),
+            mock.patch.object(carlbot, 'warning_store', carlbot.WarningStore()),
+            mock.patch.dict(carlbot.user_xp, clear=True),
+            mock.patch.dict(carlbot.user_economy, clear=True),
+            mock.patch.dict(carlbot.ticket_categories, clear=True),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(carlbot.guild_configs.invalidate, GUILD_ID)
+        self.addCleanup(carlbot.automod_configs.invalidate, GUILD_ID)
+
+    async def test_invalid_lines_are_counted_and_skipped(self):
+        write_export(self.path, [
+            {'type': 'xp', 'guild_id': GUILD_ID, 'user_id': USER_ID, 'data': {'xp': 10, 'level': 2}},
+            'not json',
+            {'type': 'xp', 'guild_id': GUILD_ID, 'user_id': USER_ID + 1, 'data': {'xp': -1}},
+        ])
+        with mock.patch('builtins.print'):
+            imported, skipped, invalid = await carlbot.import_records(self.path)
+        self.assertEqual((imported, skipped, invalid), (1, 0, 2))
+        self.assertEqual(list(carlbot.user_xp[GUILD_ID]), [USER_ID])
+
+    async def test_each_batch_is_checkpointed(self):
+        write_export(self.path, [
+            {'type': 'xp', 'guild_id': GUILD_ID, 'user_id': USER_ID + i, 'data': {'xp': i, 'level': 1}}
+            for i in range(50)
+        ])
+        checkpoint = mock.AsyncMock(wraps=self.storage.checkpoint)
+        with mock.patch.object(carlbot, 'IMPORT_BATCH_BYTES', 1024), \
+                mock.patch.object(self.storage, 'checkpoint', checkpoint):
+            imported, _, _ = await carlbot.import_records(self.path)
+        self.assertEqual(imported, 50)
+        self.assertGreater(checkpoint.await_count, 1)
+        self.assertEqual(len(self.storage.backend.scan_keys({'user_xp'})), 50)
+
+    async def test_accept_filters_records(self):
+        write_export(self.path, [
+            {'type': 'ticket_category', 'guild_id': GUILD_ID, 'data': 5},
+            {'type': 'ticket_category', 'guild_id': GUILD_ID + 1, 'data': 6},
+        ])
+        imported, skipped, _ = await carlbot.import_records(self.path, lambda record: record['guild_id'] == GUILD_ID)
+        self.assertEqual((imported, skipped), (1, 1))
+        self.assertEqual(carlbot.ticket_categories, {GUILD_ID: 5})
+
+    async def test_export_then_import_restores_the_guild(self):
+        config = carlbot.load_guild_config(GUILD_ID)
+        config.prefix = '?'
+        carlbot.save_guild_config(GUILD_ID, config)
+        carlbot.user_xp[GUILD_ID] = {USER_ID: carlbot.XPRecord(120, 3)}
+        carlbot.user_economy[GUILD_ID] = {USER_ID: carlbot.EconomyRecord(50, 10)}
+        carlbot.warning_store.add(GUILD_ID, USER_ID, carlbot.WarningRecord('spam', USER_ID + 1, 1700000000))
+        carlbot.ticket_categories[GUILD_ID] = 77
+        exported = await carlbot.export_records(self.path, carlbot.iter_guild_records(GUILD_ID))
+        expected = list(carlbot.iter_guild_records(GUILD_ID))
+
+        carlbot.guild_configs.invalidate(GUILD_ID)
+        carlbot.automod_configs.invalidate(GUILD_ID)
+        carlbot.user_xp.clear()
+        carlbot.user_economy.clear()
+        carlbot.ticket_categories.clear()
+        with mock.patch.object(carlbot, 'warning_store', carlbot.WarningStore()):
+            imported, _, invalid = await carlbot.import_records(self.path)
+            self.assertEqual((imported, invalid), (exported, 0))
+            self.assertEqual(carlbot.load_guild_config(GUILD_ID).prefix, '?')
+            restored = list(carlbot.iter_guild_records(GUILD_ID))
+        self.assertEqual(json.loads(json.dumps(restored, default=carlbot._encode_default)),
+                         json.loads(json.dumps(expected, default=carlbot._encode_default)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""DuplicateDetector catching near-duplicate floods and forgetting messages that left the window.
+
+Run from the repository root:
+
+    python -m unittest tests.test_duplicate_detector
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+CHANNEL_ID = 1
+WINDOW = 30
+SPAM = "join my server for free nitro giveaway click now"
+
+
+class DuplicateDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = carlbot.DuplicateDetector(history=5)
+
+    def check(self, text, now, channel_id=CHANNEL_ID):
+        return self.detector.check(channel_id, text.lower(), WINDOW, now=now)
+
+    def index_size(self, channel_id=CHANNEL_ID):
+        entries, index = self.detector._channels[channel_id]
+        return len(entries), sum(map(len, index.values()))
+
+    def test_short_messages_have_no_signature(self):
+        self.assertIsNone(self.detector.signature('hi there'))
+        self.assertEqual(self.check('hi there', 0), 0)
+
+    def test_the_signature_fills_every_bin(self):
+        signature = self.detector.signature('just short enough')
+        self.assertEqual(len(signature), carlbot.DuplicateDetector.NUM_HASHES)
+        self.assertNotIn(None, signature)
+        self.assertEqual(signature, self.detector.signature('just   short, enough!'))
+
+    def test_near_duplicates_are_counted(self):
+        for n in range(3):
+            self.assertEqual(self.check(f"{SPAM} {n}", n), n)
+        self.assertEqual(self.check("did anyone watch the new episode yesterday", 3), 0)
+
+    def test_channels_are_separate(self):
+        self.check(SPAM, 0)
+        self.assertEqual(self.check(SPAM, 1, channel_id=CHANNEL_ID + 1), 0)
+
+    def test_counting_stops_at_stop_at(self):
+        for n in range(4):
+            self.check(SPAM, n)
+        self.assertEqual(self.detector.check(CHANNEL_ID, SPAM, WINDOW, stop_at=2, now=4), 2)
+
+    def test_messages_leave_the_window(self):
+        self.check(SPAM, 0)
+        self.check(SPAM, 1)
+        self.assertEqual(self.check(SPAM, WINDOW + 0.5), 1)
+        self.assertEqual(self.index_size()[0], 2)
+
+    def test_history_is_bounded_and_the_index_follows_it(self):
+        bands = carlbot.DuplicateDetector.NUM_HASHES // carlbot.DuplicateDetector.ROWS_PER_BAND
+        for n in range(20):
+            self.check(f"message number {n} about something else entirely {n * 7919}", n * 0.1)
+        entries, indexed = self.index_size()
+        self.assertEqual(entries, 5)
+        self.assertEqual(indexed, 5 * bands)
+
+    def test_a_forgotten_flood_empties_the_index(self):
+        for n in range(5):
+            self.check(SPAM, n)
+        self.check("something completely different from before", WINDOW * 3)
+        entries, index = self.detector._channels[CHANNEL_ID]
+        self.assertEqual(len(entries), 1)
+        self.assertTrue(all(len(bucket) == 1 for bucket in index.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
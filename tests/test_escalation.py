@@ -0,0 +1,149 @@
+"""Decaying violation scores, escalation thresholds and falling back to a punishment the bot can apply.
+
+Run from the repository root:
+
+    python -m unittest tests.test_escalation
+"""
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+GUILD_ID = 1
+USER_ID = 2
+HALF_LIFE = 3600
+
+
+def escalation_config(mute_at=3, kick_at=6):
+    config = carlbot.default_automod_config()
+    config['escalate_mute'] = mute_at
+    config['escalate_kick'] = kick_at
+    return config
+
+
+class ViolationScoreTest(unittest.TestCase):
+
+    def setUp(self):
+        patch = mock.patch.object(carlbot, 'automod_violations', carlbot.OrderedDict())
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_scores_add_up(self):
+        carlbot.add_violation_score(GUILD_ID, USER_ID, 1, HALF_LIFE, now=1000)
+        self.assertEqual(carlbot.add_violation_score(GUILD_ID, USER_ID, 2, HALF_LIFE, now=1000), 3)
+
+    def test_a_score_halves_every_half_life(self):
+        carlbot.add_violation_score(GUILD_ID, USER_ID, 4, HALF_LIFE, now=1000)
+        self.assertAlmostEqual(carlbot.current_violation_score(GUILD_ID, USER_ID, HALF_LIFE, now=1000 + HALF_LIFE), 2)
+        self.assertAlmostEqual(carlbot.current_violation_score(GUILD_ID, USER_ID, HALF_LIFE, now=1000 + 2 * HALF_LIFE), 1)
+        self.assertAlmostEqual(carlbot.add_violation_score(GUILD_ID, USER_ID, 1, HALF_LIFE, now=1000 + 2 * HALF_LIFE), 2)
+
+    def test_a_decayed_score_is_dropped(self):
+        carlbot.add_violation_score(GUILD_ID, USER_ID, 1, HALF_LIFE, now=1000)
+        self.assertEqual(carlbot.current_violation_score(GUILD_ID, USER_ID, HALF_LIFE, now=1000 + 10 * HALF_LIFE), 0)
+        self.assertNotIn((GUILD_ID, USER_ID), carlbot.automod_violations)
+
+    def test_later_writes_prune_stale_scores(self):
+        carlbot.add_violation_score(GUILD_ID, USER_ID, 1, HALF_LIFE, now=1000)
+        carlbot.add_violation_score(GUILD_ID, USER_ID + 1, 1, HALF_LIFE, now=1000 + 10 * HALF_LIFE)
+        self.assertEqual(list(carlbot.automod_violations), [(GUILD_ID, USER_ID + 1)])
+
+
+class EscalatePunishmentTest(unittest.TestCase):
+
+    def test_thresholds(self):
+        config = escalation_config()
+        for score, expected in ((0, 'warn'), (2.9, 'warn'), (3, 'mute'), (5.9, 'mute'), (6, 'kick'), (50, 'kick')):
+            with self.subTest(score=score):
+                self.assertEqual(carlbot.escalate_punishment('warn', score, config), expected)
+
+    def test_a_harsher_base_punishment_is_kept(self):
+        self.assertEqual(carlbot.escalate_punishment('ban', 10, escalation_config()), 'ban')
+        self.assertEqual(carlbot.escalate_punishment('kick', 4, escalation_config()), 'kick')
+
+    def test_disabled_thresholds_never_escalate(self):
+        self.assertEqual(carlbot.escalate_punishment('warn', 100, escalation_config(None, None)), 'warn')
+        self.assertEqual(carlbot.escalate_punishment('warn', 100, escalation_config(3, None)), 'mute')
+
+    def test_no_mute_without_a_mute_role(self):
+        self.assertEqual(carlbot.escalate_punishment('warn', 4, escalation_config(), can_mute=False), 'warn')
+        self.assertEqual(carlbot.escalate_punishment('warn', 6, escalation_config(), can_mute=False), 'kick')
+
+
+class FakeGuild:
+    """A guild whose bot member has the given permissions and top role position"""
+
+    id = GUILD_ID
+    name = 'guild'
+
+    def __init__(self, top_role=10, **permissions):
+        self.me = mock.Mock(top_role=top_role)
+        self.me.guild_permissions = mock.Mock(**{
+            'kick_members': True, 'ban_members': True, 'manage_roles': True, **permissions,
+        })
+        self.ban = mock.AsyncMock()
+
+
+class ApplyPunishmentTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.member = mock.Mock(id=USER_ID, top_role=5, send=mock.AsyncMock(),
+                                add_roles=mock.AsyncMock(), kick=mock.AsyncMock())
+        self.mute_role = mock.Mock(id=3)
+        self.mute_role.__lt__ = lambda role, other: 5 < other
+        self.rest_call = mock.AsyncMock()
+        self.log_action = mock.AsyncMock()
+        self.mute_scheduler = mock.Mock()
+        self.warning_store = mock.Mock()
+        patches = (
+            mock.patch.object(carlbot, 'bot', mock.Mock(user=mock.Mock(id=99))),
+            mock.patch.object(carlbot, 'rest', mock.Mock(call=self.rest_call)),
+            mock.patch.object(carlbot, 'log_action', self.log_action),
+            mock.patch.object(carlbot, 'mute_scheduler', self.mute_scheduler),
+            mock.patch.object(carlbot, 'warning_store', self.warning_store),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def called(self):
+        return [call.args[2] for call in self.rest_call.await_args_list]
+
+    async def test_a_kick_is_applied_when_allowed(self):
+        await carlbot.apply_automod_punishment(FakeGuild(), self.member, 'spam', 'kick', self.mute_role)
+        self.assertEqual(self.called(), [self.member.send, self.member.kick])
+
+    async def test_a_kick_without_permission_falls_back_to_a_mute(self):
+        await carlbot.apply_automod_punishment(FakeGuild(kick_members=False), self.member, 'spam', 'kick',
+                                               self.mute_role, 600)
+        self.assertEqual(self.called(), [self.member.add_roles, self.member.send])
+        self.assertIn("Could not kick", self.log_action.await_args_list[0].args[1])
+        self.mute_scheduler.schedule.assert_called_once()
+
+    async def test_a_ban_above_the_bot_falls_back_to_a_warning(self):
+        # The member outranks the bot, and there is no mute role to fall back on
+        await carlbot.apply_automod_punishment(FakeGuild(top_role=3), self.member, 'spam', 'ban')
+        self.warning_store.add.assert_called_once()
+        self.assertEqual(self.called(), [self.member.send])
+        self.assertIn("Could not ban", self.log_action.await_args_list[0].args[1])
+
+    async def test_an_automod_mute_expires(self):
+        before = int(time.time())
+        await carlbot.apply_automod_punishment(FakeGuild(), self.member, 'spam', 'mute', self.mute_role, 600)
+        guild_id, user_id, role_id, expires_at = self.mute_scheduler.schedule.call_args.args
+        self.assertEqual((guild_id, user_id, role_id), (GUILD_ID, USER_ID, 3))
+        self.assertGreaterEqual(expires_at, before + 600)
+        self.log_action.assert_not_awaited()
+
+    async def test_a_permanent_automod_mute(self):
+        await carlbot.apply_automod_punishment(FakeGuild(), self.member, 'spam', 'mute', self.mute_role, None)
+        self.assertIsNone(self.mute_scheduler.schedule.call_args.args[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""JoinPipeline rendering batched welcome messages and dropping joins past its overflow.
+
+Run from the repository root:
+
+    python -m unittest tests.test_join_pipeline
+"""
+import asyncio
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+GUILD = mock.Mock(member_count=1234)
+GUILD.name = 'Test Server'
+
+
+def members(count, start=1046520000000000000):
+    return [mock.Mock(mention=f'<@{start + n}>') for n in range(count)]
+
+
+class RenderWelcomesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pipeline = carlbot.JoinPipeline()
+
+    def render(self, template, joined):
+        messages = self.pipeline._render_welcomes(template, GUILD, joined)
+        for message in messages:
+            self.assertLessEqual(len(message), carlbot.WELCOME_MESSAGE_CHARS)
+        return messages
+
+    def test_one_member(self):
+        self.assertEqual(self.render('Welcome {user} to {server}! You are #{membercount}', members(1)),
+                         ['Welcome <@1046520000000000000> to Test Server! You are #1234'])
+
+    def test_a_batch_shares_one_message(self):
+        joined = members(3)
+        mentions = ', '.join(member.mention for member in joined)
+        self.assertEqual(self.render('Hi {user}!', joined), [f'Hi {mentions}!'])
+
+    def test_every_placeholder_gets_the_whole_batch(self):
+        joined = members(2)
+        mentions = ', '.join(member.mention for member in joined)
+        self.assertEqual(self.render('{user} joined. Welcome, {user}', joined),
+                         [f'{mentions} joined. Welcome, {mentions}'])
+
+    def test_batches_are_capped_by_mentions(self):
+        joined = members(carlbot.WELCOME_BATCH_MENTIONS * 2 + 1)
+        with mock.patch.object(carlbot, 'WELCOME_MESSAGE_CHARS', 100000):
+            messages = self.pipeline._render_welcomes('Hi {user}', GUILD, joined)
+        self.assertEqual([message.count('<@') for message in messages],
+                         [carlbot.WELCOME_BATCH_MENTIONS, carlbot.WELCOME_BATCH_MENTIONS, 1])
+
+    def test_batches_are_split_by_length_without_losing_anyone(self):
+        joined = members(carlbot.WELCOME_BATCH_MENTIONS)
+        messages = self.render('Welcome {user}! ' + 'x' * 1500 + ' {user}', joined)
+        self.assertGreater(len(messages), 1)
+        mentioned = [mention for message in messages for mention in message.split('Welcome ', 1)[1]
+                     .split('!', 1)[0].split(', ')]
+        self.assertEqual(mentioned, [member.mention for member in joined])
+
+    def test_a_template_too_long_for_one_mention_is_cut(self):
+        messages = self.render('x' * 2500 + ' {user}', members(2))
+        self.assertEqual([len(message) for message in messages], [carlbot.WELCOME_MESSAGE_CHARS] * 2)
+
+
+class OverflowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pipeline = carlbot.JoinPipeline()
+        self.pipeline.queue = asyncio.Queue(1)
+        self.log_sink = mock.Mock()
+        config = mock.Mock(log_channel=1)
+        patches = (
+            mock.patch.object(carlbot, 'JOIN_OVERFLOW_MAX', 2),
+            mock.patch.object(carlbot, 'log_sink', self.log_sink),
+            mock.patch.object(carlbot, 'guild_configs', mock.Mock(load=lambda guild_id: config)),
+            mock.patch('builtins.print'),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def join(self, guild_id, count):
+        guild = mock.Mock(id=guild_id)
+        for member in members(count):
+            member.guild = guild
+            self.pipeline.put(member)
+
+    def test_joins_wait_in_the_overflow_then_are_dropped_and_logged(self):
+        self.join(1, 3)
+        self.assertEqual((self.pipeline.queue.qsize(), self.pipeline.deferred), (1, 2))
+        self.join(1, 2)
+        self.join(2, 1)
+        self.assertEqual(self.pipeline.dropped, 3)
+        self.assertEqual(self.pipeline.guild_drops, {1: 2, 2: 1})
+        self.assertEqual([call.args[0].id for call in self.log_sink.push.call_args_list], [1, 1, 2])
+
+    def test_the_overflow_refills_the_queue_guild_by_guild(self):
+        self.join(1, 2)
+        self.join(2, 1)
+        self.pipeline.queue.get_nowait()
+        self.pipeline._refill()
+        self.assertEqual(self.pipeline.queue.get_nowait().guild.id, 1)
+        self.pipeline._refill()
+        self.assertEqual(self.pipeline.queue.get_nowait().guild.id, 2)
+        self.assertEqual((self.pipeline.deferred, self.pipeline.overflow), (0, {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
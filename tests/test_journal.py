@@ -0,0 +1,130 @@
+"""Journal records, their CRC checks, and replay on top of the snapshot.
+
+Run from the repository root:
+
+    python -m unittest tests.test_journal
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+
+def write_segment(journal_dir, name, records):
+    path = os.path.join(journal_dir, name)
+    with open(path, 'wb') as f:
+        f.write(b''.join(records))
+    return path
+
+
+class ReadJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.records = [
+            carlbot.encode_journal_record(1, 'ticket_categories', (10,), '11'),
+            carlbot.encode_journal_record(2, 'user_xp', (10, 20), '{"xp":5,"level":1}'),
+            carlbot.encode_journal_record(3, 'warnings', (10, 20, 30), None),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        path = write_segment(self.dir, 'a.log', self.records)
+        self.assertEqual(list(carlbot.read_journal(path)), [
+            (1, 'ticket_categories', (10,), b'11'),
+            (2, 'user_xp', (10, 20), b'{"xp":5,"level":1}'),
+            (3, 'warnings', (10, 20, 30), None),
+        ])
+
+    def test_torn_tail_is_dropped(self):
+        for cut in (1, len(self.records[2]) - carlbot.JOURNAL_HEADER.size, len(self.records[2]) - 1):
+            with self.subTest(cut=cut):
+                path = write_segment(self.dir, 'a.log', self.records[:2] + [self.records[2][:cut]])
+                self.assertEqual([seq for seq, *_ in carlbot.read_journal(path)], [1, 2])
+
+    def test_reading_stops_at_a_crc_mismatch(self):
+        corrupt = bytearray(self.records[1])
+        corrupt[-1] ^= 0xff
+        path = write_segment(self.dir, 'a.log', [self.records[0], bytes(corrupt), self.records[2]])
+        # Nothing after a bad record was acknowledged, so it is not replayed either
+        self.assertEqual([seq for seq, *_ in carlbot.read_journal(path)], [1])
+
+
+class ReplayTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.backend = carlbot.MemoryBackend()
+        carlbot.ticket_categories.clear()
+
+    def tearDown(self):
+        carlbot.ticket_categories.clear()
+        shutil.rmtree(self.dir)
+
+    def load(self):
+        storage = carlbot.Storage(self.backend, self.dir)
+        return storage, storage.load()
+
+    def test_only_records_after_the_checkpoint_are_replayed(self):
+        self.backend.write([('ticket_categories', '1', '100')], [], {carlbot.CHECKPOINT_META: 2}, [])
+        write_segment(self.dir, f'{1:020d}-0.log', [
+            carlbot.encode_journal_record(seq, 'ticket_categories', (seq,), str(seq * 100))
+            for seq in range(1, 5)
+        ])
+        _, (loaded, replayed) = self.load()
+        self.assertEqual((loaded, replayed), (1, 2))
+        self.assertEqual(carlbot.ticket_categories, {1: 100, 3: 300, 4: 400})
+
+    def test_lazy_records_wait_until_their_entry_is_read(self):
+        write_segment(self.dir, f'{1:020d}-0.log', [
+            carlbot.encode_journal_record(1, 'user_xp', (10, 20), '{"xp":5,"level":1}'),
+        ])
+        storage, _ = self.load()
+        self.assertEqual(storage._evicted, {('user_xp', (10, 20)): '{"xp":5,"level":1}'})
+
+    async def test_writes_after_a_torn_tail_survive_the_next_restart(self):
+        record = carlbot.encode_journal_record(2, 'ticket_categories', (2,), '200')
+        write_segment(self.dir, f'{1:020d}-0.log', [
+            carlbot.encode_journal_record(1, 'ticket_categories', (1,), '100'), record[:-3]
+        ])
+        storage, (_, replayed) = self.load()
+        self.assertEqual(replayed, 1)
+
+        carlbot.ticket_categories[3] = 300
+        storage.mark_dirty('ticket_categories', (3,))
+        await storage.flush_journal()
+
+        carlbot.ticket_categories.clear()
+        _, (_, replayed) = self.load()
+        self.assertEqual(replayed, 2)
+        self.assertEqual(carlbot.ticket_categories, {1: 100, 3: 300})
+
+    async def test_a_released_guild_keeps_its_unsaved_changes(self):
+        self.addCleanup(carlbot.user_xp.clear)
+        self.backend.write([('user_xp', '10:21', '{"xp":1,"level":0}')], [], {}, [])
+        write_segment(self.dir, f'{1:020d}-0.log', [
+            carlbot.encode_journal_record(1, 'user_xp', (10, 20), '{"xp":5,"level":1}'),
+        ])
+        storage, _ = self.load()
+        await storage.load_guild_async(10)
+        self.assertEqual(set(carlbot.user_xp[10]), {20, 21})
+
+        storage.release_guild(10)
+        self.assertNotIn(10, carlbot.user_xp)
+        await storage.load_guild_async(10)
+        self.assertEqual(carlbot.user_xp[10][20].xp, 5)
+
+        storage.release_guild(10)
+        await storage.checkpoint()
+        self.assertEqual(self.backend.get_many('user_xp', ['10:20']), [('{"xp":5,"level":1}', 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""LogSink packing queued events into messages within Discord's embed limits.
+
+Run from the repository root:
+
+    python -m unittest tests.test_log_sink
+"""
+import datetime
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+START = datetime.datetime(2024, 1, 1)
+
+
+def queue_of(texts):
+    queue = carlbot.LogQueue()
+    for n, text in enumerate(texts):
+        queue.events.append((START + datetime.timedelta(seconds=n), text))
+        queue.chars += len(text) + len(carlbot.LOG_SEPARATOR)
+    return queue
+
+
+class PackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sink = carlbot.LogSink()
+
+    def pack_all(self, queue):
+        messages = []
+        while queue.events:
+            count, embeds = self.sink._pack(queue)
+            self.assertGreater(count, 0)
+            messages.append((count, embeds))
+        self.assertEqual(queue.chars, 0)
+        return messages
+
+    def check_limits(self, embeds):
+        self.assertLessEqual(len(embeds), carlbot.LOG_MESSAGE_EMBEDS)
+        self.assertLessEqual(sum(len(embed.description) for embed in embeds), carlbot.LOG_MESSAGE_CHARS)
+        for embed in embeds:
+            self.assertLessEqual(len(embed.description), carlbot.LOG_EMBED_CHARS)
+
+    def test_small_events_share_one_embed(self):
+        count, embeds = self.sink._pack(queue_of(['one', 'two', 'three']))
+        self.assertEqual(count, 3)
+        self.assertEqual([embed.description for embed in embeds], ['one\n\ntwo\n\nthree'])
+        self.assertEqual(embeds[0].timestamp.replace(tzinfo=None), START)
+
+    def test_events_are_sent_in_order_within_the_limits(self):
+        texts = [f'{n:04d}' + 'x' * (50 * (n % 40)) for n in range(300)]
+        messages = self.pack_all(queue_of(texts))
+        self.assertGreater(len(messages), 1)
+        sent = []
+        for count, embeds in messages:
+            self.check_limits(embeds)
+            lines = [line for embed in embeds for line in embed.description.split(carlbot.LOG_SEPARATOR)]
+            self.assertEqual(len(lines), count)
+            sent.extend(lines)
+        self.assertEqual(sent, texts)
+
+    def test_an_event_of_the_full_embed_length_goes_alone(self):
+        texts = ['a' * carlbot.LOG_EMBED_CHARS, 'b' * carlbot.LOG_EMBED_CHARS, 'c']
+        messages = self.pack_all(queue_of(texts))
+        self.assertEqual([count for count, _ in messages], [1, 2])
+        for _, embeds in messages:
+            self.check_limits(embeds)
+
+    def test_a_message_holds_at_most_the_embed_limit(self):
+        with mock.patch.object(carlbot, 'LOG_EMBED_CHARS', 10), \
+                mock.patch.object(carlbot, 'LOG_MESSAGE_CHARS', 100000):
+            messages = self.pack_all(queue_of(['12345678'] * 25))
+            self.assertEqual([len(embeds) for _, embeds in messages], [10, 10, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""MuteScheduler expiry, retries of failed unmutes, and giving up.
+
+Run from the repository root:
+
+    python -m unittest tests.test_mute_scheduler
+"""
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+GUILD_ID = 1
+USER_ID = 2
+ROLE_ID = 3
+
+
+class FakeGuild:
+    """A guild whose member holds the mute role"""
+
+    id = GUILD_ID
+
+    def __init__(self):
+        self.member = mock.Mock(id=USER_ID)
+        self.role = mock.Mock(id=ROLE_ID)
+
+    def get_member(self, user_id):
+        return self.member if user_id == USER_ID else None
+
+    def get_role(self, role_id):
+        return self.role if role_id == ROLE_ID else None
+
+
+class MuteRetryTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.guild = FakeGuild()
+        self.rest_call = mock.AsyncMock()
+        self.log_action = mock.AsyncMock()
+        patches = (
+            mock.patch.object(carlbot, 'bot', mock.Mock(get_guild=lambda guild_id: self.guild)),
+            mock.patch.object(carlbot, 'rest', mock.Mock(call=self.rest_call)),
+            mock.patch.object(carlbot, 'log_action', self.log_action),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.scheduler = carlbot.MuteScheduler()
+        self.scheduler.schedule(GUILD_ID, USER_ID, ROLE_ID, time.time() - 1)
+        self.record = self.scheduler.get(GUILD_ID, USER_ID)
+
+    async def test_expiry_removes_the_role_and_the_record(self):
+        await self.scheduler._expire(GUILD_ID, USER_ID, self.record)
+        self.rest_call.assert_awaited_once()
+        self.assertIsNone(self.scheduler.get(GUILD_ID, USER_ID))
+        self.assertNotIn((GUILD_ID, USER_ID), self.scheduler._retries)
+
+    async def test_failed_unmute_is_retried_with_backoff(self):
+        self.rest_call.side_effect = RuntimeError("503")
+        start = time.time()
+        await self.scheduler._expire(GUILD_ID, USER_ID, self.record)
+        attempts, first_retry = self.scheduler._retries[(GUILD_ID, USER_ID)]
+        self.assertEqual(attempts, 1)
+        self.assertGreaterEqual(first_retry, start + carlbot.MUTE_RETRY_DELAY)
+        self.assertIn((first_retry, GUILD_ID, USER_ID), self.scheduler._heap)
+        # The record stays until the role is actually off
+        self.assertIs(self.scheduler.get(GUILD_ID, USER_ID), self.record)
+
+        start = time.time()
+        await self.scheduler._expire(GUILD_ID, USER_ID, self.record)
+        attempts, second_retry = self.scheduler._retries[(GUILD_ID, USER_ID)]
+        self.assertEqual(attempts, 2)
+        self.assertGreaterEqual(second_retry, start + 2 * carlbot.MUTE_RETRY_DELAY)
+        self.log_action.assert_not_awaited()
+
+    async def test_success_after_a_retry_clears_it(self):
+        self.rest_call.side_effect = [RuntimeError("503"), None]
+        await self.scheduler._expire(GUILD_ID, USER_ID, self.record)
+        await self.scheduler._expire(GUILD_ID, USER_ID, self.record)
+        self.assertIsNone(self.scheduler.get(GUILD_ID, USER_ID))
+        self.assertNotIn((GUILD_ID, USER_ID), self.scheduler._retries)
+
+    async def test_gives_up_after_the_last_attempt(self):
+        self.rest_call.side_effect = RuntimeError("403")
+        for _ in range(carlbot.MUTE_EXPIRE_ATTEMPTS):
+            await self.scheduler._expire(GUILD_ID, USER_ID, self.record)
+        self.assertEqual(self.rest_call.await_count, carlbot.MUTE_EXPIRE_ATTEMPTS)
+        self.assertIsNone(self.scheduler.get(GUILD_ID, USER_ID))
+        self.assertNotIn((GUILD_ID, USER_ID), self.scheduler._retries)
+        self.log_action.assert_awaited_once()
+        self.assertIn("Could not automatically unmute", self.log_action.await_args.args[1])
+
+    async def test_a_replaced_mute_is_not_retried(self):
+        async def remute(*args, **kwargs):
+            self.scheduler.schedule(GUILD_ID, USER_ID, ROLE_ID)
+            raise RuntimeError("503")
+        self.rest_call.side_effect = remute
+        await self.scheduler._expire(GUILD_ID, USER_ID, self.record)
+        self.assertNotIn((GUILD_ID, USER_ID), self.scheduler._retries)
+        self.assertIsNone(self.scheduler.get(GUILD_ID, USER_ID).expires_at)
+
+    async def test_a_guild_held_elsewhere_keeps_its_record(self):
+        self.guild = None
+        mark_dirty = mock.Mock()
+        with mock.patch.object(carlbot, 'mark_dirty', mark_dirty):
+            await self.scheduler._expire(GUILD_ID, USER_ID, self.record)
+        self.rest_call.assert_not_awaited()
+        self.assertIs(self.scheduler.get(GUILD_ID, USER_ID), self.record)
+        mark_dirty.assert_not_called()
+
+    def test_only_held_guilds_are_scheduled(self):
+        self.scheduler.schedule(GUILD_ID + 1, USER_ID, ROLE_ID, time.time() + 60)
+        with mock.patch.object(carlbot.bot, 'get_guild', lambda guild_id: self.guild if guild_id == GUILD_ID else None):
+            self.scheduler._rebuild()
+        self.assertEqual([guild_id for _, guild_id, _ in self.scheduler._heap], [GUILD_ID])
+
+
+if __name__ == '__main__':
+    unittest.main()
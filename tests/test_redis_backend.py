@@ -0,0 +1,187 @@
+"""RedisBackend against a minimal in-process stand-in for a Redis protocol server.
+
+Run from the repository root:
+
+    python -m unittest tests.test_redis_backend
+"""
+import os
+import socketserver
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """Just enough of the Redis hash and set commands for RedisBackend"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RespHandler)
+        self.hashes = {}
+        self.sets = {}
+        self.lock = threading.Lock()
+
+    def run(self, command):
+        name, args = command[0].upper(), command[1:]
+        with self.lock:
+            if name in (b'AUTH', b'SELECT'):
+                return 'OK'
+            if name in (b'SADD', b'SREM', b'SMEMBERS') and args:
+                members = self.sets.setdefault(args[0], set())
+                if name == b'SADD':
+                    added = len(set(args[1:]) - members)
+                    members.update(args[1:])
+                    return added
+                if name == b'SREM':
+                    removed = len(members & set(args[1:]))
+                    members.difference_update(args[1:])
+                    return removed
+                return sorted(members)
+            if not name.startswith(b'H') or not args:
+                return carlbot.RespError(f"ERR unknown command {name.decode()}")
+            table = self.hashes.setdefault(args[0], {})
+            if name == b'HSET':
+                added = 0
+                for field, value in zip(args[1::2], args[2::2]):
+                    added += field not in table
+                    table[field] = value
+                return added
+            if name == b'HGET':
+                return table.get(args[1])
+            if name == b'HMGET':
+                return [table.get(field) for field in args[1:]]
+            if name == b'HDEL':
+                return sum(table.pop(field, None) is not None for field in args[1:])
+            if name == b'HINCRBY':
+                value = int(table.get(args[1], b'0')) + int(args[2])
+                table[args[1]] = str(value).encode()
+                return value
+            if name == b'HSCAN':
+                fields = [item for pair in table.items() for item in pair]
+                return [b'0', fields]
+        return carlbot.RespError(f"ERR unknown command {name.decode()}")
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        queued = None
+        while True:
+            command = self.read_command()
+            if command is None:
+                return
+            name = command[0].upper()
+            if name == b'MULTI':
+                queued = []
+                reply = 'OK'
+            elif name == b'EXEC':
+                reply = [self.server.run(queued_command) for queued_command in queued]
+                queued = None
+            elif queued is not None:
+                queued.append(command)
+                reply = 'QUEUED'
+            else:
+                reply = self.server.run(command)
+            self.wfile.write(encode_reply(reply))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        command = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            command.append(self.rfile.read(length + 2)[:-2])
+        return command
+
+
+def encode_reply(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, carlbot.RespError):
+        return b'-%s\r\n' % str(reply).encode()
+    if isinstance(reply, str):
+        return b'+%s\r\n' % reply.encode()
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    return b'*%d\r\n' % len(reply) + b''.join(map(encode_reply, reply))
+
+
+class RedisBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = RespStandIn()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.backend = carlbot.RedisBackend(
+            carlbot.RespConnection(host, port), reader=carlbot.RespConnection(host, port)
+        )
+
+    def tearDown(self):
+        self.backend.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_write_then_read(self):
+        self.backend.write(
+            [('guild_configs', '1', '{"prefix":"?"}'), ('user_xp', '1:2', '{"xp":5,"level":1}')],
+            [], {carlbot.CHECKPOINT_META: 7}, [('guild_configs', '1')]
+        )
+        self.assertEqual(self.backend.get_many('guild_configs', ['1', '2']), [('{"prefix":"?"}', 1), (None, 0)])
+        self.assertEqual(self.backend.get_meta(carlbot.CHECKPOINT_META), 7)
+        self.assertEqual(self.backend.scan(carlbot.CACHED_NAMESPACES), [('user_xp', '1:2', '{"xp":5,"level":1}')])
+
+        self.backend.write([], [('user_xp', '1:2')], {}, [])
+        self.assertEqual(self.backend.scan(carlbot.CACHED_NAMESPACES), [])
+
+    def test_scan_guild_reads_one_guilds_member_data(self):
+        self.backend.write(
+            [('user_xp', '1:2', '{"xp":5}'), ('user_xp', '10:2', '{"xp":6}'),
+             ('warnings', '1:2:3', '{"reason":"a"}'), ('guild_configs', '1', '{}')],
+            [], {}, []
+        )
+        self.backend.write([], [('user_xp', '1:2')], {}, [])
+        self.assertEqual(self.backend.scan_guild(['user_xp', 'warnings'], 1), [('warnings', '1:2:3', '{"reason":"a"}')])
+        self.assertEqual(self.backend.scan_guild(['user_xp'], 10), [('user_xp', '10:2', '{"xp":6}')])
+
+    def test_write_returns_bumped_versions(self):
+        bump = [('guild_configs', '1'), ('automod_configs', '1')]
+        upserts = [(namespace, key, '{}') for namespace, key in bump]
+        self.assertEqual(self.backend.write(upserts, [], {}, bump), {entry: 1 for entry in bump})
+        self.assertEqual(self.backend.write(upserts[:1], [], {}, bump[:1]), {bump[0]: 2})
+        self.assertEqual(self.backend.versions('guild_configs', ['1', '2']), [2, 0])
+        self.assertEqual(self.backend.namespace_version('guild_configs'), 2)
+
+    def test_processes_allocate_disjoint_ids(self):
+        host, port = self.server.server_address
+        other = carlbot.RedisBackend(carlbot.RespConnection(host, port))
+        self.addCleanup(other.close)
+        self.assertEqual(self.backend.allocate(carlbot.REMINDER_ID_META, 100), 100)
+        self.assertEqual(other.allocate(carlbot.REMINDER_ID_META, 100), 200)
+        self.assertEqual(self.backend.allocate(carlbot.REMINDER_ID_META, 0), 200)
+
+    def test_reads_do_not_wait_for_writes(self):
+        self.backend.write([('guild_configs', '1', '{}')], [], {}, [])
+        # A checkpoint holds the write connection for its whole pipeline
+        with self.backend.connection._lock:
+            result = []
+            reader = threading.Thread(target=lambda: result.append(self.backend.get_many('guild_configs', ['1'])))
+            reader.start()
+            reader.join(2)
+            self.assertEqual(result, [[('{}', 0)]])
+
+    def test_error_reply_raises(self):
+        with self.assertRaises(carlbot.RespError):
+            self.backend.connection.execute(('PING',))
+
+
+if __name__ == '__main__':
+    unittest.main()
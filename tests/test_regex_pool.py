@@ -0,0 +1,43 @@
+"""RegexWorkerPool evaluating patterns, killing a runaway one and recovering.
+
+Run from the repository root:
+
+    python -m unittest tests.test_regex_pool
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+CONTENT = 'free nitro ' + 'a' * 40 + '!'
+RUNAWAY = r'(a+)+$'
+
+
+class RegexWorkerPoolTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.pool = carlbot.RegexWorkerPool()
+        self.addCleanup(self.pool.shutdown)
+
+    async def test_a_runaway_pattern_does_not_break_later_ones(self):
+        self.assertTrue(await self.pool.search(r'free\s+nitro', CONTENT))
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.pool.search(RUNAWAY, CONTENT)
+        self.assertTrue(await self.pool.search(r'free\s+nitro', CONTENT))
+        self.assertFalse(await self.pool.search(r'discord\.gg', CONTENT))
+
+    async def test_start_up_does_not_count_against_the_budget(self):
+        # A cold pool takes far longer than this budget to start its workers
+        self.assertTrue(await self.pool.search(r'nitro', CONTENT, budget=0.05))
+
+    async def test_only_the_runaway_pattern_of_a_batch_times_out(self):
+        results = await self.pool.search_many((r'free', RUNAWAY, r'absent'), CONTENT)
+        self.assertEqual(results, [True, None, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""RestScheduler lane priority, per-route serialization and parking rate limited routes,
+and command replies going through it.
+
+Run from the repository root:
+
+    python -m unittest tests.test_rest_scheduler
+"""
+import asyncio
+import os
+import sys
+import unittest
+from unittest import mock
+
+import discord
+from discord.ext import commands
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+
+class RestSchedulerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        patch = mock.patch.object(carlbot, 'bot', mock.Mock(loop=asyncio.get_running_loop()))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.rest = carlbot.RestScheduler()
+        self.started = []
+
+    async def asyncTearDown(self):
+        if self.rest._task is not None:
+            self.rest._task.cancel()
+
+    def job(self, name, gate=None, result=None):
+        async def run():
+            self.started.append(name)
+            if gate is not None:
+                await gate.wait()
+            return result if result is not None else name
+        return run
+
+    def submit(self, lane, route, func):
+        return asyncio.ensure_future(self.rest.call(lane, route, func))
+
+    async def test_higher_lanes_go_first(self):
+        calls = [
+            self.submit(carlbot.LANE_USER, ('send', 1), self.job('user')),
+            self.submit(carlbot.LANE_LOG, ('send', 2), self.job('log')),
+            self.submit(carlbot.LANE_MODERATION, ('members', 3), self.job('moderation')),
+            self.submit(carlbot.LANE_AUTOMOD, ('delete', 4), self.job('automod')),
+        ]
+        await asyncio.sleep(0)
+        self.assertEqual(self.rest.queued, [1, 1, 1, 1])
+        self.rest.start()
+        self.assertEqual(await asyncio.gather(*calls), ['user', 'log', 'moderation', 'automod'])
+        self.assertEqual(self.started, ['moderation', 'automod', 'log', 'user'])
+        self.assertEqual((self.rest.queued, self.rest.completed), ([0] * 4, [1] * 4))
+        self.assertEqual(self.rest.routes, {})
+
+    async def test_a_route_runs_one_call_at_a_time(self):
+        self.rest.start()
+        gate = asyncio.Event()
+        first = self.submit(carlbot.LANE_USER, ('send', 1), self.job('first', gate))
+        while not self.started:
+            await asyncio.sleep(0)
+        # A higher lane doesn't let a call overtake one already running on its route
+        second = self.submit(carlbot.LANE_MODERATION, ('send', 1), self.job('second'))
+        other = self.submit(carlbot.LANE_USER, ('send', 2), self.job('other'))
+        await other
+        self.assertEqual(self.started, ['first', 'other'])
+        self.assertFalse(second.done())
+        gate.set()
+        await asyncio.gather(first, second)
+        self.assertEqual(self.started, ['first', 'other', 'second'])
+
+    async def test_a_rate_limited_route_is_parked_and_retried(self):
+        self.rest.start()
+        attempts = []
+
+        async def limited():
+            attempts.append(asyncio.get_running_loop().time())
+            if len(attempts) == 1:
+                raise discord.RateLimited(0.05)
+            return 'sent'
+
+        parked = self.submit(carlbot.LANE_MODERATION, ('send', 1), limited)
+        await asyncio.sleep(0.01)
+        self.assertEqual(await self.submit(carlbot.LANE_USER, ('send', 2), self.job('other')), 'other')
+        self.assertFalse(parked.done())
+        self.assertEqual(await parked, 'sent')
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.04)
+        self.assertEqual(self.rest.rate_limited, 1)
+
+    async def test_errors_reach_the_caller(self):
+        self.rest.start()
+
+        async def failing():
+            raise discord.HTTPException(mock.Mock(status=403, reason='Forbidden'), 'Missing Access')
+
+        with self.assertRaises(discord.HTTPException):
+            await self.rest.call(carlbot.LANE_USER, ('send', 1), failing)
+        self.assertEqual(await self.rest.call(carlbot.LANE_USER, ('send', 1), self.job('next')), 'next')
+
+
+class ScheduledContextTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.rest_call = mock.AsyncMock()
+        patches = (
+            mock.patch.object(carlbot, 'rest', mock.Mock(call=self.rest_call)),
+            mock.patch.object(carlbot.bot._connection, 'user', mock.Mock(id=0), create=True),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def reply(self, content):
+        message = mock.Mock(content=content, guild=None, author=mock.Mock(id=1, bot=False))
+        message.channel.id = 5
+        ctx = await carlbot.bot.get_context(message)
+        self.assertIsInstance(ctx, carlbot.ScheduledContext)
+        await ctx.send('done')
+        lane, route = self.rest_call.await_args.args[:2]
+        return lane, route
+
+    async def test_moderation_replies_use_the_moderation_lane(self):
+        self.assertEqual(await self.reply('!kick someone'), (carlbot.LANE_MODERATION, ('send', 5)))
+
+    async def test_other_replies_use_the_user_lane(self):
+        self.assertEqual(await self.reply('!8ball will it work'), (carlbot.LANE_USER, ('send', 5)))
+
+    async def test_an_explicit_context_class_is_kept(self):
+        message = mock.Mock(content='!ping', guild=None, author=mock.Mock(id=1, bot=False))
+        ctx = await carlbot.bot.get_context(message, cls=commands.Context)
+        self.assertNotIsInstance(ctx, carlbot.ScheduledContext)
+
+
+if __name__ == '__main__':
+    unittest.main()
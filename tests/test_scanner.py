@@ -0,0 +1,49 @@
+"""scan_message picking invites, links and emojis out of message content.
+
+Run from the repository root:
+
+    python -m unittest tests.test_scanner
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+
+class ScanMessageTest(unittest.TestCase):
+
+    def test_invites(self):
+        cases = {
+            'join discord.gg/abc now': ['discord.gg/abc'],
+            'JOIN Discord.GG/Abc': ['discord.gg/abc'],
+            '(discordapp.com/invite/abc)': ['discordapp.com/invite/abc'],
+            'https://discord.com/invite/abc': ['https://discord.com/invite/abc'],
+            'xdiscord.gg/abc': [],
+            'my-discord.gg/abc': [],
+            'https://xdiscord.gg/abc': [],
+        }
+        for content, invites in cases.items():
+            with self.subTest(content=content):
+                self.assertEqual(list(carlbot.scan_message(content).invites), invites)
+
+    def test_links(self):
+        scan = carlbot.scan_message('see HTTPS://example.com/a and http://b.example')
+        self.assertEqual(scan.urls, ['https://example.com/a', 'http://b.example'])
+        self.assertEqual(scan.invites, [])
+
+    def test_plain_text_has_no_tokens(self):
+        scan = carlbot.scan_message('just some chat about discord')
+        self.assertEqual((scan.invites, scan.urls, scan.emoji_count), ((), (), 0))
+
+    def test_emojis(self):
+        self.assertEqual(carlbot.scan_message('<:pepe:1><a:wave:2>hi<:pepe:1>').emoji_count, 3)
+        # A flag, a skin-toned emoji and a ZWJ family each count once
+        content = '\U0001F1FA\U0001F1F8 \U0001F44D\U0001F3FD \U0001F468\u200d\U0001F469\u200d\U0001F467'
+        self.assertEqual(carlbot.scan_message(content).emoji_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
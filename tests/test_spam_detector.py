@@ -0,0 +1,62 @@
+"""SpamDetector flagging message rates and evicting idle or excess members.
+
+Run from the repository root:
+
+    python -m unittest tests.test_spam_detector
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+KEY = (1, 2)
+
+
+class SpamDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = carlbot.SpamDetector(idle_timeout=60, max_users=3)
+
+    def hits(self, times, limit=5, window=5, key=KEY):
+        return [self.detector.hit(key, limit, window, now=now) for now in times]
+
+    def test_the_limit_th_message_in_the_window_is_spam(self):
+        self.assertEqual(self.hits([0, 1, 2, 3, 4]), [False] * 4 + [True])
+
+    def test_messages_spread_over_the_window_are_not(self):
+        self.assertEqual(self.hits([0, 1.5, 3, 4.5, 6, 7.5, 9]), [False] * 7)
+
+    def test_a_sustained_flood_keeps_being_spam(self):
+        self.assertEqual(self.hits([n * 0.5 for n in range(10)]), [False] * 4 + [True] * 6)
+
+    def test_a_pause_resets_the_rate(self):
+        self.assertEqual(self.hits([0, 0.1, 0.2, 0.3, 10, 10.1, 10.2, 10.3]), [False] * 8)
+
+    def test_members_are_counted_separately(self):
+        for n in range(4):
+            self.detector.hit((1, n % 2), 3, 5, now=n)
+        self.assertTrue(self.detector.hit((1, 0), 3, 5, now=4))
+
+    def test_a_changed_limit_starts_a_new_ring(self):
+        self.hits([0, 1, 2], limit=5)
+        self.assertEqual(self.hits([3, 4, 5], limit=3), [False, False, True])
+
+    def test_idle_members_are_evicted(self):
+        self.detector.hit((1, 1), 5, 5, now=0)
+        self.detector.hit((1, 2), 5, 5, now=30)
+        self.detector.hit((1, 3), 5, 5, now=61)
+        self.assertEqual(list(self.detector._rings), [(1, 2), (1, 3)])
+
+    def test_members_past_max_users_are_evicted_least_recent_first(self):
+        for n in range(5):
+            self.detector.hit((1, n), 5, 5, now=n)
+        self.detector.hit((1, 2), 5, 5, now=5)
+        self.assertEqual(len(self.detector), 3)
+        self.assertEqual(list(self.detector._rings), [(1, 3), (1, 4), (1, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""TimingWheel firing every entry on exactly its deadline's tick.
+
+Run from the repository root:
+
+    python -m unittest tests.test_timing_wheel
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+# Not aligned to any level, so entries cross slot and level boundaries
+START = 1_000_003
+
+
+def fire_ticks(wheel, until):
+    """Advance one tick at a time and return item -> tick it fired on"""
+    fired = {}
+    for tick in range(wheel.current, until + 1):
+        for item in wheel.advance(tick):
+            fired.setdefault(item, []).append(tick)
+    return fired
+
+
+class TimingWheelTest(unittest.TestCase):
+
+    def test_entries_fire_on_their_exact_tick(self):
+        wheel = carlbot.TimingWheel(START)
+        slots = carlbot.WHEEL_SLOTS
+        deltas = [0, 1, slots - 1, slots, slots + 1, 3 * slots + 7, slots ** 2 - 1, slots ** 2, slots ** 2 + 5]
+        for delta in deltas:
+            wheel.add(START + delta, delta)
+        fired = fire_ticks(wheel, START + max(deltas) + 1)
+        self.assertEqual(fired, {delta: [START + delta] for delta in deltas})
+
+    def test_nothing_fires_before_its_tick(self):
+        wheel = carlbot.TimingWheel(START)
+        wheel.add(START + 100, 'later')
+        self.assertEqual(list(wheel.advance(START + 99)), [])
+        self.assertEqual(list(wheel.advance(START + 100)), ['later'])
+
+    def test_fractional_deadlines_fire_on_their_second(self):
+        wheel = carlbot.TimingWheel(START)
+        wheel.add(START + 10.9, 'item')
+        self.assertEqual(fire_ticks(wheel, START + 11), {'item': [START + 10]})
+
+    def test_past_deadlines_fire_on_the_next_advance(self):
+        wheel = carlbot.TimingWheel(START)
+        wheel.add(START - 30, 'late')
+        self.assertEqual(list(wheel.advance(START)), ['late'])
+
+    def test_entries_added_while_running_keep_their_tick(self):
+        wheel = carlbot.TimingWheel(START)
+        list(wheel.advance(START + 500))
+        now = wheel.current
+        wheel.add(now + carlbot.WHEEL_SLOTS * 2 + 3, 'added')
+        self.assertEqual(fire_ticks(wheel, now + carlbot.WHEEL_SLOTS * 3), {'added': [now + carlbot.WHEEL_SLOTS * 2 + 3]})
+
+    def test_overflow_entries_come_back_on_their_tick(self):
+        # A 4 slot, 2 level wheel so the overflow horizon is only 16 ticks
+        with mock.patch.multiple(carlbot, WHEEL_BITS=2, WHEEL_SLOTS=4, WHEEL_LEVELS=2):
+            wheel = carlbot.TimingWheel(START)
+            deltas = [3, 15, 16, 17, 40, 100]
+            for delta in deltas:
+                wheel.add(START + delta, delta)
+            self.assertEqual(sorted(item for _, item in wheel.overflow), [16, 17, 40, 100])
+            fired = fire_ticks(wheel, START + max(deltas) + 1)
+        self.assertEqual(fired, {delta: [START + delta] for delta in deltas})
+
+
+if __name__ == '__main__':
+    unittest.main()
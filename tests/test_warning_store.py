@@ -0,0 +1,83 @@
+"""WarningStore ids, cursor paging and removal.
+
+Run from the repository root:
+
+    python -m unittest tests.test_warning_store
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+GUILD_ID = 1
+USER_ID = 2
+
+
+def warning(n):
+    return carlbot.WarningRecord(f'reason {n}', 3, 1700000000 + n)
+
+
+class WarningStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = carlbot.WarningStore()
+
+    def add(self, count, user_id=USER_ID):
+        return [self.store.add(GUILD_ID, user_id, warning(n)) for n in range(count)]
+
+    def page_ids(self, before=None, limit=10):
+        return [warning_id for warning_id, _ in self.store.page(GUILD_ID, USER_ID, before, limit)]
+
+    def test_ids_increase_across_members(self):
+        self.assertEqual(self.add(2) + self.add(2, USER_ID + 1), [1, 2, 3, 4])
+        self.assertEqual(self.store.count(GUILD_ID, USER_ID), 2)
+
+    def test_pages_run_newest_first_from_the_cursor(self):
+        self.add(25)
+        pages = []
+        before = None
+        while True:
+            page = self.page_ids(before)
+            if not page:
+                break
+            pages.append(page)
+            before = page[-1]
+        self.assertEqual(pages, [list(range(25, 15, -1)), list(range(15, 5, -1)), [5, 4, 3, 2, 1]])
+        self.assertEqual(self.store.oldest(GUILD_ID, USER_ID), 1)
+
+    def test_a_removed_cursor_still_pages(self):
+        self.add(10)
+        self.assertTrue(self.store.remove(GUILD_ID, USER_ID, 6))
+        self.assertFalse(self.store.remove(GUILD_ID, USER_ID, 6))
+        self.assertEqual(self.page_ids(before=6, limit=3), [5, 4, 3])
+        self.assertEqual(self.page_ids(before=8, limit=3), [7, 5, 4])
+
+    def test_imported_warnings_keep_their_order(self):
+        for warning_id in (7, 3, 5):
+            self.store.put(GUILD_ID, USER_ID, warning_id, warning(warning_id))
+        self.assertEqual(self.page_ids(), [7, 5, 3])
+        self.assertEqual(list(self.store.warnings[GUILD_ID][USER_ID]), [3, 5, 7])
+        self.assertEqual(self.store.add(GUILD_ID, USER_ID, warning(8)), 8)
+
+    def test_clearing_the_last_warnings_prunes_the_member_and_guild(self):
+        self.add(3)
+        self.assertEqual(self.store.clear(GUILD_ID, USER_ID), 3)
+        self.assertEqual(self.page_ids(), [])
+        self.assertIsNone(self.store.oldest(GUILD_ID, USER_ID))
+        self.assertEqual((self.store.warnings, self.store.ids), ({}, {}))
+
+    def test_finish_loading_orders_and_indexes(self):
+        self.store.warnings[GUILD_ID] = {
+            USER_ID: {4: warning(4), 1: warning(1), 2: warning(2)},
+            USER_ID + 1: {},
+        }
+        self.store.finish_loading(GUILD_ID)
+        self.assertEqual(list(self.store.warnings[GUILD_ID]), [USER_ID])
+        self.assertEqual(self.page_ids(limit=2), [4, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""WordFilter finding every filtered word, with and without the regex pre-check.
+
+Run from the repository root:
+
+    python -m unittest tests.test_word_filter
+"""
+import os
+import random
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+
+def brute_force(words, text):
+    return {word for word in words if word and word in text}
+
+
+class WordFilterTest(unittest.TestCase):
+
+    def filters(self, words):
+        """The filter with its regex gate, and one walking the automaton only"""
+        gated = carlbot.WordFilter(words)
+        with mock.patch.object(carlbot, 'WORD_FILTER_GATE_MAX', -1):
+            ungated = carlbot.WordFilter(words)
+        self.assertIsNone(ungated._gate)
+        return gated, ungated
+
+    def test_overlapping_and_nested_words(self):
+        for word_filter in self.filters(['he', 'she', 'his', 'hers']):
+            with self.subTest(gated=word_filter._gate is not None):
+                self.assertEqual(word_filter.find_all('ushers'), ['she', 'he', 'hers'])
+                self.assertEqual(word_filter.find_all('this'), ['his'])
+                self.assertEqual(word_filter.find_all('nothing here'), ['he'])
+                self.assertEqual(word_filter.find_all('abc'), [])
+
+    def test_each_word_is_reported_once(self):
+        for word_filter in self.filters(['spam']):
+            self.assertEqual(word_filter.find_all('spam spam spam'), ['spam'])
+
+    def test_regex_characters_are_literal(self):
+        for word_filter in self.filters(['a.b', '(x)', 'c++']):
+            self.assertEqual(word_filter.find_all('axb (x) c++'), ['(x)', 'c++'])
+
+    def test_empty_lists_and_words(self):
+        for word_filter in self.filters([]) + self.filters(['']):
+            self.assertEqual(word_filter.find_all('anything'), [])
+
+    def test_long_lists_skip_the_gate(self):
+        words = [f'word{n}' for n in range(carlbot.WORD_FILTER_GATE_MAX + 1)]
+        self.assertIsNone(carlbot.WordFilter(words)._gate)
+        self.assertIsNotNone(carlbot.WordFilter(words[:-1])._gate)
+
+    def test_matches_a_substring_search(self):
+        rng = random.Random(5)
+        words = [''.join(rng.choice('abc') for _ in range(rng.randint(1, 5))) for _ in range(40)]
+        texts = [''.join(rng.choice('abcd ') for _ in range(rng.randint(0, 60))) for _ in range(200)]
+        for word_filter in self.filters(words):
+            for text in texts:
+                self.assertEqual(set(word_filter.find_all(text)), brute_force(words, text))
+
+
+if __name__ == '__main__':
+    unittest.main()
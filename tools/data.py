@@ -0,0 +1,33 @@
+"""Export or import the bot's stored data as gzip JSONL, with the bot stopped.
+
+Run from the repository root:
+
+    python tools/data.py export data.jsonl.gz [--guild ID ...]
+    python tools/data.py import data.jsonl.gz
+
+Storage is selected the same way the bot selects it, through CARLBOT_STORAGE,
+CARLBOT_DB and CARLBOT_JOURNAL.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carlbot  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands_parser = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands_parser.add_parser('export', help="write stored data to a .jsonl.gz file")
+    export_parser.add_argument('path')
+    export_parser.add_argument('--guild', type=int, action='append', help="only this guild (repeatable)")
+    import_parser = commands_parser.add_parser('import', help="load a .jsonl.gz export into storage")
+    import_parser.add_argument('path')
+    asyncio.run(carlbot.run_data_command(parser.parse_args(argv)))
+
+
+if __name__ == '__main__':
+    main()